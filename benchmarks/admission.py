@@ -0,0 +1,100 @@
+# A traffic spike above what the LLM can answer, with and without admission control, against the local fake
+# OpenAI server. Requests arrive at a fixed rate and their clients give up after CLIENT_TIMEOUT seconds,
+# while the server keeps answering them. Reports the requests answered in time, answered too late (paid for
+# but thrown away), shed with 503, the LLM calls made, and latencies. E.g. `python admission.py 24 10` for 24
+# requests/sec during 10 s.
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+PORT = 8917
+RATE = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+LATENCY = 0.5
+LLM_CONCURRENCY = 4
+CLIENT_TIMEOUT = 5.0
+
+# rag reads these when it is imported
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+os.environ["COALESCE"] = "0"
+os.environ["LLM_MAX_CONCURRENCY_PER_API"] = str(LLM_CONCURRENCY)
+
+import fake_openai
+from common import load_ground_truth
+
+import rag
+from admission import AdmissionController, AdmissionRejected
+
+
+async def spike(questions, controller):
+    answered = []
+    late = []
+    shed = []
+
+    async def user(question):
+        t0 = perf_counter()
+        try:
+            if controller is None:
+                await rag.rag_async(question, evaluate=False)
+            else:
+                async with controller.admit("spike", timeout=CLIENT_TIMEOUT):
+                    await rag.rag_async(question, evaluate=False)
+        except AdmissionRejected:
+            shed.append(perf_counter() - t0)
+            return
+        latency = perf_counter() - t0
+        (answered if latency <= CLIENT_TIMEOUT else late).append(latency)
+
+    users = []
+    t0 = perf_counter()
+    for i, question in enumerate(questions):
+        await asyncio.sleep(max(0.0, t0 + i / RATE - perf_counter()))
+        users.append(asyncio.ensure_future(user(question)))
+    await asyncio.gather(*users)
+    return perf_counter() - t0, answered, late, shed
+
+
+def percentile(latencies, q):
+    return np.percentile(latencies, q) * 1000 if latencies else 0.0
+
+
+async def main():
+    n = int(RATE * DURATION)
+    questions = [q["question"] for q in load_ground_truth()][:n]
+    print(
+        f"{n} requests at {RATE:.0f}/s, LLM capacity {LLM_CONCURRENCY / LATENCY:.0f}/s "
+        f"({LLM_CONCURRENCY} calls of {LATENCY * 1000:.0f} ms), clients give up after {CLIENT_TIMEOUT:.0f} s"
+    )
+
+    modes = [
+        ("no admission control", None),
+        ("admission control", AdmissionController(max_in_flight=LLM_CONCURRENCY, max_queue=4 * LLM_CONCURRENCY)),
+    ]
+    for name, controller in modes:
+        calls = rag.gateway.stats()["calls"]
+        elapsed, answered, late, shed = await spike(questions, controller)
+        print(
+            f"{name:21s} in time: {len(answered):4d}  late: {len(late):4d}  shed: {len(shed):4d}  "
+            f"LLM calls: {rag.gateway.stats()['calls'] - calls:4d}  drained in: {elapsed:5.1f} s  "
+            f"in time p50: {percentile(answered, 50):5.0f} ms  p99: {percentile(answered, 99):5.0f} ms  "
+            f"shed p99: {percentile(shed, 99):5.0f} ms"
+        )
+        if controller is not None:
+            stats = controller.stats()
+            print(
+                f"{'':21s} shed because the queue was full: {stats['shed_queue_full']}, could not start in time: "
+                f"{stats['shed_deadline']}, mean queue wait: {stats['mean_queue_wait'] * 1000:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    server = fake_openai.start(PORT, LATENCY)
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
@@ -0,0 +1,49 @@
+# Hit rate of the answer cache at several similarity thresholds, replaying the ground truth questions twice:
+# once as written, once rewritten in lower case without punctuation. Similar hits between two different
+# ground truth questions are listed, they show what a threshold would serve in place of an LLM answer.
+import re
+import sys
+
+from common import BOOST, load_documents, load_ground_truth
+
+import ingest
+from cache import AnswerCache
+
+THRESHOLDS = [1.0, 0.95, 0.9, 0.8, 0.7]
+N_EXAMPLES = 3
+
+
+def rewrite(question):
+    return re.sub(r"[^\w\s]", " ", question).lower()
+
+
+def main():
+    thresholds = [float(t) for t in sys.argv[1:]] or THRESHOLDS
+    index = ingest.ENGINES["tfidf"](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(load_documents())
+    ground_truth = load_ground_truth()
+
+    traffic = [q["question"] for q in ground_truth] + [rewrite(q["question"]) for q in ground_truth]
+    doc_ids = [[d["id"] for d in index.search(q, boost_dict=BOOST, num_results=10)] for q in traffic]
+    print(f"{len(traffic)} questions, {len(ground_truth)} distinct")
+
+    for threshold in thresholds:
+        cache = AnswerCache(index, maxsize=len(traffic), threshold=threshold)
+        paraphrase_hits = []
+        for position, (question, ids) in enumerate(zip(traffic, doc_ids)):
+            # The cached "answer" is the position of the question that produced it
+            source, kind = cache.get(question, ids)
+            if source is None:
+                cache.put(question, ids, str(position))
+            elif int(source) % len(ground_truth) != position % len(ground_truth):
+                paraphrase_hits.append((traffic[int(source)], question))
+
+        print(
+            f"threshold {threshold:4.2f}  exact hits: {cache.exact_hits:4d}  similar hits: {cache.similar_hits:4d}  "
+            f"served from another question: {len(paraphrase_hits):4d}  LLM calls: {len(cache.cache):4d}"
+        )
+        for cached, asked in paraphrase_hits[:N_EXAMPLES]:
+            print(f"    {asked!r}\n      <- {cached!r}")
+
+
+if __name__ == "__main__":
+    main()
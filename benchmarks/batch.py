@@ -0,0 +1,52 @@
+# Time to answer a batch of ground-truth questions with rag_batch, at several LLM concurrencies, against
+# the same questions answered one after the other with rag_async (what sequential /question calls do,
+# without HTTP and Postgres), against the local fake OpenAI server
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+PORT = 8914
+N_QUESTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+CONCURRENCIES = [1, 8, 32]
+
+# rag reads these when it is imported
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["SEARCH_CACHE_SIZE"] = "0"
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+import fake_openai
+from common import load_ground_truth
+
+import rag
+
+
+def report(name, elapsed, answered):
+    print(f"{name:28s} {elapsed:6.2f} s  {answered / elapsed:6.1f} questions/sec  answered: {answered}")
+
+
+async def main():
+    questions = [q["question"] for q in load_ground_truth()][:N_QUESTIONS]
+    print(f"{len(questions)} questions, fake LLM latency: {LATENCY * 1000:.0f} ms per call")
+
+    t0 = perf_counter()
+    for question in questions:
+        await rag.rag_async(question, evaluate=False)
+    report("sequential rag_async", perf_counter() - t0, len(questions))
+
+    for concurrency in CONCURRENCIES:
+        t0 = perf_counter()
+        answered = 0
+        async for _, answer_data, error in rag.rag_batch(questions, concurrency=concurrency):
+            answered += error is None
+        report(f"rag_batch concurrency {concurrency}", perf_counter() - t0, answered)
+
+
+if __name__ == "__main__":
+    server = fake_openai.start(PORT, LATENCY)
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
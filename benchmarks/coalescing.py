@@ -0,0 +1,69 @@
+# A burst of users asking the same popular question at once, mixed with distinct questions, with and
+# without single-flight coalescing of rag_async, against the local fake OpenAI server. Reports the LLM
+# calls made, the share of requests coalesced and the latency of the burst.
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+PORT = 8915
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+POPULAR_SHARE = float(sys.argv[2]) if len(sys.argv) > 2 else 0.8
+LATENCY = 0.2
+
+# rag reads these when it is imported
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+import fake_openai
+from common import load_ground_truth
+
+import rag
+from cache import SingleFlight
+
+POPULAR = "What is the pose of the day for a gentle morning stretch?"
+
+
+async def burst(questions):
+    latencies = []
+
+    async def user(question):
+        t0 = perf_counter()
+        await rag.rag_async(question)
+        latencies.append(perf_counter() - t0)
+
+    t0 = perf_counter()
+    await asyncio.gather(*(user(question) for question in questions))
+    return perf_counter() - t0, latencies
+
+
+async def main():
+    distinct = [q["question"] for q in load_ground_truth()]
+    n_popular = int(USERS * POPULAR_SHARE)
+    # The popular question arrives with small variations of case and punctuation
+    popular = [POPULAR if i % 2 else POPULAR.lower().rstrip("?") for i in range(n_popular)]
+    questions = popular + distinct[:USERS - n_popular]
+    print(f"{USERS} concurrent users, {n_popular} asking the popular question, fake LLM latency {LATENCY * 1000:.0f} ms")
+
+    for coalesce in (False, True):
+        rag.COALESCE = coalesce
+        rag.single_flight = SingleFlight()
+        calls = rag.gateway.stats()["calls"]
+        elapsed, latencies = await burst(questions)
+        stats = rag.single_flight.stats()
+        print(
+            f"coalesce {str(coalesce):5s}  LLM calls: {rag.gateway.stats()['calls'] - calls:4d}  "
+            f"coalesced: {stats['coalesced_ratio']:6.1%}  burst: {elapsed:5.2f} s  "
+            f"p50: {np.percentile(latencies, 50) * 1000:5.0f} ms  p99: {np.percentile(latencies, 99) * 1000:5.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    server = fake_openai.start(PORT, LATENCY)
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
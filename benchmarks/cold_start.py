@@ -0,0 +1,71 @@
+# Measure worker cold start (importing app and loading the index, as a starting worker does) and index loading
+# with and without snapshots
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+import pandas as pd
+
+from common import APP_DIR, DATA_PATH, enlarge_catalog, load_documents
+
+import ingest
+
+RUNS = 5
+
+# Importing the app does not load the index, a worker loads it while it starts
+IMPORT_APP = (
+    "from time import perf_counter; t0 = perf_counter(); import app, rag; rag.load(); print(perf_counter() - t0)"
+)
+
+
+def import_time(env):
+    timings = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_APP],
+            cwd=APP_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def load_time(data_path, engine, snapshot_dir):
+    t0 = perf_counter()
+    ingest.load_index(data_path, engine=engine, snapshot_dir=snapshot_dir)
+    return perf_counter() - t0
+
+
+def main():
+    env = dict(
+        os.environ,
+        DATA_PATH=DATA_PATH,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        RUN_TIMEZONE_CHECK="0",
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_dir = os.path.join(tmp, "snapshots")
+
+        refit = import_time(dict(env, INDEX_SNAPSHOT_DIR=""))
+        import_time(dict(env, INDEX_SNAPSHOT_DIR=snapshot_dir))
+        snapshot = import_time(dict(env, INDEX_SNAPSHOT_DIR=snapshot_dir))
+        print(f"import app, refit index   : {refit:.3f} s")
+        print(f"import app, from snapshot : {snapshot:.3f} s")
+        print()
+
+        enlarged_path = os.path.join(tmp, "poses_x100.csv")
+        pd.DataFrame(enlarge_catalog(load_documents(), 100)).to_csv(enlarged_path, index=False)
+
+        for data_path in [DATA_PATH, enlarged_path]:
+            for engine in ingest.ENGINES:
+                refit = load_time(data_path, engine, "")
+                load_time(data_path, engine, snapshot_dir)
+                snapshot = load_time(data_path, engine, snapshot_dir)
+                print(f"{os.path.basename(data_path):16s} {engine:6s} refit: {refit:.3f} s, snapshot: {snapshot:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Shared helpers for the benchmark scripts
+import os
+import random
+import sys
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "yoga-companion")
+DATA_PATH = os.path.join(ROOT, "data", "yoga_poses.csv")
+GROUND_TRUTH_PATH = os.path.join(ROOT, "data", "ground-truth-retrieval.csv")
+
+sys.path.insert(0, APP_DIR)
+
+# Same tuned boost as rag.search
+BOOST = {
+    'pose_name': 1.77295549488741,
+    'type_of_practice': 1.7646875012919119,
+    'variation': 0.39512555991207565,
+    'position': 2.0631444783206327,
+    'difficulty': 1.4963276491573105,
+    'props_required': 0.2392338995716874,
+    'body_focus': 1.0491245848640036,
+    'benefits': 1.7364406525582377,
+    'synonyms': 2.5022067788712308,
+    'instructions': 0.49163944386874336,
+    'context': 2.1715194651138052
+}
+
+
+def load_ground_truth():
+    return pd.read_csv(GROUND_TRUTH_PATH).to_dict(orient="records")
+
+
+def load_documents():
+    return pd.read_csv(DATA_PATH).to_dict(orient="records")
+
+
+def enlarge_catalog(documents, factor, seed=1):
+    # Synthetic catalog: every copy gets a new id and a shuffled subset of the words of each text field
+    rng = random.Random(seed)
+    enlarged = list(documents)
+    for copy in range(1, factor):
+        for doc in documents:
+            new_doc = {}
+            for field, value in doc.items():
+                words = str(value).split()
+                if field != "id" and len(words) > 3:
+                    words = rng.sample(words, k=rng.randint(len(words) // 2, len(words)))
+                new_doc[field] = " ".join(words)
+            new_doc["id"] = f"{doc['id']}-{copy}"
+            enlarged.append(new_doc)
+    return enlarged
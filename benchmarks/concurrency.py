@@ -0,0 +1,72 @@
+# Requests/sec of the blocking rag() and of rag_async() when called from an async handler,
+# at 1, 10 and 100 concurrent users, against the local fake OpenAI server
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+PORT = 8911
+LATENCY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+USERS = [1, 10, 100]
+
+# rag reads these when it is imported
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ["SEARCH_CACHE_SIZE"] = "0"
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+import fake_openai
+from common import load_ground_truth
+
+import rag
+
+
+async def blocking_handler(question):
+    # What /question used to do: a sync call inside an async endpoint
+    return rag.rag(question)
+
+
+async def async_handler(question):
+    return await rag.rag_async(question)
+
+
+async def run(handler, users, questions):
+    latencies = []
+    deadline = perf_counter() + DURATION
+
+    async def user(offset):
+        i = offset
+        while perf_counter() < deadline:
+            t0 = perf_counter()
+            await handler(questions[i % len(questions)])
+            latencies.append(perf_counter() - t0)
+            i += users
+
+    t0 = perf_counter()
+    await asyncio.gather(*(user(offset) for offset in range(users)))
+    elapsed = perf_counter() - t0
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+async def main():
+    questions = [q["question"] for q in load_ground_truth()]
+    print(f"fake LLM latency: {LATENCY * 1000:.0f} ms per call, {DURATION:.0f} s per run")
+
+    for name, handler in [("blocking rag", blocking_handler), ("rag_async", async_handler)]:
+        for users in USERS:
+            rps, p50, p99 = await run(handler, users, questions)
+            print(
+                f"{name:13s} users: {users:3d}  {rps:7.1f} requests/sec  "
+                f"p50: {p50 * 1000:7.0f} ms  p99: {p99 * 1000:7.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    server = fake_openai.start(PORT, LATENCY)
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
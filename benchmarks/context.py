@@ -0,0 +1,64 @@
+# Prompt tokens and ground-truth coverage of the context assembler for several token budgets and score
+# cut-offs, against the full 10-result context. Coverage is the share of questions whose ground-truth
+# document is in the context. With --judge N, the first N questions are also answered and judged with
+# both contexts through the OpenAI API (OPENAI_API_KEY and, optionally, OPENAI_BASE_URL must be set).
+import os
+import sys
+
+import numpy as np
+
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+# rag creates its OpenAI clients on import, only --judge calls the API
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from common import load_ground_truth
+
+import rag
+from context import ContextBuilder
+
+BUDGETS = [0, 1200, 1000, 800]
+RATIOS = [0.0, 0.4, 0.5, 0.6]
+
+
+def main():
+    judge = int(sys.argv[sys.argv.index("--judge") + 1]) if "--judge" in sys.argv else 0
+    ground_truth = load_ground_truth()
+    results = [rag.search(q["question"], output_scores=True) for q in ground_truth]
+    count_tokens = rag.context_builder.count_tokens
+
+    full = [rag.build_prompt(q["question"], [doc for doc, _ in r]) for q, r in zip(ground_truth, results)]
+    full_tokens = np.mean([count_tokens(prompt) for prompt in full])
+    covered = np.mean([q["id"] in {doc["id"] for doc, _ in r} for q, r in zip(ground_truth, results)])
+    print(f"full context         prompt tokens: {full_tokens:6.0f}  documents: 10.0  coverage: {covered:.3f}")
+
+    for budget in BUDGETS:
+        for ratio in RATIOS:
+            builder = ContextBuilder(
+                rag.index, rag.entry_fields, count_tokens=count_tokens, token_budget=budget, min_score_ratio=ratio
+            )
+            tokens, kept, covered = [], [], []
+            for q, r in zip(ground_truth, results):
+                context, stats = builder.assemble(r)
+                tokens.append(count_tokens(rag.prompt_template.format(question=q["question"], context=context).strip()))
+                kept.append(stats["kept"])
+                covered.append(q["id"] in stats["doc_ids"])
+            print(
+                f"budget {budget:5d} ratio {ratio:.1f}  prompt tokens: {np.mean(tokens):6.0f}  "
+                f"documents: {np.mean(kept):4.1f}  coverage: {np.mean(covered):.3f}"
+            )
+
+    if judge:
+        for name, build in [("full", rag.build_prompt), ("budgeted", rag.build_budgeted_prompt)]:
+            relevance, prompt_tokens = [], []
+            for q, r in zip(ground_truth[:judge], results[:judge]):
+                prompt = build(q["question"], [doc for doc, _ in r] if name == "full" else r)
+                answer, tokens = rag.llm(prompt)
+                evaluation, _ = rag.evaluate_relevance(q["question"], answer)
+                relevance.append(evaluation.get("Relevance", "UNKNOWN"))
+                prompt_tokens.append(tokens["prompt_tokens"])
+            counts = {label: relevance.count(label) for label in rag.RELEVANCE_LABELS}
+            print(f"{name:8s} judged: {counts}  prompt tokens (API): {np.mean(prompt_tokens):.0f}")
+
+
+if __name__ == "__main__":
+    main()
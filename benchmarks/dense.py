@@ -0,0 +1,71 @@
+# Hit rate, MRR and latency of sparse, dense and hybrid retrieval against the ground truth
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from common import BOOST, enlarge_catalog, load_documents, load_ground_truth
+
+import ingest
+from dense import reciprocal_rank_fusion
+
+HYBRID_CANDIDATES = 20
+
+
+def evaluate(search, ground_truth):
+    hits = 0
+    reciprocal_ranks = 0.0
+    timings = []
+    for q in ground_truth:
+        t0 = perf_counter()
+        results = search(q["question"])
+        timings.append(perf_counter() - t0)
+        ids = [d["id"] for d in results]
+        if q["id"] in ids:
+            hits += 1
+            reciprocal_ranks += 1 / (ids.index(q["id"]) + 1)
+    n = len(ground_truth)
+    return hits / n, reciprocal_ranks / n, np.percentile(timings, 50) * 1000
+
+
+def modes(documents, n_lists):
+    sparse = ingest.ENGINES["tfidf"](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
+    dense_exact = ingest.build_dense_index(sparse, n_lists=0)
+    dense_ivf = ingest.build_dense_index(sparse, n_lists=n_lists)
+
+    def hybrid(query):
+        rankings = [
+            sparse.search(query, boost_dict=BOOST, num_results=HYBRID_CANDIDATES),
+            dense_exact.search(query, boost_dict=BOOST, num_results=HYBRID_CANDIDATES),
+        ]
+        return reciprocal_rank_fusion(rankings, num_results=10)
+
+    return {
+        "sparse": lambda q: sparse.search(q, boost_dict=BOOST),
+        "dense": lambda q: dense_exact.search(q, boost_dict=BOOST),
+        f"dense-ivf{n_lists}": lambda q: dense_ivf.search(q, boost_dict=BOOST),
+        "hybrid": hybrid,
+    }
+
+
+def main():
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    ground_truth = load_ground_truth()
+    documents = load_documents()
+
+    print("ground truth catalog")
+    for name, search in modes(documents, n_lists=8).items():
+        hit_rate, mrr, p50 = evaluate(search, ground_truth)
+        print(f"{name:14s} hit rate: {hit_rate:.3f}, MRR: {mrr:.3f}, p50: {p50:.2f} ms")
+
+    # On the enlarged catalog the relevant pose has many near-copies, so only latency is meaningful
+    catalog = enlarge_catalog(documents, factor)
+    print()
+    print(f"enlarged catalog, {len(catalog)} documents")
+    for name, search in modes(catalog, n_lists=int(np.sqrt(len(catalog)))).items():
+        _, _, p50 = evaluate(search, ground_truth[:200])
+        print(f"{name:14s} p50: {p50:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Compare the TF-IDF and BM25 engines on quality and on latency as the catalog grows
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from common import BOOST, enlarge_catalog, load_documents, load_ground_truth
+
+import ingest
+
+FACTORS = [1, 100, 1000]
+N_QUERIES = 200
+
+
+def evaluate(index, ground_truth):
+    hits = 0
+    reciprocal_ranks = 0.0
+    for q in ground_truth:
+        ids = [d["id"] for d in index.search(q["question"], boost_dict=BOOST, num_results=10)]
+        if q["id"] in ids:
+            hits += 1
+            reciprocal_ranks += 1 / (ids.index(q["id"]) + 1)
+    return hits / len(ground_truth), reciprocal_ranks / len(ground_truth)
+
+
+def latencies(index, questions):
+    timings = []
+    for question in questions:
+        t0 = perf_counter()
+        index.search(question, boost_dict=BOOST, num_results=10)
+        timings.append(perf_counter() - t0)
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+
+def main():
+    factors = [int(f) for f in sys.argv[1:]] or FACTORS
+    documents = load_documents()
+    ground_truth = load_ground_truth()
+    questions = [q["question"] for q in ground_truth[:N_QUERIES]]
+
+    for engine in ingest.ENGINES:
+        index = ingest.ENGINES[engine](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
+        hit_rate, mrr = evaluate(index, ground_truth)
+        print(f"{engine:6s} hit rate: {hit_rate:.3f}, MRR: {mrr:.3f}")
+
+    print()
+    print(f"{'engine':6s} {'docs':>9s} {'fit s':>8s} {'p50 ms':>8s} {'p99 ms':>8s}")
+    for factor in factors:
+        catalog = enlarge_catalog(documents, factor)
+        for engine in ingest.ENGINES:
+            t0 = perf_counter()
+            index = ingest.ENGINES[engine](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(catalog)
+            fit_time = perf_counter() - t0
+            p50, p99 = latencies(index, questions)
+            print(f"{engine:6s} {len(catalog):9d} {fit_time:8.2f} {p50:8.2f} {p99:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# A local stand-in for the OpenAI chat completions API, so the pipeline can be load tested offline.
+# The first token comes after a fixed latency and every further token after a per-token delay,
+# without blocking, like a remote model would. Non-streaming completions wait for the whole answer.
+# Faults can be injected: random 500/503 errors, 429 beyond a number of concurrent requests, and a
+# share of slow requests for tail latency.
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "0.1"))
+TOKEN_LATENCY = float(os.getenv("FAKE_OPENAI_TOKEN_LATENCY", "0.005"))
+# Share of requests failing with a 500 or 503
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+# Requests beyond this many in flight get a 429 with Retry-After, 0 for no limit
+MAX_CONCURRENCY = int(os.getenv("FAKE_OPENAI_MAX_CONCURRENCY", "0"))
+RETRY_AFTER_MS = int(os.getenv("FAKE_OPENAI_RETRY_AFTER_MS", "200"))
+# Share of requests whose first token takes SLOW_LATENCY instead of LATENCY
+SLOW_RATE = float(os.getenv("FAKE_OPENAI_SLOW_RATE", "0"))
+SLOW_LATENCY = float(os.getenv("FAKE_OPENAI_SLOW_LATENCY", "2.0"))
+
+in_flight = 0
+
+app = FastAPI()
+
+
+def completion_text(prompt):
+    if "expert evaluator" in prompt and "Here are the items for evaluation" in prompt:
+        n_items = len(re.findall(r"^Item \d+$", prompt, flags=re.MULTILINE))
+        return json.dumps([
+            {"id": i, "Relevance": "RELEVANT", "Explanation": "Fake evaluation."} for i in range(1, n_items + 1)
+        ])
+    if "expert evaluator" in prompt:
+        return json.dumps({"Relevance": "RELEVANT", "Explanation": "Fake evaluation."})
+    return "Fake answer: try Mountain Pose and breathe deeply."
+
+
+def usage(prompt, content):
+    prompt_tokens = len(prompt.split())
+    completion_tokens = len(content.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def chunk(model, choices, usage=None):
+    data = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": choices,
+    }
+    if usage is not None:
+        data["usage"] = usage
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def error(status, message, headers=None):
+    return JSONResponse(
+        {"error": {"message": message, "type": "fake_error", "param": None, "code": None}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+def first_token_latency():
+    return SLOW_LATENCY if SLOW_RATE and random.random() < SLOW_RATE else LATENCY
+
+
+async def stream_completion(model, prompt, content, include_usage):
+    global in_flight
+    try:
+        tokens = content.split(" ")
+        await asyncio.sleep(first_token_latency())
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(TOKEN_LATENCY)
+                token = " " + token
+            yield chunk(model, [{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+        yield chunk(model, [{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            yield chunk(model, [], usage(prompt, content))
+        yield "data: [DONE]\n\n"
+    finally:
+        in_flight -= 1
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    global in_flight
+    body = await request.json()
+    prompt = "\n".join(message["content"] for message in body["messages"])
+    content = completion_text(prompt)
+
+    if MAX_CONCURRENCY and in_flight >= MAX_CONCURRENCY:
+        return error(429, "Rate limit reached", {"retry-after-ms": str(RETRY_AFTER_MS)})
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return error(random.choice([500, 503]), "The server had an error while processing your request")
+
+    in_flight += 1
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        return StreamingResponse(
+            stream_completion(body["model"], prompt, content, include_usage),
+            media_type="text/event-stream",
+        )
+
+    try:
+        await asyncio.sleep(first_token_latency() + TOKEN_LATENCY * (len(content.split(" ")) - 1))
+    finally:
+        in_flight -= 1
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": usage(prompt, content),
+    }
+
+
+def start(port=8911, latency=LATENCY, **faults):
+    """
+    Starts the fake server in a subprocess and returns it once it accepts requests.
+
+    Faults are given by the lower-case names of their settings, e.g. error_rate=0.05 or max_concurrency=20.
+    """
+    env = dict(os.environ, FAKE_OPENAI_LATENCY=str(latency))
+    env.update({f"FAKE_OPENAI_{name.upper()}": str(value) for name, value in faults.items()})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_openai:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/docs", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The fake OpenAI server did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    LATENCY = args.latency
+    uvicorn.run(app, port=args.port)
@@ -0,0 +1,86 @@
+# The LLM-free fast path over two sets of questions:
+# * lookups: templated props, difficulty, benefits and instructions questions about every pose and
+#   variation of the catalog. Answered ones are checked against the catalog values.
+# * ground truth: the generated questions, which mostly ask for advice. Every one answered is listed,
+#   since the fast path should leave them to the LLM.
+# Latency is that of the fast path alone, on top of the search it reuses.
+from time import perf_counter
+
+from common import BOOST, load_documents, load_ground_truth
+
+import ingest
+from fastpath import NO_PROPS, NO_PROPS_TEMPLATE, FastPath
+
+LOOKUP_QUESTIONS = {
+    "props_required": ["What props do I need for {pose}?", "Does {pose} require any equipment?"],
+    "difficulty": ["What is the difficulty level of {pose}?", "How difficult is {pose}?"],
+    "benefits": ["What are the benefits of {pose}?"],
+    "instructions": ["How do I do {pose}?", "What are the steps for {pose}?"],
+}
+N_EXAMPLES = 3
+
+
+def lookup_questions(documents):
+    for doc in documents:
+        names = [doc["pose_name"]]
+        if not str(doc["variation"]).startswith("No "):
+            names.append(f"{doc['variation']} {doc['pose_name']}")
+        for field, templates in LOOKUP_QUESTIONS.items():
+            for template in templates:
+                for name in names:
+                    yield template.format(pose=name), field, doc
+
+
+def run(fast_path, index, questions):
+    results = [index.search(q, boost_dict=BOOST, num_results=10, output_scores=True) for q in questions]
+    answers = []
+    t0 = perf_counter()
+    for question, scored in zip(questions, results):
+        answers.append(fast_path.answer(question, scored))
+    took = perf_counter() - t0
+    return answers, took / len(questions)
+
+
+def main():
+    documents = load_documents()
+    index = ingest.ENGINES["tfidf"](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
+    fast_path = FastPath(index)
+
+    # Variations sharing a name and a pose ask the same question, the first one is kept
+    lookups = {}
+    for item in lookup_questions(documents):
+        lookups.setdefault(item[0], item)
+    lookups = list(lookups.values())
+    answers, latency = run(fast_path, index, [question for question, _, _ in lookups])
+    answered = 0
+    wrong = []
+    for (question, field, doc), (answer, answered_field) in zip(lookups, answers):
+        if answer is None:
+            continue
+        answered += 1
+        # A single "Not Required" is worded by its own template, a per-variation list keeps the value
+        expected = [str(doc[field])]
+        if expected[0] == NO_PROPS:
+            expected.append(NO_PROPS_TEMPLATE.split("}")[-1])
+        if answered_field != field or not any(value.lower() in answer.lower() for value in expected):
+            wrong.append((question, answer))
+    print(
+        f"lookups       {len(lookups):5d} questions  answered: {answered / len(lookups):6.1%}  "
+        f"wrong field or value: {len(wrong)}  latency: {latency * 1e6:6.1f} us"
+    )
+    for question, answer in wrong[:N_EXAMPLES]:
+        print(f"    {question!r}\n      -> {answer!r}")
+
+    questions = [q["question"] for q in load_ground_truth()]
+    answers, latency = run(fast_path, index, questions)
+    answered = [(question, answer) for question, (answer, _) in zip(questions, answers) if answer is not None]
+    print(
+        f"ground truth  {len(questions):5d} questions  answered: {len(answered) / len(questions):6.1%}  "
+        f"latency: {latency * 1e6:6.1f} us"
+    )
+    for question, answer in answered:
+        print(f"    {question!r}\n      -> {answer!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Latency of filtered searches on an enlarged catalog, for each engine
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from common import BOOST, enlarge_catalog, load_documents, load_ground_truth
+
+import ingest
+
+FACTOR = 1000
+N_QUERIES = 100
+
+
+def p50(index, questions, filter_dict):
+    timings = []
+    for question in questions:
+        t0 = perf_counter()
+        index.search(question, filter_dict=filter_dict, boost_dict=BOOST, num_results=10)
+        timings.append(perf_counter() - t0)
+    return np.percentile(timings, 50) * 1000
+
+
+def main():
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else FACTOR
+    catalog = enlarge_catalog(load_documents(), factor)
+    questions = [q["question"] for q in load_ground_truth()[:N_QUERIES]]
+
+    filters = {
+        "none": {},
+        "id": {"id": catalog[len(catalog) // 2]["id"]},
+        "difficulty": {"difficulty": "Beginner"},
+        "difficulty+practice": {"difficulty": "Beginner", "type_of_practice": "Yin"},
+    }
+
+    print(f"documents: {len(catalog)}")
+    for engine in ingest.ENGINES:
+        index = ingest.ENGINES[engine](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(catalog)
+        for name, filter_dict in filters.items():
+            print(f"{engine:6s} {name:20s} p50: {p50(index, questions, filter_dict):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# The LLM gateway under load, against the local fake OpenAI server:
+# * overload: a burst of concurrent calls to a server answering 429 beyond 20 requests in flight and
+#   failing 2% of requests with 500/503, with the bare SDK client and with the gateway,
+# * tail latency: 5% of requests take 2 s, 10 users calling one after the other, with the gateway
+#   without and with hedging.
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+os.environ["OPENAI_API_KEY"] = "fake"
+
+import common  # noqa: F401, puts the app on the path
+import fake_openai
+
+from openai import AsyncOpenAI
+
+from gateway import LLMGateway
+
+OVERLOAD_PORT = 8912
+TAIL_PORT = 8913
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+MESSAGES = [{"role": "user", "content": "How do I do Warrior I?"}]
+
+
+async def bare_call(client):
+    return await client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+
+
+async def run(name, call, users=CALLS):
+    latencies = []
+    failures = {}
+
+    async def user(n_calls):
+        for _ in range(n_calls):
+            t0 = perf_counter()
+            try:
+                await call()
+                latencies.append(perf_counter() - t0)
+            except Exception as e:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+
+    t0 = perf_counter()
+    await asyncio.gather(*(user(CALLS // users) for _ in range(users)))
+    elapsed = perf_counter() - t0
+    print(
+        f"{name:24s} ok: {len(latencies):4d}  failed: {failures or 0}  total: {elapsed:5.1f} s  "
+        f"p50: {np.percentile(latencies, 50) * 1000:6.0f} ms  p99: {np.percentile(latencies, 99) * 1000:6.0f} ms"
+    )
+
+
+def gateway(port, **params):
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    return LLMGateway(**params)
+
+
+async def main():
+    print(f"overload: {CALLS} concurrent calls, server limit 20 in flight, 2% errors")
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{OVERLOAD_PORT}/v1"
+    client = AsyncOpenAI()
+    await run("bare SDK client", lambda: bare_call(client))
+    for concurrency in (16, 64):
+        overload_gateway = gateway(OVERLOAD_PORT, max_concurrency_per_api=concurrency, backoff_base=0.1)
+        await run(f"gateway concurrency {concurrency}", lambda: overload_gateway.complete_async(MESSAGES))
+        print(f"    {overload_gateway.stats()}")
+
+    print(f"tail latency: {CALLS} calls by 10 users, 5% take 2 s")
+    for hedge_after in (0, 0.5):
+        tail_gateway = gateway(TAIL_PORT, hedge_after=hedge_after)
+        await run(f"gateway hedge after {hedge_after}", lambda: tail_gateway.complete_async(MESSAGES), users=10)
+        print(f"    {tail_gateway.stats()}")
+
+
+if __name__ == "__main__":
+    servers = [
+        fake_openai.start(OVERLOAD_PORT, 0.2, max_concurrency=20, error_rate=0.02),
+        fake_openai.start(TAIL_PORT, 0.2, slow_rate=0.05, slow_latency=2.0),
+    ]
+    try:
+        asyncio.run(main())
+    finally:
+        for server in servers:
+            server.terminate()
@@ -0,0 +1,36 @@
+# Time catalog edits on a fitted index against refitting it from scratch
+import sys
+from time import perf_counter
+
+from common import enlarge_catalog, load_documents
+
+import ingest
+import minsearch
+
+FACTOR = 100
+
+
+def timed(fn):
+    t0 = perf_counter()
+    fn()
+    return (perf_counter() - t0) * 1000
+
+
+def main():
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else FACTOR
+    catalog = enlarge_catalog(load_documents(), factor)
+    new_doc = dict(catalog[0], id="new-pose", pose_name="Flying Heron Pose")
+    changed_doc = dict(catalog[1], benefits="Opens the hips and calms the mind")
+
+    index = minsearch.Index(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS)
+    print(f"documents: {len(catalog)}")
+    print(f"fit     : {timed(lambda: index.fit(catalog)):9.2f} ms")
+    print(f"add     : {timed(lambda: index.add([new_doc])):9.2f} ms")
+    print(f"update  : {timed(lambda: index.update(changed_doc['id'], changed_doc)):9.2f} ms")
+    print(f"delete  : {timed(lambda: index.delete(catalog[2]['id'])):9.2f} ms")
+    print(f"refresh : {timed(index.refresh):9.2f} ms")
+    print(f"compact : {timed(index.compact):9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
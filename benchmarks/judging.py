@@ -0,0 +1,85 @@
+# Throughput and tokens per judgement of the background LLM judge, one conversation per call
+# against micro-batches, with the local fake OpenAI server standing in for the model
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+PORT = 8914
+N_CONVERSATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+BATCH_SIZES = [1, 5, 10, 20]
+WORKERS = 2
+
+# rag reads these when it is imported
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["OPENAI_API_KEY"] = "fake"
+
+import fake_openai
+from common import load_documents, load_ground_truth
+
+import judge
+import rag
+
+
+def conversations():
+    documents = {doc["id"]: doc for doc in load_documents()}
+    ground_truth = load_ground_truth()[:N_CONVERSATIONS]
+    # A plausible answer for every question: the instructions of the pose it is about
+    return [
+        (str(i), q["question"], f"{documents[q['id']]['pose_name']}: {documents[q['id']]['instructions']}")
+        for i, q in enumerate(ground_truth)
+    ]
+
+
+async def run(batch_size, items):
+    calls = 0
+    llm_async = rag.llm_async
+
+    async def counting_llm(prompt, model="gpt-4o-mini"):
+        nonlocal calls
+        calls += 1
+        return await llm_async(prompt, model=model)
+
+    saved = []
+
+    async def save(evaluations):
+        saved.extend(evaluations)
+
+    async def skip(conversation_id, reason):
+        pass
+
+    rag.llm_async = counting_llm
+    queue = judge.JudgeQueue(
+        rag.evaluate_relevance_batch_async, save, skip,
+        maxsize=len(items), n_workers=WORKERS, batch_size=batch_size, batch_wait=0.05,
+    )
+    queue.start()
+    t0 = perf_counter()
+    for item in items:
+        await queue.submit(*item)
+    await queue.stop()
+    elapsed = perf_counter() - t0
+    rag.llm_async = llm_async
+
+    tokens = sum(t["total_tokens"] for _, _, t in saved)
+    relevant = sum(r.get("Relevance") in rag.RELEVANCE_LABELS for _, r, _ in saved)
+    return len(saved) / elapsed, calls, tokens / len(saved), relevant
+
+
+async def main():
+    items = conversations()
+    print(f"{len(items)} conversations, {WORKERS} workers")
+    for batch_size in BATCH_SIZES:
+        rate, calls, tokens, parsed = await run(batch_size, items)
+        print(
+            f"batch size {batch_size:3d}: {rate:7.1f} judgements/sec, {calls:4d} LLM calls, "
+            f"{tokens:6.1f} tokens/judgement, {parsed}/{len(items)} parsed"
+        )
+
+
+if __name__ == "__main__":
+    server = fake_openai.start(PORT)
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
@@ -0,0 +1,60 @@
+# Memory footprint and latency of the default and the low_memory (compact) TF-IDF index
+import sys
+import tracemalloc
+from time import perf_counter
+
+from common import BOOST, enlarge_catalog, load_documents, load_ground_truth
+
+import ingest
+import minsearch
+
+REPEATS = 3
+
+
+def build(documents, low_memory):
+    # Copies of the documents are fitted, so the traced memory includes what the index keeps of them
+    tracemalloc.start()
+    documents = [dict(doc) for doc in documents]
+    index = minsearch.Index(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS, low_memory=low_memory).fit(documents)
+    del documents
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return index, traced
+
+
+def measure(index, questions):
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        results = index.search_batch(questions, boost_dict=BOOST, num_results=10)
+        best = min(best, perf_counter() - t0)
+    return results, len(questions) / best
+
+
+def main():
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    catalog = enlarge_catalog(load_documents(), factor)
+    questions = [q["question"] for q in load_ground_truth()][:200]
+    print(f"catalog: {len(catalog)} documents")
+
+    default, default_traced = build(catalog, low_memory=False)
+    compact, compact_traced = build(catalog, low_memory=True)
+
+    default_report = default.memory_report()
+    compact_report = compact.memory_report()
+    print(f"{'component':14s} {'default':>12s} {'low_memory':>12s}")
+    for name in default_report:
+        print(f"{name:14s} {default_report[name]:12,d} {compact_report[name]:12,d}")
+    print(f"{'traced':14s} {default_traced:12,d} {compact_traced:12,d}")
+
+    default_results, default_qps = measure(default, questions)
+    compact_results, compact_qps = measure(compact, questions)
+    same = sum(
+        [d["id"] for d in a] == [d["id"] for d in b] for a, b in zip(default_results, compact_results)
+    )
+    print(f"queries/sec: default {default_qps:.0f}, low_memory {compact_qps:.0f}")
+    print(f"identical top-10 rankings: {same}/{len(questions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Retrieval quality and prompt tokens of the reranker with adaptive top-k against the first-stage top 10
+# cut by the context assembler. The ground-truth questions are split by document: the weights are trained
+# on one half, evaluated on the other and printed for rerank.WEIGHTS, which is never trained on the held-out
+# half so that the numbers stay honest for the shipped weights.
+# Hit rate is the share of questions whose ground-truth document reaches the prompt context.
+import os
+import zlib
+
+import numpy as np
+
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+os.environ["RERANK"] = "0"
+# rag creates its OpenAI clients on import, the API is never called
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from common import load_ground_truth
+
+import rag
+import rerank
+from context import ContextBuilder
+
+RATIOS = [0.0, 0.05, 0.1, 0.2, 0.3]
+
+
+def evaluate(name, questions, rankings, builder):
+    hits, reciprocal_ranks, documents, tokens = [], [], [], []
+    for q, ranking in zip(questions, rankings):
+        context, stats = builder.assemble(ranking)
+        ids = [doc["id"] for doc, _ in ranking]
+        hits.append(q["id"] in stats["doc_ids"])
+        reciprocal_ranks.append(1 / (ids.index(q["id"]) + 1) if q["id"] in ids else 0.0)
+        documents.append(len(stats["doc_ids"]))
+        tokens.append(builder.count_tokens(rag.prompt_template.format(question=q["question"], context=context)))
+    documents = np.array(documents)
+    print(
+        f"{name:28s} hit rate: {np.mean(hits):.3f}  MRR: {np.mean(reciprocal_ranks):.3f}  "
+        f"documents: {documents.mean():4.1f}  1-3 documents: {np.mean(documents <= 3):5.1%}  "
+        f"prompt tokens: {np.mean(tokens):5.0f}"
+    )
+
+
+def main():
+    ground_truth = load_ground_truth()
+    candidates = [rag.search(q["question"], output_scores=True, num_results=30) for q in ground_truth]
+    held_out = [zlib.crc32(q["id"].encode()) % 2 == 0 for q in ground_truth]
+    train_examples = [
+        (q["question"], c, q["id"]) for q, c, test in zip(ground_truth, candidates, held_out) if not test
+    ]
+    questions = [q for q, test in zip(ground_truth, held_out) if test]
+    test_candidates = [c for c, test in zip(candidates, held_out) if test]
+    print(f"{len(train_examples)} training questions, {len(questions)} held-out questions")
+
+    builder = ContextBuilder(
+        rag.index, rag.entry_fields, count_tokens=rag.count_tokens, token_budget=rag.CONTEXT_TOKEN_BUDGET,
+        min_score_ratio=rag.CONTEXT_MIN_SCORE_RATIO,
+    )
+    evaluate("top 10", questions, [c[:10] for c in test_candidates], builder)
+
+    builder.min_score_ratio = 0
+    reranker = rerank.Reranker(rag.index)
+    weights = rerank.train(reranker, train_examples)
+    for ratio in RATIOS:
+        reranker.min_ratio = ratio
+        rankings = [reranker.rerank(q["question"], c) for q, c in zip(questions, test_candidates)]
+        evaluate(f"reranked, min ratio {ratio}", questions, rankings, builder)
+
+    shipped = rerank.Reranker(rag.index, min_ratio=rag.RERANK_MIN_RATIO)
+    rankings = [shipped.rerank(q["question"], c) for q, c in zip(questions, test_candidates)]
+    evaluate("rerank.WEIGHTS", questions, rankings, builder)
+
+    print("weights trained on the training half:")
+    for name, weight in weights.items():
+        print(f"    {name!r}: {weight:.4f},")
+
+
+if __name__ == "__main__":
+    main()
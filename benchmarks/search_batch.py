@@ -0,0 +1,46 @@
+# Compare queries/sec of Index.search_batch against one Index.search call per question
+from time import perf_counter
+
+from common import BOOST, DATA_PATH, load_ground_truth
+
+import ingest
+
+REPEATS = 5
+
+
+def run_single(index, questions):
+    return [index.search(q, boost_dict=BOOST, num_results=10) for q in questions]
+
+
+def run_batch(index, questions):
+    return index.search_batch(questions, boost_dict=BOOST, num_results=10)
+
+
+def measure(fn, index, questions):
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        fn(index, questions)
+        best = min(best, perf_counter() - t0)
+    return len(questions) / best
+
+
+def main():
+    index = ingest.load_index(DATA_PATH)
+    questions = [q["question"] for q in load_ground_truth()]
+
+    single = run_single(index, questions)
+    batch = run_batch(index, questions)
+    same = all(
+        [d["id"] for d in s] == [d["id"] for d in b] for s, b in zip(single, batch)
+    )
+    print(f"questions: {len(questions)}, identical rankings: {same}")
+
+    single_qps = measure(run_single, index, questions)
+    batch_qps = measure(run_batch, index, questions)
+    print(f"search       : {single_qps:10.0f} queries/sec")
+    print(f"search_batch : {batch_qps:10.0f} queries/sec ({batch_qps / single_qps:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Fit time and queries/sec of the sharded index for 1..N shards on an enlarged catalog,
+# checking that every shard count returns exactly the rankings of the unsharded index
+import os
+import sys
+from time import perf_counter
+
+from common import BOOST, enlarge_catalog, load_documents, load_ground_truth
+
+import ingest
+from sharding import ShardedIndex
+
+REPEATS = 3
+
+
+def measure(index, questions):
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = perf_counter()
+        results = index.search_batch(questions, boost_dict=BOOST, num_results=10)
+        best = min(best, perf_counter() - t0)
+    return results, len(questions) / best
+
+
+def main():
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    max_shards = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    catalog = enlarge_catalog(load_documents(), factor)
+    questions = [q["question"] for q in load_ground_truth()][:200]
+    print(f"catalog: {len(catalog)} documents, {len(questions)} questions, {os.cpu_count()} CPUs")
+
+    t0 = perf_counter()
+    index = ingest.ENGINES["tfidf"](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(catalog)
+    fit_time = perf_counter() - t0
+    expected, qps = measure(index, questions)
+    expected_ids = [[d["id"] for d in results] for results in expected]
+    print(f"unsharded  fit: {fit_time:6.2f} s, {qps:8.0f} queries/sec")
+
+    for n_shards in range(1, max_shards + 1):
+        t0 = perf_counter()
+        with ShardedIndex(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS, n_shards=n_shards).fit(catalog) as sharded:
+            fit_time = perf_counter() - t0
+            results, qps = measure(sharded, questions)
+        same = [[d["id"] for d in r] for r in results] == expected_ids
+        print(f"{n_shards:2d} shards  fit: {fit_time:6.2f} s, {qps:8.0f} queries/sec, identical rankings: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Startup of one API worker (`uvicorn app:app`), from launching the process to accepting connections
+# (/healthz answers) and to being ready (/readyz answers 200), with the index loaded from its snapshot and
+# refit. Also the time to import db, rag and app in a fresh interpreter, which is what test collection and
+# scripts such as db_prep.py pay. The database is not needed, e.g. `python startup.py 5` for 5 runs.
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+import httpx
+
+from common import APP_DIR, DATA_PATH
+
+PORT = 8919
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+TIMEOUT = 120
+
+IMPORT = "from time import perf_counter; t0 = perf_counter(); import {module}; print(perf_counter() - t0)"
+
+
+def import_time(module, env):
+    timings = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT.format(module=module)],
+            cwd=APP_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def startup_time(env):
+    # Seconds until the worker accepts connections, and until it is ready
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(PORT)],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    t0 = perf_counter()
+    listening = None
+    try:
+        with httpx.Client(timeout=5) as client:
+            while True:
+                if perf_counter() - t0 > TIMEOUT or process.poll() is not None:
+                    raise RuntimeError("The worker did not become ready")
+                try:
+                    if listening is None and client.get(f"http://127.0.0.1:{PORT}/healthz").status_code:
+                        listening = perf_counter() - t0
+                    if client.get(f"http://127.0.0.1:{PORT}/readyz").status_code == 200:
+                        return listening, perf_counter() - t0
+                except httpx.TransportError:
+                    pass
+                sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    env = dict(
+        os.environ,
+        DATA_PATH=DATA_PATH,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        ANSWER_CACHE_PG="0",
+        RUN_TIMEZONE_CHECK="0",
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_dir = os.path.join(tmp, "snapshots")
+        modes = [
+            ("from snapshot", dict(env, INDEX_SNAPSHOT_DIR=snapshot_dir)),
+            ("refit index", dict(env, INDEX_SNAPSHOT_DIR="")),
+        ]
+        # The first start writes the snapshot
+        startup_time(modes[0][1])
+
+        for name, mode_env in modes:
+            for module in ("db", "rag", "app"):
+                print(f"{name:14s} import {module:4s}: {import_time(module, mode_env):6.3f} s")
+            timings = [startup_time(mode_env) for _ in range(RUNS)]
+            listening = statistics.median(listening for listening, _ in timings)
+            ready = statistics.median(ready for _, ready in timings)
+            print(f"{name:14s} accepting connections: {listening:6.3f} s  ready: {ready:6.3f} s")
+
+
+if __name__ == "__main__":
+    main()
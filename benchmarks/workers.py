@@ -0,0 +1,97 @@
+# Startup time and memory of the API served by serve.py with 1, 4 and 8 workers, on an enlarged catalog:
+# spawned workers each refitting their own index, spawned workers memory-mapping one snapshot built
+# beforehand, and workers forked from a process that loaded the app once (the serve.py default). Startup is
+# the time until every worker answers /readyz. PSS counts shared pages once across the processes sharing
+# them, so the total PSS of the workers and their parent is what the server really takes. Linux only, e.g.
+# `python workers.py 100` for a catalog 100 times larger.
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+import httpx
+import pandas as pd
+
+from common import APP_DIR, enlarge_catalog, load_documents
+
+import ingest
+
+PORT = 8916
+FACTOR = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+WORKERS = [1, 4, 8]
+STARTUP_TIMEOUT = 600
+
+
+def memory_kb(pid, field, path):
+    with open(f"/proc/{pid}/{path}") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start(n_workers, env, args):
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(n_workers), "--host", "127.0.0.1", "--port", str(PORT)]
+        + args,
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    t0 = perf_counter()
+    ready = set()
+    while len(ready) < n_workers:
+        if perf_counter() - t0 > STARTUP_TIMEOUT or process.poll() is not None:
+            process.terminate()
+            raise RuntimeError(f"{n_workers} workers did not become ready")
+        try:
+            # A new connection per request, so that every worker gets to answer
+            response = httpx.get(f"http://127.0.0.1:{PORT}/readyz", headers={"Connection": "close"}, timeout=5)
+            if response.status_code == 200:
+                ready.add(response.json()["pid"])
+                continue
+        except httpx.TransportError:
+            pass
+        sleep(0.05)
+    return process, perf_counter() - t0, sorted(ready)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, f"poses_x{FACTOR}.csv")
+        pd.DataFrame(enlarge_catalog(load_documents(), FACTOR)).to_csv(data_path, index=False)
+        snapshot_dir = os.path.join(tmp, "snapshots")
+        env = dict(
+            os.environ,
+            DATA_PATH=data_path,
+            OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+            RUN_TIMEZONE_CHECK="0",
+            ANSWER_CACHE_PG="0",
+        )
+        modes = [
+            ("refit per worker", dict(env, INDEX_SNAPSHOT_DIR=""), ["--spawn"]),
+            ("shared snapshot", dict(env, INDEX_SNAPSHOT_DIR=snapshot_dir), ["--spawn"]),
+            ("preloaded, forked", dict(env, INDEX_SNAPSHOT_DIR=snapshot_dir), []),
+        ]
+        print(f"{FACTOR * len(load_documents())} documents")
+
+        # The snapshot is built once beforehand, so that startup only measures loading it
+        ingest.load_index(data_path, snapshot_dir=snapshot_dir)
+
+        for name, mode_env, args in modes:
+            for n_workers in WORKERS:
+                process, startup, pids = start(n_workers, mode_env, args)
+                try:
+                    rss = [memory_kb(pid, "VmRSS", "status") / 1024 for pid in pids]
+                    pss = [memory_kb(pid, "Pss", "smaps_rollup") / 1024 for pid in set(pids) | {process.pid}]
+                finally:
+                    process.terminate()
+                    process.wait()
+                print(
+                    f"{name:20s} workers: {n_workers}  startup: {startup:6.2f} s  "
+                    f"RSS per worker: {sum(rss) / len(rss):6.0f} MB  "
+                    f"total PSS: {sum(pss):6.0f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
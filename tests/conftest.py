@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(ROOT, "data", "yoga_poses.csv")
+GROUND_TRUTH_PATH = os.path.join(ROOT, "data", "ground-truth-retrieval.csv")
+
+sys.path.insert(0, os.path.join(ROOT, "yoga-companion"))
+
+# rag and db read these when they are imported: a fake key, no database and no snapshot files
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DATA_PATH", DATA_PATH)
+os.environ.setdefault("INDEX_SNAPSHOT_DIR", "")
+os.environ.setdefault("RUN_TIMEZONE_CHECK", "0")
+
+TEXT_FIELDS = [
+    "pose_name",
+    "type_of_practice",
+    "variation",
+    "position",
+    "difficulty",
+    "props_required",
+    "body_focus",
+    "benefits",
+    "instructions",
+]
+
+
+@pytest.fixture
+def documents():
+    return pd.read_csv(DATA_PATH).to_dict(orient="records")
+
+
+@pytest.fixture(scope="session")
+def questions():
+    # Every 10th ground-truth question keeps the suite fast
+    return pd.read_csv(GROUND_TRUTH_PATH)["question"].tolist()[::10]
+
+@pytest.fixture
+def index(documents):
+    import ingest
+
+    return ingest.ENGINES["tfidf"](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
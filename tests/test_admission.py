@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_requests_queue_in_arrival_order_and_a_full_queue_is_shed():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=10)
+        ticket = await controller.acquire("a")
+        started = []
+
+        async def request(client):
+            async with controller.admit(client):
+                started.append(client)
+
+        waiting = [asyncio.ensure_future(request(client)) for client in "bc"]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("d")
+        controller.release(ticket)
+        await asyncio.gather(*waiting)
+        return started, rejected.value, controller.stats()
+
+    started, rejected, stats = asyncio.run(run())
+
+    assert started == ["b", "c"]
+    assert (rejected.status_code, rejected.reason, rejected.retry_after) == (503, "queue_full", 1.0)
+    assert (stats["admitted"], stats["shed_queue_full"], stats["in_flight"], stats["queued"]) == (3, 1, 0, 0)
+
+
+def test_requests_that_cannot_start_before_their_deadline_are_shed():
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=8, queue_timeout=0.05)
+        controller.service_time = 1.0
+        ticket = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as too_slow:
+            # The slot is expected to be free in 1 s, the request may only wait 0.05 s
+            await controller.acquire("b")
+        controller.service_time = 0.01
+        with pytest.raises(AdmissionRejected) as expired:
+            await controller.acquire("c")
+        with pytest.raises(AdmissionRejected) as impatient:
+            await controller.acquire("d", timeout=0.005)
+        controller.release(ticket)
+        return too_slow.value, expired.value, impatient.value, controller.stats()
+
+    too_slow, expired, impatient, stats = asyncio.run(run())
+
+    assert [error.reason for error in (too_slow, expired, impatient)] == ["deadline"] * 3
+    assert stats["shed_deadline"] == 3 and stats["in_flight"] == 0
+
+
+def test_clients_over_their_token_budget_are_rate_limited():
+    async def run():
+        controller = AdmissionController(tokens_per_minute=3000, token_estimate=1000)
+        ticket = await controller.acquire("a", questions=2)
+        # Only 500 of the 2000 reserved tokens were used
+        ticket.used = 500
+        controller.release(ticket)
+        await controller.acquire("a", questions=2)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("a")
+        other = await controller.acquire("b")
+        return rejected.value, other, controller.stats()
+
+    rejected, other, stats = asyncio.run(run())
+
+    assert (rejected.status_code, rejected.reason) == (429, "rate_limited")
+    assert rejected.retry_after == pytest.approx(10, abs=0.1)
+    assert other.charged == 1000
+    assert stats["rate_limited"] == 1
+
+
+def test_cancelled_request_whose_queue_entry_expired_does_not_free_a_slot(monkeypatch):
+    async def wait_for(future, timeout):
+        # Like asyncio.wait_for since Python 3.12, raises CancelledError even when the future is done
+        return await future
+
+    monkeypatch.setattr(admission.asyncio, "wait_for", wait_for)
+
+    async def run():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=10)
+        ticket = await controller.acquire("a")
+        waiting = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        # The queued request's deadline passes just as the slot is freed, and its client goes away
+        waiter, _ = controller._queue[0]
+        controller._queue[0] = (waiter, 0.0)
+        controller.release(ticket)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return controller.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["expired"] == 1
+    assert stats["in_flight"] == 0
@@ -0,0 +1,220 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from conftest import ROOT
+from fastapi.testclient import TestClient
+
+import app
+import db
+import rag
+from admission import AdmissionRejected
+
+
+def answer_data(answer):
+    no_tokens = rag.usage_stats(None)
+    return rag.build_answer_data(answer, "gpt-4o-mini", 0.5, no_tokens, {}, no_tokens, stage_times={"search": 0.01})
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = {"conversations": [], "feedback": [], "batches": 0}
+
+    async def save_conversation_async(conversation_id, question, answer_data, timestamp=None):
+        saved["conversations"].append((conversation_id, question, answer_data))
+
+    async def save_feedback_async(conversation_id, feedback, timestamp=None):
+        saved["feedback"].append((conversation_id, feedback))
+
+    async def save_conversations_async(conversations, timestamp=None):
+        saved["conversations"].extend(conversations)
+        saved["batches"] += 1
+
+    monkeypatch.setattr(db, "save_conversation_async", save_conversation_async)
+    monkeypatch.setattr(db, "save_conversations_async", save_conversations_async)
+    monkeypatch.setattr(db, "save_feedback_async", save_feedback_async)
+    return saved
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    submitted = []
+
+    async def submit(conversation_id, question, answer):
+        submitted.append((conversation_id, question, answer))
+        return True
+
+    monkeypatch.setattr(app.judge_queue, "submit", submit)
+    return submitted
+
+
+def test_question_is_answered_and_saved(saved, submitted, monkeypatch):
+    async def rag_async(question, evaluate=True):
+        assert not evaluate
+        return answer_data(f"Answer to {question}")
+
+    monkeypatch.setattr(app, "rag_async", rag_async)
+    client = TestClient(app.app)
+
+    response = client.post("/question", json={"question": "Tree pose?"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] == "Answer to Tree pose?"
+    [(conversation_id, question, saved_data)] = saved["conversations"]
+    assert (conversation_id, question, saved_data["answer"]) == (body["conversation_id"], "Tree pose?", body["answer"])
+    assert (saved_data["relevance"], saved_data["relevance_explanation"]) == ("PENDING", "Waiting for the LLM judge")
+    # The judge runs later, in the background
+    assert submitted == [(body["conversation_id"], "Tree pose?", "Answer to Tree pose?")]
+
+
+def test_empty_question_and_invalid_feedback_are_rejected(saved):
+    client = TestClient(app.app)
+
+    assert client.post("/question", json={"question": ""}).status_code == 400
+    assert client.post("/feedback", json={"conversation_id": "c", "feedback": 2}).status_code == 400
+    assert client.post("/feedback", json={"conversation_id": "c", "feedback": -1}).status_code == 200
+    assert saved["feedback"] == [("c", -1)]
+
+
+def test_question_stream_sends_tokens_then_done(saved, submitted, monkeypatch):
+    async def rag_stream(question, evaluate=True):
+        for token in ("Tree ", "pose."):
+            yield {"token": token}
+        yield {"answer_data": answer_data("Tree pose.")}
+
+    monkeypatch.setattr(app, "rag_stream", rag_stream)
+    client = TestClient(app.app)
+
+    response = client.post("/question/stream", json={"question": "Tree pose?"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: ")))
+        for lines in (block.split("\n") for block in response.text.strip().split("\n\n"))
+    ]
+    assert events[:2] == [("token", {"token": "Tree "}), ("token", {"token": "pose."})]
+    assert events[2][0] == "done"
+    assert events[2][1]["answer"] == "Tree pose."
+    conversation_id = events[2][1]["conversation_id"]
+    assert [conversation[:2] for conversation in saved["conversations"]] == [(conversation_id, "Tree pose?")]
+    assert submitted == [(conversation_id, "Tree pose?", "Tree pose.")]
+
+
+def test_questions_are_answered_in_request_order_and_saved_together(saved, submitted, monkeypatch):
+    async def rag_batch(questions):
+        # In completion order, the second question failed
+        yield 2, answer_data("Answer 2"), None
+        yield 1, None, RuntimeError("LLM unavailable")
+        yield 0, answer_data("Answer 0"), None
+
+    monkeypatch.setattr(app, "rag_batch", rag_batch)
+    client = TestClient(app.app)
+
+    response = client.post("/questions", json={"questions": ["q0", "q1", "q2"]})
+
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert [result.get("answer") for result in results] == ["Answer 0", None, "Answer 2"]
+    assert results[1]["error"] == "LLM unavailable"
+    assert saved["batches"] == 1
+    assert [(conversation_id, question) for conversation_id, question, _ in saved["conversations"]] == [
+        (results[2]["conversation_id"], "q2"), (results[0]["conversation_id"], "q0")
+    ]
+    assert [question for _, question, _ in submitted] == ["q2", "q0"]
+
+
+def test_questions_stream_sends_results_then_done(saved, submitted, monkeypatch):
+    async def rag_batch(questions):
+        for position in reversed(range(len(questions))):
+            yield position, answer_data(f"Answer {position}"), None
+
+    monkeypatch.setattr(app, "rag_batch", rag_batch)
+    client = TestClient(app.app)
+
+    response = client.post("/questions", json={"questions": ["q0", "q1"], "stream": True})
+
+    blocks = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in blocks] == ["event: result", "event: result", "event: done"]
+    assert [json.loads(lines[1].removeprefix("data: ")).get("index") for lines in blocks[:2]] == [1, 0]
+    assert json.loads(blocks[2][1].removeprefix("data: ")) == {"questions": 2, "answered": 2}
+
+
+def test_empty_and_oversized_batches_are_rejected(saved, monkeypatch):
+    monkeypatch.setattr(app, "BATCH_MAX_QUESTIONS", 2)
+    client = TestClient(app.app)
+
+    assert client.post("/questions", json={"questions": []}).status_code == 400
+    assert client.post("/questions", json={"questions": ["q0", ""]}).status_code == 400
+    assert client.post("/questions", json={"questions": ["q0", "q1", "q2"]}).status_code == 400
+
+
+def test_shed_requests_get_their_status_and_retry_after(saved, monkeypatch):
+    async def acquire(client, questions=1, timeout=None):
+        assert (client, questions, timeout) == ("mobile-app", 2, 3.0)
+        raise AdmissionRejected(429, "rate_limited", 2.5, "Client mobile-app is over its budget")
+
+    monkeypatch.setattr(app.admission, "acquire", acquire)
+    client = TestClient(app.app)
+
+    response = client.post(
+        "/questions", json={"questions": ["q0", "q1"]},
+        headers={"X-Client-Id": "mobile-app", "X-Request-Timeout": "3"},
+    )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert response.json()["reason"] == "rate_limited"
+    assert saved["conversations"] == []
+
+
+def test_worker_is_ready_once_the_index_is_loaded(monkeypatch):
+    monkeypatch.setattr(app, "ANSWER_CACHE_PG", False)
+
+    assert TestClient(app.app).get("/readyz").status_code == 503
+    with TestClient(app.app) as client:
+        assert client.get("/healthz").json()["status"] == "ok"
+        for _ in range(100):
+            response = client.get("/readyz")
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+
+    assert response.status_code == 200
+    assert response.json()["ready"]
+    assert response.json()["index"]["documents"] == len(rag.index.docs)
+
+
+def test_importing_the_api_does_not_load_the_index():
+    code = "import sys, app, rag; print(rag.is_loaded(), 'openai' in sys.modules, 'sklearn' in sys.modules)"
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "yoga-companion"))
+
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+
+    assert output.stdout.split() == ["False", "False", "False"]
+
+
+def test_metrics_count_answers_and_stages(saved, submitted, monkeypatch):
+    async def rag_async(question, evaluate=True):
+        return answer_data("Tree pose.")
+
+    monkeypatch.setattr(app, "rag_async", rag_async)
+    client = TestClient(app.app)
+
+    def sample(text, name):
+        return next((float(line.split(" ")[-1]) for line in text.splitlines() if line.startswith(name + " ")), 0)
+
+    before = client.get("/metrics").text
+    client.post("/question", json={"question": "Tree pose?"})
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+    for name in ('yoga_answers_total{answer_path="llm"}', 'yoga_stage_seconds_count{stage="search"}',
+                 'yoga_stage_seconds_count{stage="db_write"}'):
+        assert sample(after, name) == sample(before, name) + 1
+    assert "# TYPE yoga_llm_calls_total counter" in after
+    assert "# TYPE yoga_judge_queued gauge" in after
@@ -0,0 +1,49 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+from conftest import DATA_PATH, TEXT_FIELDS
+
+import bm25
+import ingest
+
+BOOST = {"pose_name": 1.8, "variation": 0.4, "position": 2.1, "instructions": 0, "benefits": 0.5}
+
+
+def exhaustive_scores(index, query, boost_dict):
+    # BM25F scores of every document, without MaxScore pruning
+    field_weights = {field: boost_dict.get(field, 1) for field in index.text_fields}
+    field_weights = {field: weight for field, weight in field_weights.items() if weight != 0}
+    scores = np.zeros(len(index.docs))
+    terms = Counter(index.vocabulary[term] for term in index.analyzer(query) if term in index.vocabulary)
+    for term_id, count in terms.items():
+        if not any(index.max_weights[field][term_id] > 0 for field in field_weights):
+            continue
+        doc_ids, tfs = index._term_postings(term_id, field_weights)
+        scores[doc_ids] += count * index.idf[term_id] * index._saturate(tfs)
+    return scores
+
+
+@pytest.mark.parametrize("boost_dict", [{}, BOOST])
+def test_pruned_search_returns_the_exhaustive_top_results(documents, questions, boost_dict):
+    index = bm25.BM25Index(TEXT_FIELDS, ["id"]).fit(documents)
+
+    for query in questions:
+        expected = exhaustive_scores(index, query, boost_dict)
+        results = index.search(query, boost_dict=boost_dict, num_results=5)
+
+        top = np.sort(expected[expected > 0])[::-1][:5]
+        np.testing.assert_allclose(expected[[documents.index(doc) for doc in results]], top, rtol=1e-5)
+
+
+def test_keyword_filter(documents):
+    index = bm25.BM25Index(TEXT_FIELDS, ["id"]).fit(documents)
+    doc = documents[5]
+
+    assert index.search(doc["pose_name"], filter_dict={"id": doc["id"]}) == [doc]
+
+
+def test_load_index_selects_the_engine():
+    assert isinstance(ingest.load_index(DATA_PATH, engine="bm25", snapshot_dir=""), bm25.BM25Index)
+    with pytest.raises(ValueError):
+        ingest.load_index(DATA_PATH, engine="unknown")
@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+from conftest import TEXT_FIELDS
+
+import cache
+import minsearch
+from cache import AnswerCache, LRUCache, SearchCache, SingleFlight
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats()["evictions"] == 1
+
+
+def test_lru_expires_entries_after_their_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, "monotonic", lambda: now[0])
+    lru = LRUCache(ttl=10)
+    lru.put("a", 1)
+
+    now[0] = 109.0
+    assert lru.get("a") == 1
+    now[0] = 110.0
+    assert lru.get("a") is None
+    assert lru.stats()["expirations"] == 1
+
+
+def test_lru_respects_its_byte_cap_and_can_be_disabled():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", 1, size=60)
+    lru.put("b", 2, size=60)
+    lru.put("c", 3, size=101)
+
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (None, 2, None)
+
+    disabled = LRUCache(maxsize=0)
+    disabled.put("a", 1)
+    assert len(disabled) == 0
+
+
+class CountingIndex:
+    def __init__(self, index):
+        self.index = index
+        self.queries = []
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, query, *args, **kwargs):
+        self.queries.append(query)
+        return self.index.search(query, *args, **kwargs)
+
+    def search_batch(self, queries, *args, **kwargs):
+        self.queries.extend(queries)
+        return self.index.search_batch(queries, *args, **kwargs)
+
+
+def test_queries_with_the_same_terms_share_an_entry(documents):
+    index = CountingIndex(minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents))
+    search_cache = SearchCache(index)
+
+    first = search_cache.search("Tree pose benefits")
+    second = search_cache.search("benefits, TREE pose?")
+
+    assert first == second
+    assert index.queries == ["Tree pose benefits"]
+    search_cache.search("Tree pose benefits", filter_dict={"id": "7ce8c60e"})
+    assert len(index.queries) == 2
+
+
+def test_search_batch_only_runs_uncached_queries(documents):
+    index = CountingIndex(minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents))
+    search_cache = SearchCache(index)
+    search_cache.search("tree pose")
+
+    results = search_cache.search_batch(["tree pose", "warrior pose"])
+
+    assert index.queries == ["tree pose", "warrior pose"]
+    assert results == [index.index.search("tree pose"), index.index.search("warrior pose")]
+
+
+def test_cache_is_cleared_when_the_index_changes(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    search_cache = SearchCache(index)
+    search_cache.search("moonlit heron")
+
+    index.update(documents[0]["id"], dict(documents[0], pose_name="Moonlit Heron"))
+
+    assert [doc["id"] for doc in search_cache.search("moonlit heron")] == [documents[0]["id"]]
+    assert search_cache.stats()["invalidations"] == 1
+
+
+def test_answer_cache_serves_exact_and_similar_questions_with_the_same_documents(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    answer_cache = AnswerCache(index, threshold=0.8)
+    answer_cache.put("What are the benefits of Tree pose?", ["a", "b"], "Balance.")
+
+    assert answer_cache.get("what are the BENEFITS of tree pose", ["a", "b"]) == ("Balance.", "exact")
+    assert answer_cache.get("What are the benefits of the Tree pose?", ["a", "b"]) == ("Balance.", "similar")
+    assert answer_cache.get("What are the benefits of Tree pose?", ["b", "a"]) == (None, None)
+    assert answer_cache.get("How do I get into Crow pose?", ["a", "b"]) == (None, None)
+    assert (answer_cache.exact_hits, answer_cache.similar_hits) == (1, 1)
+
+
+def test_answer_cache_exact_only_and_invalidation(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    answer_cache = AnswerCache(index, threshold=1.0)
+    answer_cache.put("What are the benefits of Tree pose?", ["a"], "Balance.")
+
+    assert answer_cache.get("What are the benefits of the Tree pose?", ["a"]) == (None, None)
+
+    index.update(documents[0]["id"], dict(documents[0], pose_name="Moonlit Heron"))
+    assert answer_cache.get("What are the benefits of Tree pose?", ["a"]) == (None, None)
+
+
+def test_answer_cache_defaults_to_exact_hits_only(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    answer_cache = AnswerCache(index)
+    answer_cache.put("What are the benefits of Tree pose?", ["a"], "Balance.")
+
+    assert answer_cache.get("What are the benefits of the Tree pose?", ["a"]) == (None, None)
+
+
+def test_answer_cache_reads_and_writes_its_persistent_tier(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    stored = {}
+
+    async def save(key, *row):
+        stored.setdefault(key, row[-1])
+
+    async def load(key):
+        return stored.get(key)
+
+    async def main():
+        writer = AnswerCache(index, namespace="v1", save=save)
+        writer.put("Tree pose benefits", ["a"], "Balance.")
+        await writer.put_persistent("Tree pose benefits", ["a"], "Balance.")
+
+        reader = AnswerCache(index, namespace="v1", load=load)
+        other_catalog = AnswerCache(index, namespace="v2", load=load)
+        return [
+            reader.get("tree pose benefits", ["a"]),
+            await reader.get_persistent("tree pose benefits", ["a"]),
+            reader.get("tree pose benefits", ["a"]),
+            await other_catalog.get_persistent("tree pose benefits", ["a"]),
+        ]
+
+    assert asyncio.run(main()) == [(None, None), ("Balance.", "exact"), ("Balance.", "exact"), (None, None)]
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def burst():
+        concurrent = await asyncio.gather(*(single_flight.run("key", call) for _ in range(3)))
+        later = await single_flight.run("key", call)
+        return concurrent, later
+
+    concurrent, later = asyncio.run(burst())
+
+    assert concurrent == [("answer", False), ("answer", True), ("answer", True)]
+    assert later == ("answer", False)
+    assert len(calls) == 2
+    assert single_flight.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 2, "coalesced_ratio": 0.5}
+
+
+def test_single_flight_survives_a_cancelled_caller_and_shares_errors():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("LLM unavailable")
+
+    async def burst():
+        leader = asyncio.ensure_future(single_flight.run("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.run("key", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(RuntimeError, match="LLM unavailable"):
+            await follower
+
+    asyncio.run(burst())
@@ -0,0 +1,60 @@
+from context import ContextBuilder, estimate_tokens
+
+FIELDS = [("Pose Name", "pose_name"), ("Props Required", "props_required")]
+
+
+def variations(documents):
+    # The first pose with two variations that differ in their props
+    by_pose = {}
+    for doc in documents:
+        by_pose.setdefault(doc["pose_name"], []).append(doc)
+    for docs in by_pose.values():
+        if len(docs) > 1 and docs[0]["props_required"] != docs[1]["props_required"]:
+            return docs[0], docs[1]
+
+
+def test_variations_only_list_their_differences_and_duplicates_are_dropped(documents, index):
+    first, second = variations(documents)
+
+    context, stats = ContextBuilder(index, FIELDS).assemble([(first, 2.0), (second, 1.0), (first, 1.0)])
+
+    assert context == (
+        f"Pose Name: {first['pose_name']}\nProps Required: {first['props_required']}\n\n"
+        f"Pose Name: {first['pose_name']} (other fields as above)\nProps Required: {second['props_required']}\n\n"
+    )
+    assert (stats["kept"], stats["merged"]) == (2, 2)
+    assert stats["doc_ids"] == [first["id"], second["id"], first["id"]]
+
+
+def test_low_scores_and_the_token_budget_cut_the_context(documents, index):
+    results = [(doc, 1.0) for doc in documents[:10:3]] + [(documents[1], 0.1)]
+    builder = ContextBuilder(index, FIELDS, min_score_ratio=0.4)
+
+    _, stats = builder.assemble(results)
+    assert stats["kept"] == 4
+
+    builder.token_budget = 1
+    context, stats = builder.assemble(results)
+    assert stats["kept"] == 1
+    assert stats["tokens"] == sum(estimate_tokens(line) + 1 for line in context.strip().split("\n"))
+
+
+def test_updated_document_is_rendered_from_its_new_row(documents, index):
+    doc = dict(documents[0], props_required="Yoga Wheel")
+    index.update(doc["id"], doc)
+
+    context, _ = ContextBuilder(index, FIELDS).assemble([(doc, 1.0)])
+
+    assert "Props Required: Yoga Wheel" in context
+    assert documents[0]["props_required"] not in context
+
+
+def test_assemble_renders_a_document_updated_after_the_builder_was_created(documents, index):
+    builder = ContextBuilder(index, FIELDS)
+    builder.assemble([(documents[0], 1.0)])
+
+    doc = dict(documents[0], props_required="Yoga Wheel")
+    index.update(doc["id"], doc)
+    context, _ = builder.assemble([(doc, 1.0)])
+
+    assert "Props Required: Yoga Wheel" in context
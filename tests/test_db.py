@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+import db
+
+
+def test_pool_opens_connections_as_needed(monkeypatch):
+    pools = []
+    monkeypatch.setattr(db, "ThreadedConnectionPool", lambda *args, **params: pools.append(args) or object())
+    monkeypatch.setattr(db, "_pool", None)
+
+    db.get_pool()
+    db.get_pool()
+
+    assert pools == [(db.DB_POOL_MIN_SIZE, db.DB_POOL_SIZE)]
+    assert db.DB_POOL_MIN_SIZE == 1
+
+
+def test_the_api_does_not_write_a_timezone_check_row_by_default():
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "yoga-companion"))
+    env.pop("RUN_TIMEZONE_CHECK")
+
+    output = subprocess.run([sys.executable, "-c", "import db; print(db.RUN_TIMEZONE_CHECK)"], env=env,
+                            capture_output=True, text=True, check=True)
+
+    assert output.stdout.split() == ["False"]
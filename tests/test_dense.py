@@ -0,0 +1,81 @@
+import numpy as np
+from conftest import TEXT_FIELDS
+
+import minsearch
+from cache import SearchCache
+from dense import DenseIndex, reciprocal_rank_fusion
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_exact_search_ranks_by_cosine_similarity(documents, questions):
+    sparse = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    dense = DenseIndex.from_index(sparse, n_components=32)
+
+    assert dense.docs is sparse.docs
+    for query in questions:
+        scores = dense.vectors @ dense._query_vectors([query], {})[0]
+        results = dense.search(query, num_results=5)
+        np.testing.assert_allclose(scores[[documents.index(doc) for doc in results]], np.sort(scores)[::-1][:5])
+
+
+def test_ivf_probing_every_list_matches_exact_search(documents, questions):
+    exact = DenseIndex(TEXT_FIELDS, ["id"], n_components=32).fit(documents)
+    ivf = DenseIndex(TEXT_FIELDS, ["id"], n_components=32, n_lists=8, n_probe=8).fit(documents)
+
+    assert ivf.list_offsets[-1] == len(documents)
+    for query in questions:
+        assert ids(ivf.search(query)) == ids(exact.search(query))
+
+
+def test_filters_and_deleted_rows_apply(documents):
+    sparse = minsearch.Index(TEXT_FIELDS, ["id", "difficulty"]).fit(documents)
+    dense = DenseIndex.from_index(sparse, n_components=32)
+    sparse.delete(documents[0]["id"])
+
+    results = dense.search(documents[0]["pose_name"], filter_dict={"difficulty": "Beginner"}, num_results=50)
+
+    assert results and all(doc["difficulty"] == "Beginner" for doc in results)
+    assert documents[0]["id"] not in ids(dense.search(documents[0]["pose_name"], num_results=len(documents)))
+
+
+def test_reciprocal_rank_fusion():
+    a, b, c, d = ({"id": name} for name in "abcd")
+
+    fused = reciprocal_rank_fusion([[a, b, c], [c, b, d]], k=1)
+
+    # b: 1/3 + 1/3, c: 1/4 + 1/2, a: 1/2, d: 1/4
+    assert ids(fused) == ["c", "b", "a", "d"]
+    assert ids(reciprocal_rank_fusion([[a, b], [b, a]], num_results=1)) == ["a"]
+
+
+def test_vectors_follow_sparse_index_changes(documents):
+    sparse = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents[:-1])
+    dense = DenseIndex.from_index(sparse, n_components=32)
+    cached = SearchCache(dense)
+    assert documents[-1]["id"] not in ids(cached.search(documents[-1]["pose_name"], num_results=3))
+
+    sparse.add([documents[-1]])
+
+    assert documents[-1]["id"] in ids(cached.search(documents[-1]["pose_name"], num_results=3))
+    assert dense.vectors.shape[0] == len(documents)
+
+    updated = {**documents[0], "pose_name": "Zebra Handstand", "description": "zebra zebra"}
+    sparse.update(documents[0]["id"], updated)
+    sparse.compact()
+
+    assert ids(dense.search("zebra", num_results=1)) == [documents[0]["id"]]
+    assert dense.vectors.shape[0] == len(documents)
+
+
+def test_following_refits_from_live_documents(documents):
+    source = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    dense = DenseIndex.following(source, TEXT_FIELDS, ["id"], n_components=32)
+
+    assert dense.sparse_index is not source
+    source.delete(documents[0]["id"])
+
+    assert documents[0]["id"] not in ids(dense.search(documents[0]["pose_name"], num_results=len(documents)))
+    assert len(dense.docs) == len(documents) - 1
@@ -0,0 +1,75 @@
+import pytest
+
+from fastpath import FastPath
+
+
+def ask(fast_path, index, question):
+    return fast_path.answer(question, index.search(question, num_results=10, output_scores=True))
+
+
+def test_updated_pose_is_answered_with_its_new_value(documents, index):
+    fast_path = FastPath(index)
+    pose = "Upward Dog"
+    question = f"What props do I need for {pose}?"
+    old_values = {doc["props_required"] for doc in documents if doc["pose_name"] == pose}
+    assert ask(fast_path, index, question)[1] == "props_required"
+
+    for doc in documents:
+        if doc["pose_name"] == pose:
+            index.update(doc["id"], dict(doc, props_required="Yoga Wheel"))
+    answer, field = ask(fast_path, index, question)
+
+    assert field == "props_required"
+    assert "yoga wheel" in answer.lower()
+    for value in old_values:
+        assert value.lower() not in answer.lower()
+
+
+def test_lookup_of_one_variation_uses_the_template(index):
+    fast_path = FastPath(index)
+
+    assert ask(fast_path, index, "What is the difficulty of Tree Pose with a strap?") == (
+        "Tree Pose (With Strap) is rated Beginner.", "difficulty"
+    )
+    assert ask(fast_path, index, "Which props does the twisted Half Pigeon Pose need?") == (
+        "Half Pigeon Pose (Twisted) doesn't need any props.", "props_required"
+    )
+
+
+def test_every_props_value_of_the_catalog_reads_well(documents, index):
+    fast_path = FastPath(index)
+    answers = {}
+    for doc in documents:
+        variation = doc["variation"] if not doc["variation"].lower().startswith("no ") else ""
+        answer, field = ask(fast_path, index, f"What props do I need for {doc['pose_name']} {variation}?")
+        if field and "\n" not in answer and doc["props_required"] != "Not Required":
+            answers.setdefault(doc["props_required"], answer)
+
+    assert set(answers) == {doc["props_required"] for doc in documents} - {"Not Required"}
+    for value, answer in answers.items():
+        assert answer.endswith(f" needs: {value}.")
+
+
+def test_variations_that_disagree_are_listed(index):
+    answer, field = ask(FastPath(index), index, "What props do I need for Garland Pose?")
+
+    assert field == "props_required"
+    assert answer == (
+        "It depends on the variation of Garland Pose. Props by variation:\n- Blanket: No Variation\n- Block: With Bolster"
+    )
+
+
+@pytest.mark.parametrize("question", [
+    "What props do I need for Tree Pose and Crow Pose?",
+    "Is Tree Pose good for my knees?",
+    "What are the benefits and the difficulty of Tree Pose?",
+    "How do I do Tree Pose?",
+])
+def test_other_questions_are_left_to_the_llm(index, question):
+    assert ask(FastPath(index), index, question) == (None, None)
+
+
+def test_lookup_is_left_to_the_llm_when_the_search_disagrees(index):
+    crow_results = index.search("Crow Pose", num_results=10, output_scores=True)
+
+    assert FastPath(index).answer("What props do I need for Garland Pose?", crow_results) == (None, None)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import ingest
+from minsearch import KeywordIndex
+
+FILTERS = [
+    ({"id": "7ce8c60e"}, lambda doc: doc["id"] == "7ce8c60e"),
+    ({"difficulty": "Beginner"}, lambda doc: doc["difficulty"] == "Beginner"),
+    (
+        {"difficulty": ["Beginner", "Advanced"], "position": "Standing"},
+        lambda doc: doc["difficulty"] in ("Beginner", "Advanced") and doc["position"] == "Standing",
+    ),
+    (
+        {"type_of_practice": {"gte": "Hatha", "lt": "Vinyasa"}},
+        lambda doc: "Hatha" <= doc["type_of_practice"] < "Vinyasa",
+    ),
+    ({"difficulty": "Unknown"}, lambda doc: False),
+    ({"difficulty": []}, lambda doc: False),
+    ({"benefits": "Builds strength"}, lambda doc: True),
+]
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+@pytest.mark.parametrize("engine", ["tfidf", "bm25"])
+@pytest.mark.parametrize("filter_dict, matches", FILTERS)
+def test_filtered_search_ranks_the_matching_documents(documents, questions, engine, filter_dict, matches):
+    index = ingest.ENGINES[engine](ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
+
+    for query in questions:
+        unfiltered = index.search(query, num_results=len(documents))
+        expected = [doc for doc in unfiltered if matches(doc)][:5]
+        assert ids(index.search(query, filter_dict=filter_dict, num_results=5)) == ids(expected)
+
+
+def test_rows_match_a_scan_after_add_and_take():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 20, size=200).tolist()
+    keyword_index = KeywordIndex(["n"]).fit([{"n": n} for n in values[:150]])
+    keyword_index.add([{"n": n} for n in values[150:]])
+    keep = np.flatnonzero(rng.random(200) < 0.7)
+    keyword_index.take(keep)
+    values = np.array(values)[keep]
+
+    for condition, matches in [
+        (7, values == 7),
+        ([3, 5, 100], np.isin(values, [3, 5, 100])),
+        ({"gt": 4, "lte": 9}, (values > 4) & (values <= 9)),
+        ({"lt": 2}, values < 2),
+        ("7", np.zeros(len(values), dtype=bool)),
+    ]:
+        assert keyword_index.rows("n", condition).tolist() == np.flatnonzero(matches).tolist()
+
+
+def test_unknown_range_operator_is_rejected():
+    keyword_index = KeywordIndex(["n"]).fit([{"n": 1}])
+
+    with pytest.raises(ValueError):
+        keyword_index.rows("n", {"between": 1})
+
+
+def test_add_merges_new_rows_into_the_sorted_order():
+    rng = np.random.default_rng(1)
+    values = [f"v{n}" for n in rng.integers(0, 10, size=100)]
+    keyword_index = KeywordIndex(["v"]).fit([{"v": v} for v in values[:60]])
+    for start in range(60, 100, 8):
+        keyword_index.add([{"v": v} for v in values[start:start + 8]])
+
+    refit = KeywordIndex(["v"]).fit([{"v": v} for v in values])
+    assert keyword_index.order["v"].tolist() == refit.order["v"].tolist()
+    assert keyword_index.rows("v", "v3").tolist() == [row for row, v in enumerate(values) if v == "v3"]
+
+
+def test_mixed_number_and_string_fields_are_compared_as_strings():
+    keyword_index = KeywordIndex(["n"]).fit([{"n": 5}, {"n": 7}])
+    keyword_index.add([{"n": "5"}, {"n": "x"}])
+
+    assert keyword_index.values["n"].dtype.kind == "U"
+    assert keyword_index.rows("n", 5).tolist() == [0, 2]
+    assert keyword_index.rows("n", ["7", "x"]).tolist() == [1, 3]
+    assert keyword_index.rows("n", {"gte": 6}).tolist() == [1, 3]
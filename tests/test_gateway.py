@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from gateway import LLMGateway, LLMOverloadedError, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "What are the benefits of Tree pose?"}]
+
+
+def response(total_tokens=30):
+    return SimpleNamespace(usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+def status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.APIStatusError(
+        "error", response=httpx.Response(status_code, headers=headers, request=request), body=None
+    )
+
+
+class ScriptedClient:
+    # Raises the scripted errors in turn, then answers, optionally after a delay
+    def __init__(self, errors=(), delays=()):
+        self.errors = list(errors)
+        self.delays = list(delays)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return response()
+
+
+class ScriptedAsyncClient(ScriptedClient):
+    async def create(self, model, messages):
+        self.calls += 1
+        if self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+        if self.errors:
+            raise self.errors.pop(0)
+        return response()
+
+
+def gateway(client=None, async_client=None, **params):
+    params = {"backoff_base": 0.001, "backoff_max": 0.01, **params}
+    llm_gateway = LLMGateway(**params)
+    llm_gateway._client = client or ScriptedClient()
+    llm_gateway._async_client = async_client or ScriptedAsyncClient()
+    return llm_gateway
+
+
+def test_retryable_errors_are_retried():
+    client = ScriptedClient([status_error(429), status_error(503), openai.APIConnectionError(request=None)])
+    llm_gateway = gateway(client)
+
+    assert llm_gateway.complete(MESSAGES).usage.total_tokens == 30
+    assert (client.calls, llm_gateway.retries, llm_gateway.failures) == (4, 3, 0)
+
+
+def test_other_errors_and_exhausted_retries_raise():
+    llm_gateway = gateway(ScriptedClient([status_error(400)]))
+    with pytest.raises(openai.APIStatusError):
+        llm_gateway.complete(MESSAGES)
+
+    llm_gateway = gateway(async_client=ScriptedAsyncClient([status_error(500)] * 3), max_retries=2)
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(llm_gateway.complete_async(MESSAGES))
+    assert (llm_gateway.async_client.calls, llm_gateway.failures) == (3, 1)
+
+
+def test_retry_after_is_honoured():
+    llm_gateway = gateway(backoff_max=10)
+
+    assert llm_gateway.retry_delay(0, status_error(429, {"retry-after": "2"})) == 2
+    assert llm_gateway.retry_delay(0, status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert llm_gateway.retry_delay(5, status_error(429, {"retry-after": "60"})) == 10
+
+
+def test_calls_beyond_the_concurrency_limit_queue_then_time_out():
+    llm_gateway = gateway(async_client=ScriptedAsyncClient(delays=[0.2, 0.2]), max_concurrency_per_api=1,
+                          queue_timeout=0.05)
+
+    async def burst():
+        return await asyncio.gather(*(llm_gateway.complete_async(MESSAGES) for _ in range(2)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(burst())
+
+    assert sum(isinstance(result, LLMOverloadedError) for result in results) == 1
+    assert llm_gateway.stats()["overloaded"] == 1
+
+
+def test_token_bucket_is_settled_with_the_actual_usage():
+    llm_gateway = gateway(tokens_per_minute=6000, completion_estimate=100)
+
+    llm_gateway.complete(MESSAGES)
+
+    assert 5970 - 1 < llm_gateway.bucket.available() <= 5970 + 1
+
+
+def test_token_bucket_makes_callers_wait_for_the_refill():
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(50) == 0
+    assert bucket.reserve(20) == pytest.approx(10, abs=0.1)
+
+
+def test_slow_calls_are_hedged_and_the_first_answer_wins():
+    async_client = ScriptedAsyncClient(delays=[1.0, 0.0])
+    llm_gateway = gateway(async_client=async_client, hedge_after=0.05, hedge_budget=1.0)
+
+    asyncio.run(llm_gateway.complete_async(MESSAGES))
+
+    assert async_client.calls == 2
+    assert (llm_gateway.hedges, llm_gateway.hedge_wins, llm_gateway.in_flight) == (1, 1, 0)
+
+
+def test_the_hedge_reservation_is_given_back():
+    async_client = ScriptedAsyncClient(delays=[1.0, 0.0])
+    llm_gateway = gateway(async_client=async_client, hedge_after=0.05, hedge_budget=1.0, tokens_per_minute=6000,
+                          completion_estimate=100)
+
+    asyncio.run(llm_gateway.complete_async(MESSAGES))
+
+    # Only the 30 tokens of the answer are taken, plus at most a second of refill at 100 tokens/s
+    assert llm_gateway.hedges == 1
+    assert 5970 - 1 < llm_gateway.bucket.available() <= 5970 + 100
@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from conftest import DATA_PATH
+
+import ingest
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+@pytest.mark.parametrize("engine", ["tfidf", "bm25"])
+def test_snapshot_round_trip(tmp_path, questions, engine):
+    index = ingest.build_index(DATA_PATH, engine)
+    index.save(str(tmp_path))
+
+    loaded = ingest.ENGINES[engine].load(str(tmp_path))
+
+    assert loaded.docs == index.docs
+    for query in questions:
+        assert ids(loaded.search(query, filter_dict={"id": "7ce8c60e"})) == ids(
+            index.search(query, filter_dict={"id": "7ce8c60e"})
+        )
+        assert ids(loaded.search(query, num_results=5)) == ids(index.search(query, num_results=5))
+
+
+def test_load_index_reuses_its_snapshot(tmp_path):
+    snapshot_dir = str(tmp_path / "snapshots")
+
+    ingest.load_index(DATA_PATH, "tfidf", snapshot_dir)
+    (name,) = os.listdir(snapshot_dir)
+    index = ingest.load_index(DATA_PATH, "tfidf", snapshot_dir)
+
+    assert os.listdir(snapshot_dir) == [name]
+    assert isinstance(index.idf, np.memmap)
+
+
+def test_snapshot_of_changed_data_is_not_reused(tmp_path):
+    data_path = str(tmp_path / "yoga_poses.csv")
+    snapshot_dir = str(tmp_path / "snapshots")
+    shutil.copy(DATA_PATH, data_path)
+    ingest.load_index(data_path, "tfidf", snapshot_dir)
+    (old_name,) = os.listdir(snapshot_dir)
+
+    with open(data_path, "a") as f:
+        f.write("zz000001,Moonlit Heron,Hatha,Classic,Standing,Beginner,Strap,Balance,Calms,Heron,Stand.,Any.\n")
+    index = ingest.load_index(data_path, "tfidf", snapshot_dir)
+
+    assert ids(index.search("moonlit heron", num_results=1)) == ["zz000001"]
+    (name,) = os.listdir(snapshot_dir)
+    assert name != old_name
+
+
+def test_corrupt_snapshot_is_rebuilt(tmp_path):
+    snapshot_dir = str(tmp_path / "snapshots")
+    ingest.load_index(DATA_PATH, "bm25", snapshot_dir)
+    path = ingest.snapshot_path(DATA_PATH, "bm25", snapshot_dir)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        f.write("{")
+
+    index = ingest.load_index(DATA_PATH, "bm25", snapshot_dir)
+
+    assert len(index.docs) == len(ingest.build_index(DATA_PATH, "bm25").docs)
+
+
+def test_snapshot_keeps_incremental_changes(tmp_path, documents):
+    index = ingest.build_index(DATA_PATH, "tfidf")
+    index.delete(documents[0]["id"])
+    index.update(documents[1]["id"], dict(documents[1], pose_name="Moonlit Heron"))
+    index.save(str(tmp_path))
+
+    loaded = ingest.ENGINES["tfidf"].load(str(tmp_path))
+
+    assert ids(loaded.search("moonlit heron")) == [documents[1]["id"]]
+    assert documents[0]["id"] not in ids(loaded.search(documents[0]["pose_name"], num_results=200))
+    loaded.add([dict(documents[0], id="zz000001")])
+    assert "zz000001" in ids(loaded.search(documents[0]["pose_name"], num_results=200))
+
+
+def test_index_status_reports_memory_mapped_snapshots(tmp_path):
+    snapshot_dir = str(tmp_path / "snapshots")
+
+    ingest.load_index(DATA_PATH, "tfidf", snapshot_dir)
+    loaded = ingest.load_index(DATA_PATH, "tfidf", snapshot_dir)
+
+    assert ingest.index_status(loaded) == {"documents": 144, "version": loaded.version, "memory_mapped": True}
+    assert not ingest.index_status(ingest.build_index(DATA_PATH, "tfidf"))["memory_mapped"]
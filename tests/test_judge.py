@@ -0,0 +1,94 @@
+import asyncio
+
+import judge
+
+
+class Recorder:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.saved = []
+        self.skipped = []
+
+    async def evaluate(self, items):
+        self.batches.append(len(items))
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        return [({"Relevance": "RELEVANT", "Explanation": f"{q} / {a}"}, {"total_tokens": 1}) for q, a in items]
+
+    async def save(self, evaluations):
+        self.saved.extend((conversation_id, relevance["Relevance"]) for conversation_id, relevance, _ in evaluations)
+
+    async def skip(self, conversation_id, reason):
+        self.skipped.append((conversation_id, reason))
+
+
+def run(recorder, conversation_ids, **params):
+    async def main():
+        queue = judge.JudgeQueue(recorder.evaluate, recorder.save, recorder.skip, **params)
+        queue.start()
+        for conversation_id in conversation_ids:
+            await queue.submit(conversation_id, "question", "answer")
+        await queue.stop(timeout=1)
+        return queue.stats()
+
+    return asyncio.run(main())
+
+
+def test_queued_conversations_are_evaluated_and_saved():
+    recorder = Recorder()
+
+    stats = run(recorder, ["a", "b", "c", "d", "e"], n_workers=1, batch_size=2, batch_wait=0.01)
+
+    assert recorder.saved == [(conversation_id, "RELEVANT") for conversation_id in "abcde"]
+    assert recorder.skipped == []
+    assert recorder.batches == [2, 2, 1]
+    assert (stats["submitted"], stats["batches"], stats["judged"], stats["queued"]) == (5, 3, 5, 0)
+
+
+def test_conversations_of_a_failed_batch_are_skipped():
+    recorder = Recorder(fail=True)
+
+    stats = run(recorder, ["a", "b", "c"], n_workers=1, batch_size=2, batch_wait=0.01)
+
+    assert recorder.saved == []
+    assert sorted(conversation_id for conversation_id, _ in recorder.skipped) == ["a", "b", "c"]
+    assert all("LLM unavailable" in reason for _, reason in recorder.skipped)
+    assert (stats["failed"], stats["queued"]) == (3, 0)
+
+
+def test_conversations_submitted_while_not_running_are_skipped():
+    recorder = Recorder()
+
+    async def main():
+        queue = judge.JudgeQueue(recorder.evaluate, recorder.save, recorder.skip)
+        queued = [await queue.submit("a", "question", "answer")]
+        queue.start()
+        await queue.stop(timeout=1)
+        queued.append(await queue.submit("b", "question", "answer"))
+        return queued, queue.stats()
+
+    queued, stats = asyncio.run(main())
+
+    assert queued == [False, False]
+    assert recorder.skipped == [("a", "Judge queue not running"), ("b", "Judge queue not running")]
+    assert (stats["submitted"], stats["queued"]) == (0, 0)
+
+
+def test_overflow_drops_the_new_or_the_oldest_conversation():
+    # Without workers the queue stays full after the first conversation
+    for overflow, dropped in (("drop_new", "b"), ("drop_oldest", "a")):
+        recorder = Recorder()
+
+        stats = run(recorder, ["a", "b"], n_workers=0, maxsize=1, overflow=overflow)
+
+        assert recorder.skipped == [(dropped, "Judge queue full")]
+        assert stats["dropped"] == 1
+
+
+def test_sampling_skips_conversations():
+    queue = judge.JudgeQueue(None, None, None, sample_rate=0)
+
+    assert queue.should_judge() == judge.SKIPPED
+    assert queue.stats()["sampled_out"] == 1
+    assert judge.JudgeQueue(None, None, None, sample_rate=1).should_judge() == judge.PENDING
@@ -0,0 +1,48 @@
+import pytest
+
+from metrics import Registry, timed
+
+
+def test_registry_renders_counters_histograms_and_stats():
+    registry = Registry()
+    answers = registry.counter("answers_total", "Answers", ["path"])
+    seconds = registry.histogram("seconds", "Seconds", buckets=(0.1, 1))
+    registry.add_stats("cache", lambda: {"hits": 3, "entries": 2, "name": "lru"}, gauges=["entries"])
+
+    answers.inc(path='say "hi"')
+    answers.inc(2, path='say "hi"')
+    for value in (0.05, 0.5, 5):
+        seconds.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP answers_total Answers",
+        "# TYPE answers_total counter",
+        'answers_total{path="say \\"hi\\""} 3',
+        "# HELP seconds Seconds",
+        "# TYPE seconds histogram",
+        'seconds_bucket{le="0.1"} 1',
+        'seconds_bucket{le="1.0"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        "seconds_sum 5.55",
+        "seconds_count 3",
+        "# TYPE cache_hits_total counter",
+        "cache_hits_total 3",
+        "# TYPE cache_entries gauge",
+        "cache_entries 2",
+    ]
+
+
+def test_labels_must_match_the_metric():
+    answers = Registry().counter("answers_total", "Answers", ["path"])
+
+    with pytest.raises(ValueError):
+        answers.inc(kind="llm")
+
+
+def test_timed_adds_up_the_seconds_of_a_stage():
+    stage_times = {}
+    for _ in range(2):
+        with timed(stage_times, "search"):
+            pass
+
+    assert list(stage_times) == ["search"] and stage_times["search"] >= 0
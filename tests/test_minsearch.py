@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+from conftest import TEXT_FIELDS
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+import minsearch
+
+BOOST = {"pose_name": 1.8, "variation": 0.4, "position": 2.1, "instructions": 0, "benefits": 0.5}
+
+
+def per_field_scorer(documents):
+    # The scoring of minsearch.Index before the fields were fused: one cosine similarity per field
+    fields = []
+    for field in TEXT_FIELDS:
+        vectorizer = TfidfVectorizer()
+        fields.append((field, vectorizer, vectorizer.fit_transform([doc.get(field, "") for doc in documents])))
+
+    def score(query, boost_dict):
+        scores = np.zeros(len(documents))
+        for field, vectorizer, matrix in fields:
+            sim = cosine_similarity(vectorizer.transform([query]), matrix).flatten()
+            scores += sim * boost_dict.get(field, 1)
+        return scores
+
+    return score
+
+
+@pytest.mark.parametrize("boost_dict", [{}, BOOST])
+def test_fused_scores_match_per_field_scores(documents, questions, boost_dict):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    score = per_field_scorer(documents)
+    rows = {doc["id"]: row for row, doc in enumerate(documents)}
+
+    for query in questions:
+        expected = score(query, boost_dict)
+        results = index.search(query, boost_dict=boost_dict, num_results=10)
+
+        top = np.sort(expected[expected > 0])[::-1][:10]
+        np.testing.assert_allclose(expected[[rows[doc["id"]] for doc in results]], top, rtol=1e-9)
+
+
+def test_query_without_known_terms_returns_nothing(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+
+    assert index.search("zzzz qqqq") == []
+
+
+def test_keyword_filter(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+
+    doc = documents[5]
+
+    results = index.search(doc["pose_name"], filter_dict={"id": doc["id"]})
+
+    assert results == [doc]
+
+
+def test_ties_are_broken_by_document_position():
+    docs = [{"id": str(i), "pose_name": "Tree"} for i in range(5)]
+    index = minsearch.Index(["pose_name"], ["id"]).fit(docs)
+
+    assert [doc["id"] for doc in index.search("tree", num_results=3)] == ["0", "1", "2"]
+
+
+@pytest.mark.parametrize("filter_dict", [{}, {"id": "7ce8c60e"}])
+def test_search_batch_matches_search(documents, questions, filter_dict):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+
+    batch = index.search_batch(questions, filter_dict=filter_dict, boost_dict=BOOST, num_results=5)
+
+    for query, results in zip(questions, batch):
+        assert results == index.search(query, filter_dict=filter_dict, boost_dict=BOOST, num_results=5)
+
+
+def test_search_batch_of_no_queries(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+
+    assert index.search_batch([]) == []
+
+
+def assert_same_rankings(index, expected, queries):
+    for query in queries:
+        assert ids(index.search(query, boost_dict=BOOST)) == ids(expected.search(query, boost_dict=BOOST))
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_add_then_refresh_matches_a_refit(documents, questions):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents[:100])
+    index.add(documents[100:])
+    index.refresh()
+
+    assert_same_rankings(index, minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents), questions)
+
+
+def test_delete_then_compact_matches_a_refit(documents, questions):
+    deleted = {doc["id"] for doc in documents[::7]}
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    for doc_id in deleted:
+        index.delete(doc_id)
+
+    for query in questions:
+        assert not deleted & set(ids(index.search(query, num_results=20)))
+    # Terms left only in deleted rows keep their columns, and their weight in the query norm, until compact
+    index.compact()
+    remaining = [doc for doc in documents if doc["id"] not in deleted]
+    assert_same_rankings(index, minsearch.Index(TEXT_FIELDS, ["id"]).fit(remaining), questions)
+
+
+def test_update_then_compact_matches_a_refit(documents, questions):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    updated = dict(documents[3], pose_name="Moonlit Heron", props_required="Yoga Wheel")
+    index.update(updated["id"], updated)
+
+    assert ids(index.search("moonlit heron")) == [updated["id"]]
+    index.compact()
+    expected = [doc for doc in documents if doc["id"] != updated["id"]] + [updated]
+    assert index.docs == expected
+    assert_same_rankings(index, minsearch.Index(TEXT_FIELDS, ["id"]).fit(expected), questions + ["moonlit heron"])
+
+
+def test_refresh_runs_once_changes_exceed_the_ratio(documents):
+    index = minsearch.Index(TEXT_FIELDS, ["id"], idf_refresh_ratio=0.1).fit(documents[:100])
+    idf = index.idf.copy()
+
+    index.add(documents[100:105])
+    assert np.array_equal(index.idf[:len(idf)], idf)
+    index.add(documents[105:120])
+    assert not np.array_equal(index.idf[:len(idf)], idf)
+
+
+def test_low_memory_mode_gives_the_same_rankings_in_less_memory(documents, questions):
+    index = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents)
+    compact = minsearch.Index(TEXT_FIELDS, ["id"], low_memory=True).fit(documents)
+
+    assert compact.text_matrix.dtype == np.float32
+    assert_same_rankings(compact, index, questions)
+    assert compact.memory_report()["total"] < index.memory_report()["total"]
+
+
+def test_low_memory_index_supports_changes_and_snapshots(tmp_path, documents, questions):
+    index = minsearch.Index(TEXT_FIELDS, ["id"], low_memory=True).fit(documents[:100])
+    index.add(documents[100:])
+    index.delete(documents[0]["id"])
+    index.update(documents[1]["id"], dict(documents[1], pose_name="Moonlit Heron"))
+    index.compact()
+    index.save(str(tmp_path))
+
+    loaded = minsearch.Index.load(str(tmp_path))
+
+    expected = documents[2:] + [dict(documents[1], pose_name="Moonlit Heron")]
+    assert isinstance(loaded.docs, minsearch.DocumentStore)
+    assert list(loaded.docs) == expected
+    assert ids(loaded.search("moonlit heron")) == [documents[1]["id"]]
+    assert_same_rankings(loaded, minsearch.Index(TEXT_FIELDS, ["id"]).fit(expected), questions)
+
+
+def test_document_store_round_trips_mixed_fields():
+    docs = [{"id": "a", "n": 1, "x": 0.5, "tags": ["t"]}, {"id": "b", "n": 2, "x": 1.5}, {"id": "ü", "n": 3}]
+
+    store = minsearch.DocumentStore(docs)
+
+    assert list(store) == docs
+    assert list(store + [{"id": "c", "n": 4, "x": 2.5}]) == docs + [{"id": "c", "n": 4, "x": 2.5}]
+    assert list(store.take(np.array([2, 0]))) == [docs[2], docs[0]]
+
+
+def test_memory_report_covers_every_component(documents):
+    report = minsearch.Index(TEXT_FIELDS, ["id"]).fit(documents).memory_report()
+
+    assert report["total"] == sum(size for name, size in report.items() if name != "total")
+    assert all(report[name] > 0 for name in ("text_matrix", "vocabulary", "docs", "keyword_index"))
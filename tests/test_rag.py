@@ -0,0 +1,256 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import rag
+from cache import AnswerCache
+from fastpath import FastPath
+
+
+def completion(content, prompt_tokens=100, completion_tokens=20):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+def reply(messages):
+    prompt = messages[0]["content"]
+    if prompt.startswith("You are an expert evaluator"):
+        return completion(json.dumps({"Relevance": "RELEVANT", "Explanation": "Fine"}), 50, 10)
+    return completion("Tree pose builds balance.")
+
+
+class FakeClient:
+    def __init__(self):
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages):
+        self.prompts.append(messages[0]["content"])
+        return reply(messages)
+
+
+async def stream_chunks(response):
+    # Streamed like the API with include_usage: one chunk per word, then a chunk with the usage only
+    for word in response.choices[0].message.content.split(" "):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+    yield SimpleNamespace(choices=[], usage=response.usage)
+
+
+class FakeAsyncClient(FakeClient):
+    async def create(self, model, messages, stream=False, stream_options=None):
+        self.prompts.append(messages[0]["content"])
+        if stream:
+            return stream_chunks(reply(messages))
+        return reply(messages)
+
+
+def without_timings(answer_data):
+    return {
+        key: value for key, value in answer_data.items() if not key.endswith("_time") and key != "time_to_first_token"
+    }
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    client, async_client = FakeClient(), FakeAsyncClient()
+    rag.load()
+    monkeypatch.setattr(rag.gateway, "_client", client)
+    monkeypatch.setattr(rag.gateway, "_async_client", async_client)
+    # Every test starts without cached answers or the fast path, so that the LLM is called
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(rag.index, maxsize=0))
+    monkeypatch.setattr(rag, "fast_path", None)
+    return client, async_client
+
+
+def test_rag_async_answers_like_rag(fake_openai):
+    client, async_client = fake_openai
+    question = "What are the benefits of Tree pose?"
+
+    expected = rag.rag(question)
+    answer_data = asyncio.run(rag.rag_async(question))
+
+    assert async_client.prompts == client.prompts
+    assert answer_data["answer"] == "Tree pose builds balance."
+    assert answer_data["relevance"] == "RELEVANT"
+    assert without_timings(answer_data) == without_timings(expected)
+
+
+def test_rag_async_builds_the_prompt_off_the_event_loop(fake_openai, monkeypatch):
+    threads = []
+    retrieve = rag.retrieve
+
+    def recording_retrieve(query, stage_times):
+        threads.append(threading.current_thread())
+        return retrieve(query, stage_times)
+
+    monkeypatch.setattr(rag, "retrieve", recording_retrieve)
+    asyncio.run(rag.rag_async("Tree pose"))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert threads[0].name.startswith("search")
+
+
+def test_rag_stream_yields_tokens_then_the_answer_data(fake_openai):
+    async def collect():
+        return [event async for event in rag.rag_stream("What are the benefits of Tree pose?")]
+
+    events = asyncio.run(collect())
+
+    tokens = [event["token"] for event in events[:-1]]
+    answer_data = events[-1]["answer_data"]
+    assert tokens == ["Tree ", "pose ", "builds ", "balance. "]
+    assert answer_data["answer"] == "".join(tokens)
+    assert (answer_data["prompt_tokens"], answer_data["completion_tokens"]) == (100, 20)
+    assert answer_data["relevance"] == "RELEVANT"
+    assert 0 < answer_data["time_to_first_token"] <= answer_data["generation_time"] <= answer_data["response_time"]
+    assert all(answer_data[f"{stage}_time"] > 0 for stage in rag.STAGES)
+
+
+def test_repeated_questions_are_answered_from_the_cache(fake_openai, monkeypatch):
+    client, async_client = fake_openai
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(rag.index))
+    question = "What are the benefits of Tree pose?"
+
+    first = asyncio.run(rag.rag_async(question, evaluate=False))
+    second = asyncio.run(rag.rag_async(question.lower(), evaluate=False))
+
+    assert len(async_client.prompts) == 1
+    assert (first["cache_hit"], second["cache_hit"]) == (None, "exact")
+    assert second["answer"] == first["answer"]
+    assert (second["prompt_tokens"], second["completion_tokens"]) == (0, 0)
+
+
+def test_persistent_answers_are_awaited_outside_the_search_threads(fake_openai, monkeypatch):
+    client, async_client = fake_openai
+    stored, threads = {}, []
+
+    async def save(key, *row):
+        threads.append(threading.current_thread().name)
+        stored[key] = row[-1]
+
+    async def load(key):
+        threads.append(threading.current_thread().name)
+        return stored.get(key)
+
+    question = "What are the benefits of Tree pose?"
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(rag.index, load=load, save=save))
+    first = asyncio.run(rag.rag_async(question, evaluate=False))
+    # A restarted worker only has the persistent tier
+    monkeypatch.setattr(rag, "answer_cache", AnswerCache(rag.index, load=load, save=save))
+    second = asyncio.run(rag.rag_async(question, evaluate=False))
+
+    assert len(async_client.prompts) == 1
+    assert (second["answer"], second["cache_hit"]) == (first["answer"], "exact")
+    assert len(threads) == 3 and not any(name.startswith("search") for name in threads)
+
+
+def test_lookup_questions_are_answered_from_the_catalog(fake_openai, monkeypatch):
+    client, async_client = fake_openai
+    monkeypatch.setattr(rag, "fast_path", FastPath(rag.index))
+
+    answer_data = asyncio.run(rag.rag_async("What is the difficulty of Tree Pose with a strap?", evaluate=False))
+
+    assert async_client.prompts == []
+    assert answer_data["answer"] == "Tree Pose (With Strap) is rated Beginner."
+    assert (answer_data["answer_path"], answer_data["total_tokens"]) == ("fastpath", 0)
+
+
+def test_parse_batch_evaluation_keeps_only_valid_entries():
+    evaluation = json.dumps([
+        {"id": 1, "Relevance": "RELEVANT", "Explanation": "ok"},
+        {"id": 1, "Relevance": "NON_RELEVANT", "Explanation": "duplicate"},
+        {"id": 2, "Relevance": "MAYBE", "Explanation": "unknown label"},
+        {"id": 5, "Relevance": "RELEVANT", "Explanation": "out of range"},
+        {"id": "3", "Relevance": "RELEVANT", "Explanation": "not an int"},
+    ])
+
+    assert rag.parse_batch_evaluation(evaluation, 3) == [{"Relevance": "RELEVANT", "Explanation": "ok"}, None, None]
+    assert rag.parse_batch_evaluation("not json", 2) == [None, None]
+
+
+def test_split_token_stats_adds_up_to_the_totals():
+    shares = rag.split_token_stats({"prompt_tokens": 101, "completion_tokens": 7, "total_tokens": 108}, 3)
+
+    assert sum(share["prompt_tokens"] for share in shares) == 101
+    assert sum(share["completion_tokens"] for share in shares) == 7
+    assert all(share["total_tokens"] == share["prompt_tokens"] + share["completion_tokens"] for share in shares)
+
+
+def test_batch_evaluation_falls_back_to_single_calls_for_missing_items(monkeypatch):
+    prompts = []
+
+    async def fake_llm_async(prompt, model="gpt-4o-mini"):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            evaluation = [{"id": 1, "Relevance": "PARTLY_RELEVANT", "Explanation": "batch"}]
+        else:
+            evaluation = {"Relevance": "RELEVANT", "Explanation": "single"}
+        return json.dumps(evaluation), {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+
+    monkeypatch.setattr(rag, "llm_async", fake_llm_async)
+    results = asyncio.run(rag.evaluate_relevance_batch_async([("q1", "a1"), ("q2", "a2")]))
+
+    assert len(prompts) == 2
+    assert [relevance["Explanation"] for relevance, _ in results] == ["batch", "single"]
+    assert results[0][1] == {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+    assert results[1][1] == {"prompt_tokens": 15, "completion_tokens": 3, "total_tokens": 18}
+
+
+def test_retrieve_batch_matches_retrieve(fake_openai):
+    questions = ["What are the benefits of Tree pose?", "How do I do Crow pose?", "Poses for back pain"]
+
+    retrieved = rag.retrieve_batch(questions, [{} for _ in questions])
+
+    assert retrieved == [rag.retrieve(question) for question in questions]
+
+
+def test_rag_batch_answers_every_question_with_bounded_concurrency(fake_openai, monkeypatch):
+    in_flight = [0, 0]
+
+    async def fake_llm_async(prompt, model="gpt-4o-mini"):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        if "Crow" in prompt.split("QUESTION:")[1].split("CONTEXT:")[0]:
+            raise RuntimeError("LLM unavailable")
+        return "Tree pose builds balance.", rag.usage_stats(None)
+
+    monkeypatch.setattr(rag, "llm_async", fake_llm_async)
+    questions = [f"Question {i} about Tree pose" for i in range(6)] + ["How do I do Crow pose?"]
+
+    async def collect():
+        return [result async for result in rag.rag_batch(questions, concurrency=2)]
+
+    results = sorted(asyncio.run(collect()), key=lambda result: result[0])
+
+    assert [position for position, _, _ in results] == list(range(7))
+    assert all(answer_data["answer"] == "Tree pose builds balance." for _, answer_data, _ in results[:6])
+    assert (results[6][1], str(results[6][2])) == (None, "LLM unavailable")
+    assert in_flight[1] == 2
+
+
+def test_concurrent_identical_questions_share_one_answer(fake_openai):
+    client, async_client = fake_openai
+
+    async def burst():
+        return await asyncio.gather(
+            rag.rag_async("What are the benefits of Tree pose?", evaluate=False),
+            rag.rag_async("what are the benefits of tree pose", evaluate=False),
+        )
+
+    leader, follower = asyncio.run(burst())
+
+    assert len(async_client.prompts) == 1
+    assert follower["answer"] == leader["answer"]
+    assert (leader["answer_path"], follower["answer_path"]) == ("llm", "coalesced")
+    assert (follower["total_tokens"], follower["openai_cost"]) == (0, 0.0)
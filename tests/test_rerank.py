@@ -0,0 +1,55 @@
+import numpy as np
+
+from rerank import FEATURES, Reranker, train
+
+
+def candidates(index, question):
+    return index.search(question, num_results=30, output_scores=True)
+
+
+def test_cutoff_keeps_results_close_to_the_best(index):
+    reranker = Reranker(index, max_results=3, min_results=2, min_ratio=0.5)
+
+    assert reranker.cutoff(np.array([0.9, 0.5, 0.4, 0.3])) == 2
+    assert reranker.cutoff(np.array([0.9, 0.1])) == 2
+    assert reranker.cutoff(np.array([0.9, 0.8, 0.8, 0.8])) == 3
+    assert reranker.cutoff(np.array([])) == 0
+
+
+def test_rerank_orders_by_probability_and_promotes_the_named_pose(index):
+    reranker = Reranker(index, min_ratio=0)
+    results = candidates(index, "What are the benefits of Crow Pose?")
+
+    reranked = reranker.rerank("What are the benefits of Crow Pose?", results)
+    probabilities = [probability for _, probability in reranked]
+
+    assert len(reranked) == 10
+    assert probabilities == sorted(probabilities, reverse=True)
+    assert all(0 < probability < 1 for probability in probabilities)
+    assert reranked[0][0]["pose_name"] == "Crow Pose"
+
+
+def test_features_follow_document_changes(documents, index):
+    reranker = Reranker(index)
+    doc = documents[0]
+    before = reranker.features("moonlit heron", [(doc, 1.0)])
+
+    index.update(doc["id"], dict(doc, pose_name="Moonlit Heron"))
+    after = reranker.features("moonlit heron", [(dict(doc, pose_name="Moonlit Heron"), 1.0)])
+
+    pose_exact = FEATURES.index("pose_exact")
+    assert (before[0, pose_exact], after[0, pose_exact]) == (0.0, 1.0)
+
+
+def test_train_sets_the_fitted_weights_on_the_reranker(documents, index):
+    reranker = Reranker(index, min_ratio=0)
+    examples = []
+    for doc in documents[::12]:
+        question = f"{doc['pose_name']} {doc['variation']} {doc['props_required']}"
+        examples.append((question, candidates(index, question), doc["id"]))
+
+    weights = train(reranker, examples)
+
+    assert set(weights) == {"bias", *FEATURES}
+    assert reranker.weights is weights
+    assert weights["pose_exact"] > 0
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import ingest
+import minsearch
+from sharding import ShardedIndex
+
+BOOST = {"pose_name": 1.8, "variation": 0.4, "position": 2.1, "instructions": 0, "benefits": 0.5}
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+@pytest.mark.parametrize("filter_dict", [{}, {"difficulty": "Beginner"}])
+def test_sharded_results_match_a_single_index(documents, questions, filter_dict):
+    single = minsearch.Index(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS).fit(documents)
+
+    with ShardedIndex(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS, n_shards=3).fit(documents) as sharded:
+        batch = sharded.search_batch(questions, filter_dict, BOOST)
+        top_k = sharded.top_k(questions, filter_dict, BOOST)
+
+    expected = single.search_batch(questions, filter_dict, BOOST)
+    assert [ids(results) for results in batch] == [ids(results) for results in expected]
+    for (rows, scores), (expected_rows, expected_scores) in zip(top_k, single.top_k(questions, filter_dict, BOOST)):
+        assert rows.tolist() == expected_rows.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-9)
+
+
+def test_vocabulary_pruning_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        ShardedIndex(ingest.TEXT_FIELDS, ingest.KEYWORD_FIELDS, vectorizer_params={"min_df": 2})
@@ -0,0 +1,302 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from time import monotonic
+
+from gateway import TokenBucket
+
+# Requests answered at once per process, 0 for no limit. Further requests wait in a queue of at most
+# ADMISSION_MAX_QUEUE, for at most ADMISSION_QUEUE_TIMEOUT seconds.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# LLM tokens per minute per client, 0 for no limit. Every question reserves ADMISSION_TOKEN_ESTIMATE tokens,
+# corrected with the actual usage once it is answered.
+CLIENT_TOKENS_PER_MINUTE = int(os.getenv("CLIENT_TOKENS_PER_MINUTE", "0"))
+ADMISSION_TOKEN_ESTIMATE = int(os.getenv("ADMISSION_TOKEN_ESTIMATE", "1000"))
+# Clients whose token buckets are kept, the least recently seen are forgotten
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+
+# Weight of the latest request in the moving average of the time a request holds its slot
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of being answered.
+
+    Attributes:
+        status_code (int): 429 when the client exceeded its token budget, 503 when the process is overloaded.
+        reason (str): 'rate_limited', 'queue_full' or 'deadline'.
+        retry_after (float): Seconds after which the request may succeed.
+    """
+
+    def __init__(self, status_code, reason, retry_after, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    An admitted request.
+
+    Attributes:
+        client (str): The client identifier.
+        charged (int): Tokens reserved from the client's budget.
+        used (int): Tokens the request actually used. When set before the ticket is released, the client's
+            budget is corrected with it, otherwise the reservation is kept.
+        wait (float): Seconds the request waited in the queue.
+    """
+
+    def __init__(self, client, charged):
+        self.client = client
+        self.charged = charged
+        self.used = None
+        self.wait = 0.0
+        self.started = monotonic()
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Decides which requests are answered, so that a traffic spike is shed early instead of piling up behind
+    the LLM until clients time out.
+
+    * A client over its budget of LLM tokens per minute is rejected at once with 429. The budget is a token
+      bucket per client, like the one the LLM gateway keeps for the whole process.
+    * At most max_in_flight requests are answered at once. Further requests wait in line, first come first
+      served, in a queue of at most max_queue. A request arriving to a full queue is rejected with 503.
+    * Every queued request has a deadline to start: queue_timeout seconds, or less when the client says how
+      long it waits and the usual time to answer would exceed it. A request that would not start in time
+      given the queue ahead of it is rejected with 503 right away, and one whose deadline passes in the
+      queue is dropped with 503 instead of being answered for a client that gave up.
+
+    Rejections carry a Retry-After estimate: the refill time of the token bucket, or the time to drain the
+    queue. Must be used from a single event loop.
+
+    Attributes:
+        max_in_flight (int): Requests answered at once. 0 for no limit.
+        max_queue (int): Requests waiting at most.
+        queue_timeout (float): Seconds a request may wait in the queue.
+        tokens_per_minute (int): LLM tokens per minute per client. 0 for no limit.
+        token_estimate (int): Tokens reserved per question.
+        max_clients (int): Client buckets kept.
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, tokens_per_minute=CLIENT_TOKENS_PER_MINUTE,
+                 token_estimate=ADMISSION_TOKEN_ESTIMATE, max_clients=ADMISSION_MAX_CLIENTS):
+        """
+        Initializes the controller.
+
+        Args:
+            max_in_flight (int): Requests answered at once, 0 for no limit. Defaults to ADMISSION_MAX_IN_FLIGHT.
+            max_queue (int): Requests waiting at most. Defaults to ADMISSION_MAX_QUEUE.
+            queue_timeout (float): Seconds a request may wait. Defaults to ADMISSION_QUEUE_TIMEOUT.
+            tokens_per_minute (int): Tokens per minute per client, 0 for no limit. Defaults to
+                CLIENT_TOKENS_PER_MINUTE.
+            token_estimate (int): Tokens reserved per question. Defaults to ADMISSION_TOKEN_ESTIMATE.
+            max_clients (int): Client buckets kept. Defaults to ADMISSION_MAX_CLIENTS.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tokens_per_minute = tokens_per_minute
+        self.token_estimate = token_estimate
+        self.max_clients = max_clients
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.expired = 0
+        self.in_flight = 0
+        self.queue_wait = 0.0
+        self.service_time = None
+
+        self._queue = deque()
+        self._buckets = OrderedDict()
+
+    def _bucket(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.tokens_per_minute)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def _charge(self, client, questions):
+        # Reserves the estimated tokens of the questions, or rejects the client until its bucket refills
+        if self.tokens_per_minute <= 0:
+            return 0
+        bucket = self._bucket(client)
+        tokens = min(questions * self.token_estimate, self.tokens_per_minute)
+        missing = tokens - bucket.available()
+        if missing > 0:
+            self.rate_limited += 1
+            raise AdmissionRejected(
+                429, "rate_limited", missing * 60 / self.tokens_per_minute,
+                f"Client {client} is over its budget of {self.tokens_per_minute} tokens per minute",
+            )
+        bucket.reserve(tokens)
+        return tokens
+
+    def _refund(self, ticket, tokens):
+        if ticket.charged and ticket.client in self._buckets:
+            self._buckets[ticket.client].adjust(tokens - ticket.charged)
+
+    def expected_wait(self, position):
+        """
+        Returns the seconds a request queued at position (from 0) is expected to wait, from the average time
+        requests hold their slot. 0 until a request was answered.
+        """
+        if self.service_time is None or self.max_in_flight <= 0:
+            return 0.0
+        return (position + 1) * self.service_time / self.max_in_flight
+
+    def _overloaded(self, reason, message):
+        if reason == "queue_full":
+            self.shed_queue_full += 1
+        else:
+            self.shed_deadline += 1
+        retry_after = max(1.0, self.expected_wait(len(self._queue)))
+        return AdmissionRejected(503, reason, retry_after, message)
+
+    async def acquire(self, client, questions=1, timeout=None):
+        """
+        Admits a request, waiting in the queue when the process is busy.
+
+        Args:
+            client (str): The client identifier, e.g. its address.
+            questions (int): Questions in the request, each reserving token_estimate tokens. Defaults to 1.
+            timeout (float): Seconds the client waits for the answer, None when unknown.
+
+        Returns:
+            Ticket: The admitted request, to be released once answered.
+
+        Raises:
+            AdmissionRejected: When the request is shed.
+        """
+        charged = self._charge(client, questions)
+        ticket = Ticket(client, charged)
+        try:
+            await self._enter(timeout)
+        except BaseException:
+            self._refund(ticket, 0)
+            raise
+        ticket.wait = monotonic() - ticket.started
+        ticket.started = monotonic()
+        self.queue_wait += ticket.wait
+        self.admitted += 1
+        return ticket
+
+    async def _enter(self, timeout):
+        if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self._queue):
+            self.in_flight += 1
+            return
+
+        if len(self._queue) >= self.max_queue:
+            raise self._overloaded("queue_full", f"{len(self._queue)} requests are already waiting")
+
+        # The latest start that still lets the client get its answer in time
+        budget = self.queue_timeout
+        if timeout is not None:
+            budget = min(budget, timeout - (self.service_time or 0.0))
+        if budget <= 0 or self.expected_wait(len(self._queue)) > budget:
+            raise self._overloaded("deadline", f"The request would not start within {max(budget, 0):.1f} s")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, monotonic() + budget)
+        self._queue.append(entry)
+        try:
+            admitted = await asyncio.wait_for(waiter, budget)
+        except asyncio.TimeoutError:
+            admitted = False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                # The slot was handed over just as the client went away
+                self._leave()
+            raise
+        finally:
+            if entry in self._queue:
+                self._queue.remove(entry)
+        if not admitted:
+            raise self._overloaded("deadline", f"The request did not start within {budget:.1f} s")
+
+    def _leave(self):
+        # Hands the slot over to the first waiter whose deadline has not passed
+        while self._queue:
+            waiter, deadline = self._queue.popleft()
+            if waiter.done():
+                continue
+            if monotonic() > deadline:
+                self.expired += 1
+                waiter.set_result(False)
+                continue
+            waiter.set_result(True)
+            return
+        self.in_flight -= 1
+
+    def release(self, ticket):
+        """
+        Frees the slot of an admitted request and corrects its client's budget with ticket.used. Releasing a
+        ticket again does nothing.
+
+        Args:
+            ticket (Ticket): The ticket returned by acquire.
+        """
+        if ticket.released:
+            return
+        ticket.released = True
+        held = monotonic() - ticket.started
+        if self.service_time is None:
+            self.service_time = held
+        else:
+            self.service_time += SERVICE_TIME_SMOOTHING * (held - self.service_time)
+        if ticket.used is not None:
+            self._refund(ticket, ticket.used)
+        if self.max_in_flight <= 0:
+            self.in_flight -= 1
+        else:
+            self._leave()
+
+    @asynccontextmanager
+    async def admit(self, client, questions=1, timeout=None):
+        """
+        Admits a request for the duration of the block, see acquire.
+
+        Yields:
+            Ticket: The admitted request.
+        """
+        ticket = await self.acquire(client, questions, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        """
+        Returns the admission counters.
+
+        Returns:
+            dict: Requests admitted, rate limited, shed because the queue was full or they could not start
+            in time, and dropped from the queue past their deadline, requests in flight and queued, clients
+            tracked, the mean queue wait of admitted requests and the average time a request holds its slot.
+        """
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+            "expired": self.expired,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "clients": len(self._buckets),
+            "mean_queue_wait": self.queue_wait / self.admitted if self.admitted else 0.0,
+            "service_time": self.service_time or 0.0,
+        }
@@ -1,21 +1,267 @@
+import asyncio
+import json
+import math
+import os
 import uuid
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from rag import rag
+from rag import (
+    ANSWER_CACHE_PG, STAGES, calculate_openai_cost, evaluate_relevance_batch_async, gateway, rag_async,
+    rag_batch, rag_stream, single_flight,
+)
+from admission import AdmissionController, AdmissionRejected
 import db
+import judge
+import metrics
+import rag
 
-app = FastAPI()
+JUDGE_MODEL = "gpt-4o-mini"
+# Most questions accepted by one /questions request
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+
+
+registry = metrics.Registry()
+stage_seconds = registry.histogram(
+    "yoga_stage_seconds", "Seconds spent in each stage of answering a question", ["stage"]
+)
+request_seconds = registry.histogram(
+    "yoga_request_seconds", "Seconds to answer a question, by endpoint and answer path", ["endpoint", "answer_path"]
+)
+answers_total = registry.counter("yoga_answers_total", "Questions answered, by answer path", ["answer_path"])
+tokens_total = registry.counter(
+    "yoga_tokens_total", "OpenAI tokens, by purpose (answer or evaluation) and kind", ["purpose", "kind"]
+)
+cost_total = registry.counter("yoga_openai_cost_dollars_total", "OpenAI cost in dollars, by purpose", ["purpose"])
+errors_total = registry.counter("yoga_errors_total", "Requests failed with an unhandled error", ["endpoint"])
+admission_wait_seconds = registry.histogram(
+    "yoga_admission_wait_seconds", "Seconds admitted requests waited in the admission queue", ["endpoint"]
+)
+shed_total = registry.counter(
+    "yoga_shed_total", "Requests rejected by admission control, by endpoint and reason", ["endpoint", "reason"]
+)
+
+
+def loaded_stats(name):
+    # The stats of an object rag builds when it loads the index, none until then
+    return lambda: getattr(rag, name).stats() if rag.is_loaded() else {}
+
+
+registry.add_stats("yoga_search_cache", loaded_stats("search_cache"), gauges=["entries", "bytes"])
+if rag.SEARCH_MODE in ("dense", "hybrid"):
+    registry.add_stats("yoga_dense_cache", loaded_stats("dense_cache"), gauges=["entries", "bytes"])
+registry.add_stats("yoga_answer_cache", loaded_stats("answer_cache"), gauges=["entries", "bytes"])
+registry.add_stats("yoga_llm", gateway.stats, gauges=["in_flight", "mean_queue_wait"])
+registry.add_stats("yoga_single_flight", single_flight.stats, gauges=["in_flight", "coalesced_ratio"])
+
+
+def record_answer(endpoint, answer_data):
+    for stage in STAGES:
+        seconds = answer_data.get(f"{stage}_time")
+        if seconds is not None:
+            stage_seconds.observe(seconds, stage=stage)
+    request_seconds.observe(answer_data["response_time"], endpoint=endpoint, answer_path=answer_data["answer_path"])
+    answers_total.inc(answer_path=answer_data["answer_path"])
+    record_tokens("answer", answer_data["model_used"], {
+        "prompt_tokens": answer_data["prompt_tokens"],
+        "completion_tokens": answer_data["completion_tokens"],
+    })
+    record_tokens("evaluation", JUDGE_MODEL, {
+        "prompt_tokens": answer_data["eval_prompt_tokens"],
+        "completion_tokens": answer_data["eval_completion_tokens"],
+    })
+
+
+def record_tokens(purpose, model, tokens):
+    tokens_total.inc(tokens["prompt_tokens"], purpose=purpose, kind="prompt")
+    tokens_total.inc(tokens["completion_tokens"], purpose=purpose, kind="completion")
+    cost_total.inc(calculate_openai_cost(model, tokens), purpose=purpose)
+
+
+async def evaluate_batch(items):
+    # The background judge, timed per batch
+    with stage_seconds.time(stage="evaluate_relevance"):
+        return await evaluate_relevance_batch_async(items)
+
+
+async def save_evaluations(evaluations):
+    for _, _, tokens in evaluations:
+        record_tokens("evaluation", JUDGE_MODEL, tokens)
+    await timed_db_write(db.update_evaluations_async([
+        (
+            conversation_id,
+            relevance.get("Relevance", "UNKNOWN"),
+            relevance.get("Explanation", "Failed to parse evaluation"),
+            tokens,
+            calculate_openai_cost(JUDGE_MODEL, tokens),
+        )
+        for conversation_id, relevance, tokens in evaluations
+    ]))
+
+
+async def timed_db_write(write):
+    # Awaits a database coroutine, timed as the db_write stage
+    with stage_seconds.time(stage="db_write"):
+        return await write
+
+
+async def skip_evaluation(conversation_id, reason):
+    await db.update_relevance_async(conversation_id, judge.SKIPPED, reason)
+
+
+# The persistent tier of the answer cache lives next to the conversations
+if ANSWER_CACHE_PG:
+    rag.answer_cache_load = db.get_cached_answer_async
+    rag.answer_cache_save = db.save_cached_answer_async
+
+# The LLM judge runs in the background, answers are returned without waiting for it
+judge_queue = judge.JudgeQueue(
+    evaluate=evaluate_batch,
+    save=save_evaluations,
+    skip=skip_evaluation,
+)
+registry.add_stats("yoga_judge", judge_queue.stats, gauges=["queued"])
+
+# Limits the requests answered at once and the LLM tokens of every client, see admission.py
+admission = AdmissionController()
+registry.add_stats(
+    "yoga_admission", admission.stats,
+    gauges=["in_flight", "queued", "clients", "mean_queue_wait", "service_time"],
+)
+
+
+def client_id(request):
+    # Clients behind a shared proxy can identify themselves, the address is used otherwise
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
+
+
+def request_timeout(request):
+    # Seconds the client is willing to wait, so that requests it would give up on are not answered
+    try:
+        return float(request.headers["X-Request-Timeout"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def admit(request, questions=1):
+    ticket = await admission.acquire(client_id(request), questions, request_timeout(request))
+    admission_wait_seconds.observe(ticket.wait, endpoint=request.url.path)
+    return ticket
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    # Holds the admission ticket until the stream is sent, or the client goes away
+    def __init__(self, content, ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.ticket)
+
+
+# Set once the worker has loaded the index and cleared while it shuts down, see /readyz
+ready = False
+# The exception that failed the startup, see /healthz
+startup_error = None
+
+
+async def start_up():
+    # Runs in the background, so the worker accepts connections at once and reports its progress.
+    # Requests arriving meanwhile wait for the index in rag.
+    global ready, startup_error
+    try:
+        await rag.load_async()
+        if ANSWER_CACHE_PG:
+            deleted = await asyncio.to_thread(db.purge_cached_answers, rag.ANSWER_CACHE_NAMESPACE)
+            print(f"Purged {deleted} cached answers of previous catalogs")
+        ready = True
+        # Importing the OpenAI SDK is slow, the first question should not pay for it
+        await asyncio.to_thread(gateway.connect)
+        if db.RUN_TIMEZONE_CHECK:
+            await asyncio.to_thread(db.check_timezone)
+    except Exception as e:
+        startup_error = e
+        ready = False
+        print(f"Startup failed: {e!r}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global ready
+    starting = asyncio.create_task(start_up())
+    judge_queue.start()
+    yield
+    ready = False
+    starting.cancel()
+    await judge_queue.stop(timeout=30)
+    await asyncio.to_thread(db.close_pool)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def count_errors(request: Request, call_next):
+    try:
+        return await call_next(request)
+    except Exception:
+        errors_total.inc(endpoint=request.url.path)
+        raise
+
+
+@app.exception_handler(AdmissionRejected)
+async def handle_rejected(request: Request, error: AdmissionRejected):
+    shed_total.inc(endpoint=request.url.path, reason=error.reason)
+    return JSONResponse(
+        {"detail": str(error), "reason": error.reason},
+        status_code=error.status_code,
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+@app.get("/healthz")
+async def handle_healthz():
+    # Liveness: the worker serves requests, even while it loads. Only a failed startup needs a restart.
+    if startup_error is not None:
+        return JSONResponse({"status": "failed", "error": repr(startup_error)}, status_code=503)
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/readyz")
+async def handle_readyz():
+    # Readiness: the index is loaded and the worker answers questions without waiting for it
+    status = {"ready": ready, "pid": os.getpid()}
+    if not ready:
+        return JSONResponse(status, status_code=503)
+    # Imported by rag.load, with the search engines
+    import ingest
+
+    status["index"] = ingest.index_status(rag.index)
+    return status
+
+
+@app.get("/metrics")
+async def handle_metrics():
+    return Response(registry.render(), media_type=metrics.CONTENT_TYPE)
 
 class QuestionRequest(BaseModel):
     question: str
 
+class QuestionsRequest(BaseModel):
+    questions: list[str]
+    stream: bool = False
+
 class FeedbackRequest(BaseModel):
     conversation_id: str
     feedback: int
 
 
 @app.post("/question")
-async def handle_question(data: QuestionRequest):
+async def handle_question(data: QuestionRequest, request: Request):
     question = data.question
 
     if not question:
@@ -23,7 +269,15 @@ async def handle_question(data: QuestionRequest):
 
     conversation_id = str(uuid.uuid4())
 
-    answer_data = rag(question)
+    relevance = judge_queue.should_judge()
+    ticket = await admit(request)
+    try:
+        answer_data = await rag_async(question, evaluate=False)
+        ticket.used = answer_data["total_tokens"]
+    finally:
+        admission.release(ticket)
+    answer_data["relevance"] = relevance
+    answer_data["relevance_explanation"] = judge.EXPLANATIONS[relevance]
 
     result = {
         "conversation_id": conversation_id,
@@ -31,15 +285,131 @@ async def handle_question(data: QuestionRequest):
         "answer": answer_data["answer"],
     }
 
-    db.save_conversation(
+    record_answer("/question", answer_data)
+    await timed_db_write(db.save_conversation_async(
         conversation_id=conversation_id,
         question=question,
         answer_data=answer_data,
-    )
+    ))
+
+    if relevance == judge.PENDING:
+        await judge_queue.submit(conversation_id, question, answer_data["answer"])
 
     return result
 
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/question/stream")
+async def handle_question_stream(data: QuestionRequest, request: Request):
+    question = data.question
+
+    if not question:
+        raise HTTPException(status_code=400, detail="No question provided")
+
+    conversation_id = str(uuid.uuid4())
+    ticket = await admit(request)
+
+    async def events():
+        # Tokens are forwarded as server-sent events as soon as the LLM produces them
+        relevance = judge_queue.should_judge()
+        answer_data = None
+        try:
+            async for event in rag_stream(question, evaluate=False):
+                if "token" in event:
+                    yield sse_event("token", {"token": event["token"]})
+                else:
+                    answer_data = event["answer_data"]
+                    ticket.used = answer_data["total_tokens"]
+        except Exception:
+            # The response has already started, so the error middleware does not see it
+            errors_total.inc(endpoint="/question/stream")
+            raise
+
+        answer_data["relevance"] = relevance
+        answer_data["relevance_explanation"] = judge.EXPLANATIONS[relevance]
+        record_answer("/question/stream", answer_data)
+        await timed_db_write(db.save_conversation_async(
+            conversation_id=conversation_id,
+            question=question,
+            answer_data=answer_data,
+        ))
+
+        if relevance == judge.PENDING:
+            await judge_queue.submit(conversation_id, question, answer_data["answer"])
+
+        yield sse_event("done", {
+            "conversation_id": conversation_id,
+            "question": question,
+            "answer": answer_data["answer"],
+        })
+
+    return AdmittedStreamingResponse(events(), ticket, media_type="text/event-stream")
+
+
+@app.post("/questions")
+async def handle_questions(data: QuestionsRequest, request: Request):
+    questions = data.questions
+
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="No question provided")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per request")
+
+    # A batch takes one slot, its concurrency is bounded by BATCH_CONCURRENCY, but every question is budgeted
+    ticket = await admit(request, questions=len(questions))
+    ticket.used = 0
+
+    async def results():
+        # Per-question results in completion order. The conversations are written together once all
+        # questions are answered, then submitted to the judge.
+        conversations = []
+        async for position, answer_data, error in rag_batch(questions):
+            if error is not None:
+                errors_total.inc(endpoint="/questions")
+                yield {"index": position, "question": questions[position], "error": str(error)}
+                continue
+
+            conversation_id = str(uuid.uuid4())
+            relevance = judge_queue.should_judge()
+            answer_data["relevance"] = relevance
+            answer_data["relevance_explanation"] = judge.EXPLANATIONS[relevance]
+            record_answer("/questions", answer_data)
+            ticket.used += answer_data["total_tokens"]
+            conversations.append((conversation_id, questions[position], answer_data))
+            yield {
+                "index": position,
+                "conversation_id": conversation_id,
+                "question": questions[position],
+                "answer": answer_data["answer"],
+            }
+
+        if conversations:
+            await timed_db_write(db.save_conversations_async(conversations))
+        for conversation_id, question, answer_data in conversations:
+            if answer_data["relevance"] == judge.PENDING:
+                await judge_queue.submit(conversation_id, question, answer_data["answer"])
+
+    if data.stream:
+        async def events():
+            # The conversations can be referenced, e.g. for feedback, once the done event is sent
+            answered = 0
+            async for result in results():
+                answered += "error" not in result
+                yield sse_event("result", result)
+            yield sse_event("done", {"questions": len(questions), "answered": answered})
+
+        return AdmittedStreamingResponse(events(), ticket, media_type="text/event-stream")
+
+    try:
+        answers = [result async for result in results()]
+    finally:
+        admission.release(ticket)
+    return {"results": sorted(answers, key=lambda result: result["index"])}
+
+
 @app.post("/feedback")
 async def handle_feedback(data: FeedbackRequest):
     conversation_id = data.conversation_id
@@ -48,7 +418,7 @@ async def handle_feedback(data: FeedbackRequest):
     if not conversation_id or feedback not in [1, -1]:
         raise HTTPException(status_code=400, detail="Invalid input")
 
-    db.save_feedback(
+    await db.save_feedback_async(
         conversation_id=conversation_id,
         feedback=feedback,
     )
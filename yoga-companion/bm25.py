@@ -0,0 +1,363 @@
+import json
+import os
+from collections import Counter
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import numpy as np
+
+from minsearch import KeywordIndex
+
+
+class BM25Index:
+    """
+    A search index using BM25F over per-field inverted indexes and exact matching for keyword fields.
+
+    Each text field keeps its own posting lists in flat NumPy arrays. At query time the boost of every field
+    is used as its BM25F weight, and a MaxScore-style strategy stops collecting new candidates once the
+    remaining query terms can no longer lift an unseen document into the top results. Only documents that
+    appear in the posting lists of the query terms are ever scored. Keyword filters are resolved before scoring.
+
+    Attributes:
+        text_fields (list): List of text field names to index.
+        keyword_fields (list): List of keyword field names to index.
+        k1 (float): BM25 term frequency saturation parameter.
+        b (float): BM25 length normalization parameter.
+        analyzer (callable): Analyzer shared by all text fields.
+        vocabulary (dict): Maps each term to its term id, shared by all fields.
+        idf (np.ndarray): BM25 IDF of every term, computed over documents containing it in any field.
+        offsets (dict): Per field, the start of every term's posting list (n_terms + 1 entries).
+        postings (dict): Per field, the document ids of all posting lists, sorted within each list.
+        weights (dict): Per field, the length-normalized term frequency of every posting.
+        max_weights (dict): Per field, the largest normalized term frequency of every term.
+        keyword_index (minsearch.KeywordIndex): Row ids of keyword field values, used to filter before scoring.
+        docs (list): List of documents indexed.
+        version (int): Incremented whenever the index is refit, so caches can invalidate.
+    """
+
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}, k1=1.2, b=0.75):
+        """
+        Initializes the BM25Index with specified text and keyword fields.
+
+        Args:
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            vectorizer_params (dict): Optional TfidfVectorizer parameters used to build the analyzer.
+            k1 (float): BM25 term frequency saturation parameter. Defaults to 1.2.
+            b (float): BM25 length normalization parameter. Defaults to 0.75.
+        """
+        self.text_fields = text_fields
+        self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
+        self.k1 = k1
+        self.b = b
+
+        self.analyzer = TfidfVectorizer(**vectorizer_params).build_analyzer()
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.offsets = {}
+        self.postings = {}
+        self.weights = {}
+        self.max_weights = {}
+        self.keyword_index = KeywordIndex(keyword_fields)
+        self.docs = []
+        self.version = 0
+
+    def fit(self, docs):
+        """
+        Fits the index with the provided documents.
+
+        Args:
+            docs (list of dict): List of documents to index. Each document is a dictionary.
+        """
+        self.docs = docs
+        vocabulary = {}
+        field_entries = {}
+
+        for field in self.text_fields:
+            term_ids = []
+            doc_ids = []
+            tfs = []
+            for doc_id, doc in enumerate(docs):
+                for term, count in Counter(self.analyzer(doc.get(field, ''))).items():
+                    term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                    doc_ids.append(doc_id)
+                    tfs.append(count)
+            field_entries[field] = (
+                np.array(term_ids, dtype=np.int32),
+                np.array(doc_ids, dtype=np.int32),
+                np.array(tfs, dtype=np.float32),
+            )
+
+        n_docs = len(docs)
+        n_terms = len(vocabulary)
+        all_pairs = []
+
+        for field, (term_ids, doc_ids, tfs) in field_entries.items():
+            # Posting lists are grouped by term and sorted by document inside each list
+            order = np.lexsort((doc_ids, term_ids))
+            term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+            lengths = np.bincount(doc_ids, weights=tfs, minlength=n_docs)
+            avg_length = lengths.mean() if n_docs else 0
+            if avg_length > 0:
+                norm = 1 - self.b + self.b * lengths / avg_length
+            else:
+                norm = np.ones(n_docs)
+            weights = (tfs / norm[doc_ids]).astype(np.float32)
+
+            offsets = np.zeros(n_terms + 1, dtype=np.int64)
+            np.cumsum(np.bincount(term_ids, minlength=n_terms), out=offsets[1:])
+
+            max_weights = np.zeros(n_terms, dtype=np.float32)
+            np.maximum.at(max_weights, term_ids, weights)
+
+            self.offsets[field] = offsets
+            self.postings[field] = doc_ids
+            self.weights[field] = weights
+            self.max_weights[field] = max_weights
+            all_pairs.append(term_ids.astype(np.int64) * max(n_docs, 1) + doc_ids)
+
+        # A document counts once for a term even if several of its fields contain it
+        if all_pairs:
+            pairs = np.unique(np.concatenate(all_pairs))
+            df = np.bincount(pairs // max(n_docs, 1), minlength=n_terms)
+        else:
+            df = np.zeros(n_terms)
+        self.idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.vocabulary = vocabulary
+
+        self.keyword_index.fit(docs)
+        self.version += 1
+
+        return self
+
+    def save(self, path):
+        """
+        Saves the fitted index as a snapshot directory.
+
+        Arrays are written as .npy files so they can be memory-mapped by load. The vocabulary and
+        configuration go to meta.json, the documents to docs.json.
+
+        Args:
+            path (str): Directory to write the snapshot to. It is created if needed.
+        """
+        os.makedirs(path, exist_ok=True)
+
+        arrays = {'idf': self.idf}
+        for position, field in enumerate(self.text_fields):
+            arrays[f'offsets_{position}'] = self.offsets[field]
+            arrays[f'postings_{position}'] = self.postings[field]
+            arrays[f'weights_{position}'] = self.weights[field]
+            arrays[f'max_weights_{position}'] = self.max_weights[field]
+        arrays.update(self.keyword_index.arrays())
+
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+        with open(os.path.join(path, 'docs.json'), 'w') as f:
+            json.dump(self.docs, f)
+
+        meta = {
+            'text_fields': self.text_fields,
+            'keyword_fields': self.keyword_fields,
+            'vectorizer_params': self.vectorizer_params,
+            'k1': self.k1,
+            'b': self.b,
+            'terms': sorted(self.vocabulary, key=self.vocabulary.get),
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Loads an index from a snapshot directory written by save, without refitting.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap_mode (str): Passed to np.load. Defaults to 'r', so the arrays are memory-mapped read-only.
+                Use None to read them into memory.
+
+        Returns:
+            BM25Index: The loaded index.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        index = cls(meta['text_fields'], meta['keyword_fields'], meta['vectorizer_params'], meta['k1'], meta['b'])
+
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        index.vocabulary = {term: term_id for term_id, term in enumerate(meta['terms'])}
+        index.idf = load_array('idf')
+        for position, field in enumerate(index.text_fields):
+            index.offsets[field] = load_array(f'offsets_{position}')
+            index.postings[field] = load_array(f'postings_{position}')
+            index.weights[field] = load_array(f'weights_{position}')
+            index.max_weights[field] = load_array(f'max_weights_{position}')
+        index.keyword_index.load_arrays(load_array)
+
+        with open(os.path.join(path, 'docs.json')) as f:
+            index.docs = json.load(f)
+
+        return index
+
+    def _term_postings(self, term_id, field_weights):
+        """
+        Merges the posting lists of a term across fields into BM25F pseudo term frequencies.
+
+        Args:
+            term_id (int): The term id.
+            field_weights (dict): BM25F weight of every field taking part in the query.
+
+        Returns:
+            tuple: Sorted document ids and their weighted, length-normalized term frequencies.
+        """
+        doc_ids = []
+        tfs = []
+        for field, weight in field_weights.items():
+            start, end = self.offsets[field][term_id], self.offsets[field][term_id + 1]
+            if start < end:
+                doc_ids.append(self.postings[field][start:end])
+                tfs.append(self.weights[field][start:end] * weight)
+
+        if len(doc_ids) == 1:
+            return doc_ids[0], tfs[0].astype(np.float64)
+        doc_ids, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        return doc_ids, np.bincount(inverse, weights=np.concatenate(tfs))
+
+    def _lookup(self, term_id, field_weights, candidates):
+        """
+        Computes the BM25F pseudo term frequency of a term for the given candidate documents only.
+
+        Args:
+            term_id (int): The term id.
+            field_weights (dict): BM25F weight of every field taking part in the query.
+            candidates (np.ndarray): Sorted candidate document ids.
+
+        Returns:
+            np.ndarray: Weighted, length-normalized term frequency of every candidate.
+        """
+        tfs = np.zeros(len(candidates))
+        for field, weight in field_weights.items():
+            start, end = self.offsets[field][term_id], self.offsets[field][term_id + 1]
+            if start == end:
+                continue
+            postings = self.postings[field][start:end]
+            positions = np.searchsorted(postings, candidates)
+            found = positions < len(postings)
+            found[found] = postings[positions[found]] == candidates[found]
+            tfs[found] += self.weights[field][start:end][positions[found]] * weight
+        return tfs
+
+    def _saturate(self, tfs):
+        return tfs * (self.k1 + 1) / (self.k1 + tfs)
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with the given query, filters, and boost parameters.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            boost_dict (dict): Dictionary of BM25F weights for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by relevance.
+        """
+        if num_results <= 0:
+            return []
+
+        field_weights = {field: boost_dict.get(field, 1) for field in self.text_fields}
+        field_weights = {field: weight for field, weight in field_weights.items() if weight != 0}
+
+        query_terms = Counter(
+            self.vocabulary[term] for term in self.analyzer(query) if term in self.vocabulary
+        )
+
+        # Upper bound of every term's contribution, from its largest pseudo term frequency.
+        # The bound is padded slightly so float rounding can never make it too tight.
+        terms = []
+        for term_id, count in query_terms.items():
+            max_tf = sum(self.max_weights[field][term_id] * weight for field, weight in field_weights.items())
+            if max_tf > 0:
+                term_weight = count * self.idf[term_id]
+                terms.append((term_weight * self._saturate(max_tf) * (1 + 1e-6), term_weight, term_id))
+        terms.sort(reverse=True)
+
+        candidates = np.zeros(0, dtype=np.int32)
+        collecting = True
+        mask = None
+
+        allowed = self.keyword_index.candidates(filter_dict)
+        if allowed is not None:
+            n_postings = sum(
+                self.offsets[field][term_id + 1] - self.offsets[field][term_id]
+                for _, _, term_id in terms for field in field_weights
+            )
+            if len(allowed) <= n_postings:
+                # Fewer matches than postings to walk, so only the filtered documents are scored
+                candidates = allowed
+                collecting = False
+            else:
+                mask = np.zeros(len(self.docs), dtype=bool)
+                mask[allowed] = True
+
+        scores = np.zeros(len(candidates))
+        # remaining_bounds[i] bounds what the terms after term i can still add to any document
+        remaining_bounds = np.cumsum([term[0] for term in terms][::-1])[::-1].tolist()[1:] + [0.0]
+        threshold = 0.0
+
+        for (_, term_weight, term_id), remaining in zip(terms, remaining_bounds):
+            if collecting:
+                doc_ids, tfs = self._term_postings(term_id, field_weights)
+                if mask is not None:
+                    keep = mask[doc_ids]
+                    doc_ids, tfs = doc_ids[keep], tfs[keep]
+                merged, inverse = np.unique(np.concatenate([candidates, doc_ids]), return_inverse=True)
+                scores = np.bincount(
+                    inverse,
+                    weights=np.concatenate([scores, term_weight * self._saturate(tfs)]),
+                    minlength=len(merged),
+                )
+                candidates = merged
+            else:
+                # Unseen documents can no longer reach the top results, only score the current candidates
+                scores = scores + term_weight * self._saturate(self._lookup(term_id, field_weights, candidates))
+
+            if len(scores) >= num_results:
+                threshold = np.partition(scores, len(scores) - num_results)[len(scores) - num_results]
+
+            if remaining < threshold:
+                collecting = False
+                keep = scores + remaining >= threshold
+                candidates, scores = candidates[keep], scores[keep]
+
+        keep = scores > 0
+        candidates, scores = candidates[keep], scores[keep]
+
+        # Top num_results, ties are broken by document position
+        top = np.lexsort((candidates, -scores))[:num_results]
+        if output_scores:
+            return [(self.docs[i], score) for i, score in zip(candidates[top].tolist(), scores[top].tolist())]
+        return [self.docs[i] for i in candidates[top]]
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with several queries, sharing the filters and boost parameters.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of BM25F weights for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of list of dict: For every query, the list of matching documents ranked by relevance.
+        """
+        return [self.search(query, filter_dict, boost_dict, num_results, output_scores) for query in queries]
@@ -0,0 +1,538 @@
+import asyncio
+import hashlib
+import math
+import sys
+import threading
+from collections import Counter, OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    """
+    A thread-safe least-recently-used cache with optional time-to-live and memory cap.
+
+    Attributes:
+        maxsize (int): Maximum number of entries. 0 disables the cache.
+        ttl (float): Seconds an entry stays valid, None to keep entries until they are evicted.
+        max_bytes (int): Maximum estimated size of all entries, None for no cap.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found or expired.
+        evictions (int): Number of entries dropped to respect maxsize or max_bytes.
+        expirations (int): Number of entries dropped because their ttl passed.
+        invalidations (int): Number of times the whole cache was cleared.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None):
+        """
+        Initializes an empty cache.
+
+        Args:
+            maxsize (int): Maximum number of entries. 0 disables the cache. Defaults to 1024.
+            ttl (float): Seconds an entry stays valid. Defaults to None (no expiry).
+            max_bytes (int): Maximum estimated size of all entries. Defaults to None (no cap).
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key and marks it as recently used.
+
+        Args:
+            key: A hashable key.
+            default: Returned when the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=None):
+        """
+        Stores value for key, evicting the least recently used entries if needed.
+
+        Args:
+            key: A hashable key.
+            value: The value to store.
+            size (int): Estimated size of the entry in bytes. Defaults to sys.getsizeof of key and value.
+        """
+        if self.maxsize <= 0:
+            return
+        if size is None:
+            size = sys.getsizeof(key) + sys.getsizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expires_at = None if self.ttl is None else monotonic() + self.ttl
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drops every entry and counts an invalidation.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        # Checks presence without touching the recency order or the counters
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > monotonic())
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Entries, estimated bytes, hits, misses, evictions, expirations and invalidations.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def _freeze(value):
+    # Turn filter and boost values into hashable, order-independent keys
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(value, key=repr)))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class SearchCache:
+    """
+    Caches search results in front of an index.
+
+    Queries are normalized with the index analyzer, so queries with the same terms share an entry.
+    Entries keep the scores, so searches with and without output_scores share them too.
+    The cache is cleared whenever the index version changes, i.e. after a refit or any mutation.
+
+    Attributes:
+        index: The cached index (minsearch.Index or bm25.BM25Index).
+        cache (LRUCache): The underlying cache, exposing the hit/miss/eviction counters.
+    """
+
+    def __init__(self, index, maxsize=1024, ttl=None, max_bytes=None):
+        """
+        Initializes the cache in front of index.
+
+        Args:
+            index: The index to cache. It must have an analyzer and a version attribute.
+            maxsize (int): Maximum number of cached queries. 0 disables the cache.
+            ttl (float): Seconds a result stays valid. Defaults to None (no expiry).
+            max_bytes (int): Maximum estimated size of all cached results. Defaults to None (no cap).
+        """
+        self.index = index
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl, max_bytes=max_bytes)
+        self._version = index.version
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        with self._lock:
+            if self.index.version != self._version:
+                self._version = self.index.version
+                self.cache.clear()
+
+    def key(self, query, filter_dict={}, boost_dict={}, num_results=10):
+        """
+        Builds the cache key of a search.
+
+        Returns:
+            tuple: Sorted query terms, frozen filters and boosts, and the number of results.
+        """
+        terms = tuple(sorted(self.index.analyzer(query)))
+        return terms, _freeze(filter_dict), _freeze(boost_dict), num_results
+
+    @staticmethod
+    def _size(key, results):
+        # The documents are shared with the index, only the key, the result list and its pairs belong to the cache
+        return (
+            sys.getsizeof(key) + sum(sys.getsizeof(term) for term in key[0]) + sys.getsizeof(results)
+            + sum(sys.getsizeof(pair) + sys.getsizeof(pair[1]) for pair in results)
+        )
+
+    @staticmethod
+    def _output(results, output_scores):
+        return list(results) if output_scores else [doc for doc, _ in results]
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index, serving repeated searches from the cache.
+
+        Args and return value are the same as for the index search method.
+        """
+        self._check_version()
+        version = self.index.version
+        key = self.key(query, filter_dict, boost_dict, num_results)
+
+        results = self.cache.get(key)
+        if results is None:
+            results = self.index.search(query, filter_dict, boost_dict, num_results, output_scores=True)
+            if self.index.version == version:
+                self.cache.put(key, results, self._size(key, results))
+
+        return self._output(results, output_scores)
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with several queries, running only the uncached ones as one batch.
+
+        Args and return value are the same as for the index search_batch method.
+        """
+        self._check_version()
+        version = self.index.version
+        keys = [self.key(query, filter_dict, boost_dict, num_results) for query in queries]
+
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            found = self.index.search_batch(
+                [queries[i] for i in missing], filter_dict, boost_dict, num_results, output_scores=True
+            )
+            for i, result in zip(missing, found):
+                results[i] = result
+                if self.index.version == version:
+                    self.cache.put(keys[i], result, self._size(keys[i], result))
+
+        return [self._output(result, output_scores) for result in results]
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class AnswerCache:
+    """
+    Caches LLM answers by question and retrieved documents, so repeated questions skip the LLM.
+
+    The key is the normalized question (the index analyzer tokens, in order) plus the ordered ids of the
+    retrieved documents. A lookup first tries the exact key. Otherwise it compares the question with the
+    cached questions that retrieved the same documents, using cosine similarity of IDF-weighted term
+    vectors, and serves the closest one when it reaches the threshold. Answers are therefore only shared
+    between questions that were given the same context.
+
+    An optional persistent tier (e.g. Postgres) is consulted on exact misses with get_persistent and written
+    with put_persistent. Its functions are async, so a database round trip never holds a search thread. Its
+    keys include the catalog fingerprint, and the in-memory tier is cleared whenever the index version
+    changes, so answers never outlive the catalog they were generated from.
+
+    Attributes:
+        index: The search index. Its analyzer normalizes questions and its version invalidates the cache.
+        threshold (float): Minimum cosine similarity of a near-duplicate hit. 1 or more serves exact hits only.
+        namespace (str): Catalog fingerprint included in the persistent keys.
+        cache (LRUCache): The in-memory tier, exposing the hit/miss/eviction counters.
+        exact_hits (int): Lookups served by the exact key, from memory or the persistent tier.
+        similar_hits (int): Lookups served by a near-duplicate question.
+    """
+
+    def __init__(self, index, maxsize=1024, ttl=None, threshold=1.0, namespace="", load=None, save=None):
+        """
+        Initializes an empty answer cache.
+
+        Args:
+            index: The search index. It must have an analyzer and a version attribute.
+            maxsize (int): Maximum number of answers kept in memory. 0 disables the cache.
+            ttl (float): Seconds an answer stays valid in memory. Defaults to None (no expiry).
+            threshold (float): Minimum cosine similarity of a near-duplicate hit. Defaults to 1.0 (exact hits
+                only).
+            namespace (str): Catalog fingerprint included in the persistent keys. Defaults to ''.
+            load (callable): Optional async persistent tier lookup, key -> answer or None.
+            save (callable): Optional async persistent tier write, (key, namespace, question, doc_ids, answer).
+        """
+        self.index = index
+        self.threshold = threshold
+        self.namespace = namespace
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.load = load
+        self.save = save
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+
+        self._weights = _term_weights(index)
+        self._groups = {}
+        self._version = index.version
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        with self._lock:
+            if self.index.version != self._version:
+                self._version = self.index.version
+                self._weights = _term_weights(self.index)
+                self._groups = {}
+                self.cache.clear()
+
+    def normalize(self, question):
+        return " ".join(self.index.analyzer(question))
+
+    def _vector(self, normalized):
+        counts = Counter(normalized.split())
+        vector = {term: count * self._weights(term) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def persistent_key(self, normalized, doc_ids):
+        return hashlib.sha256(f"{self.namespace}|{normalized}|{list(doc_ids)}".encode()).hexdigest()
+
+    def get(self, question, doc_ids):
+        """
+        Looks up the answer to a question given the documents it retrieved, in memory.
+
+        Args:
+            question (str): The user question.
+            doc_ids (list): Ids of the retrieved documents, in rank order.
+
+        Returns:
+            tuple: The cached answer and 'exact' or 'similar', or (None, None) on a miss.
+        """
+        if self.cache.maxsize <= 0:
+            return None, None
+
+        self._check_version()
+        doc_ids = tuple(doc_ids)
+        normalized = self.normalize(question)
+
+        answer = self.cache.get((doc_ids, normalized))
+        if answer is not None:
+            self.exact_hits += 1
+            return answer, "exact"
+
+        if self.threshold < 1:
+            vector = self._vector(normalized)
+            with self._lock:
+                candidates = list(self._groups.get(doc_ids, {}).items())
+
+            scored = sorted(
+                ((sum(weight * other.get(term, 0.0) for term, weight in vector.items()), other_question)
+                 for other_question, other in candidates),
+                reverse=True,
+            )
+            for similarity, other_question in scored:
+                if similarity < self.threshold:
+                    break
+                answer = self.cache.get((doc_ids, other_question))
+                if answer is not None:
+                    self.similar_hits += 1
+                    return answer, "similar"
+                self._forget(doc_ids, other_question)
+
+        return None, None
+
+    async def get_persistent(self, question, doc_ids):
+        """
+        Looks up the answer to a question given the documents it retrieved in the persistent tier, after a
+        miss of get. A hit is kept in memory for the next lookups.
+
+        Args:
+            question (str): The user question.
+            doc_ids (list): Ids of the retrieved documents, in rank order.
+
+        Returns:
+            tuple: The stored answer and 'exact', or (None, None) on a miss or without a persistent tier.
+        """
+        if self.cache.maxsize <= 0 or self.load is None:
+            return None, None
+
+        doc_ids = tuple(doc_ids)
+        normalized = self.normalize(question)
+        answer = await self.load(self.persistent_key(normalized, doc_ids))
+        if answer is None:
+            return None, None
+
+        self._check_version()
+        self._remember(doc_ids, normalized, answer)
+        self.exact_hits += 1
+        return answer, "exact"
+
+    def put(self, question, doc_ids, answer):
+        """
+        Stores the answer generated for a question and the documents it retrieved, in memory.
+
+        Args:
+            question (str): The user question.
+            doc_ids (list): Ids of the retrieved documents, in rank order.
+            answer (str): The generated answer.
+        """
+        if self.cache.maxsize <= 0 or not answer:
+            return
+
+        self._check_version()
+        doc_ids = tuple(doc_ids)
+        normalized = self.normalize(question)
+        self._remember(doc_ids, normalized, answer)
+
+    async def put_persistent(self, question, doc_ids, answer):
+        """
+        Stores the answer generated for a question and the documents it retrieved in the persistent tier.
+
+        Args:
+            question (str): The user question.
+            doc_ids (list): Ids of the retrieved documents, in rank order.
+            answer (str): The generated answer.
+        """
+        if self.cache.maxsize <= 0 or not answer or self.save is None:
+            return
+
+        key = self.persistent_key(self.normalize(question), tuple(doc_ids))
+        await self.save(key, self.namespace, question, list(doc_ids), answer)
+
+    def _remember(self, doc_ids, normalized, answer):
+        self.cache.put((doc_ids, normalized), answer)
+        with self._lock:
+            group = self._groups.setdefault(doc_ids, {})
+            group[normalized] = self._vector(normalized)
+            # Questions evicted from the LRU tier are dropped from their group once it grows
+            if len(group) > 8 and len(group) & (len(group) - 1) == 0:
+                for other in [q for q in group if (doc_ids, q) not in self.cache]:
+                    del group[other]
+
+    def _forget(self, doc_ids, normalized):
+        with self._lock:
+            group = self._groups.get(doc_ids)
+            if group is not None:
+                group.pop(normalized, None)
+                if not group:
+                    del self._groups[doc_ids]
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["exact_hits"] = self.exact_hits
+        stats["similar_hits"] = self.similar_hits
+        return stats
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call between concurrent callers asking for the same key.
+
+    The first caller of a key starts the call as a task. Callers arriving while it runs wait for the same
+    task instead of starting their own. Nothing is kept once the task finishes, so a later caller starts
+    a new call: this only deduplicates concurrent work, it is not a cache. A caller that is cancelled, e.g.
+    by a client disconnecting, does not cancel the call for the others.
+
+    Must be used from a single event loop.
+
+    Attributes:
+        leaders (int): Calls started.
+        coalesced (int): Callers served by a call another caller started.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._tasks = {}
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, the callers that still wait re-raise it
+            task.exception()
+
+    async def run(self, key, call):
+        """
+        Awaits the in-flight call of key, starting call() when there is none.
+
+        Args:
+            key: A hashable key identifying equivalent calls.
+            call (callable): Function returning the coroutine to run.
+
+        Returns:
+            tuple: The result of the call and whether it was started by another caller.
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(call())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            self.leaders += 1
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        """
+        Returns the coalescing counters.
+
+        Returns:
+            dict: Calls in flight, calls started, callers coalesced and the share of callers coalesced.
+        """
+        callers = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._tasks),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / callers if callers else 0.0,
+        }
+
+
+def _term_weights(index):
+    """
+    Returns the IDF weight function of query terms, from the index when it exposes per-column IDF.
+    """
+    vocabulary = getattr(index, "vocabulary", None)
+    idf = getattr(index, "idf", None)
+    if not vocabulary or idf is None or len(idf) == 0:
+        return lambda term: 1.0
+
+    # Terms missing from the catalog are rarer than any indexed term
+    default = float(max(idf))
+
+    def weight(term):
+        columns = vocabulary.get(term)
+        return default if columns is None else float(idf[columns].mean())
+
+    return weight
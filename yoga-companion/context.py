@@ -0,0 +1,166 @@
+import threading
+
+from tokens import estimate_tokens
+
+
+class ContextBuilder:
+    """
+    Assembles the CONTEXT section of the prompt from ranked search results.
+
+    The lines of every document entry are rendered once, with their token counts, when the builder is
+    created, and again only for documents added or changed later. Assembling a context:
+
+    * stops at the first result scoring below min_score_ratio times the best score,
+    * writes the variations of a pose (group_field) together after its best entry, the later entries only
+      listing the fields that differ from that entry, and leaves out exact duplicates,
+    * adds results in rank order while the context fits in token_budget. The best result is always kept.
+
+    Attributes:
+        index: The search index whose documents are rendered. Its version invalidates the rendered entries.
+        fields (list of tuple): (label, field) pairs, in entry order.
+        group_field (str): Field identifying variations of the same pose.
+        id_field (str): Field identifying a document.
+        count_tokens (callable): Function returning the number of tokens of a text.
+        token_budget (int): Maximum number of context tokens. None or 0 means no budget.
+        min_score_ratio (float): Results scoring below this share of the best score are dropped. 0 keeps all.
+    """
+
+    def __init__(self, index, fields, group_field="pose_name", id_field="id", count_tokens=estimate_tokens,
+                 token_budget=None, min_score_ratio=0.0):
+        """
+        Initializes the builder and renders the entries of all indexed documents.
+
+        Args:
+            index: The search index. It must have docs and version attributes.
+            fields (list of tuple): (label, field) pairs, in entry order.
+            group_field (str): Field identifying variations of the same pose. Defaults to 'pose_name'.
+            id_field (str): Field identifying a document. Defaults to 'id'.
+            count_tokens (callable): Function returning the number of tokens of a text. Defaults to estimate_tokens.
+            token_budget (int): Maximum number of context tokens. Defaults to None (no budget).
+            min_score_ratio (float): Share of the best score below which results are dropped. Defaults to 0.
+        """
+        self.index = index
+        self.fields = fields
+        self.group_field = group_field
+        self.id_field = id_field
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.min_score_ratio = min_score_ratio
+
+        self._group_label = next(label for label, field in fields if field == group_field)
+        self._entries = {}
+        self._version = index.version
+        self._lock = threading.Lock()
+
+        # Replaced rows stay in docs, tombstoned, until the index is compacted, and share their id with the
+        # row replacing them
+        deleted = getattr(index, "deleted", None)
+        for row, doc in enumerate(index.docs):
+            if deleted is None or not deleted[row]:
+                self.entry(doc)
+
+    def _check_version(self):
+        with self._lock:
+            if self.index.version != self._version:
+                self._version = self.index.version
+                self._entries = {}
+
+    def entry(self, doc):
+        """
+        Returns the rendered entry of a document, rendering it on first use.
+
+        Args:
+            doc (dict): An indexed document.
+
+        Returns:
+            tuple: The field values, the entry lines and the number of tokens of every line.
+        """
+        key = doc[self.id_field]
+        entry = self._entries.get(key)
+        if entry is None:
+            values = tuple(str(doc.get(field, "")) for _, field in self.fields)
+            lines = tuple(f"{label}: {value}" for (label, _), value in zip(self.fields, values))
+            entry = (values, lines, tuple(self.count_tokens(line) for line in lines))
+            self._entries[key] = entry
+        return entry
+
+    def render(self, docs):
+        """
+        Renders the full entries of documents, without budget, score cut-off or merging.
+
+        Args:
+            docs (list of dict): The documents, in context order.
+
+        Returns:
+            str: The context text.
+        """
+        self._check_version()
+        return "".join("\n".join(self.entry(doc)[1]) + "\n\n" for doc in docs)
+
+    def assemble(self, results):
+        """
+        Builds the context of ranked search results.
+
+        Args:
+            results (list of tuple): (document, score) pairs ranked by relevance. Scores may be None, then
+                no score cut-off is applied.
+
+        Returns:
+            tuple: The context text and a dict with the number of results, of documents kept, of
+                documents reduced to their differences or dropped as duplicates, the estimated context tokens,
+                and the ids of the documents the context covers (duplicates included).
+        """
+        self._check_version()
+
+        scores = [score for _, score in results if score is not None]
+        min_score = max(scores) * self.min_score_ratio if scores and self.min_score_ratio > 0 else None
+
+        groups = {}
+        doc_ids = []
+        used = 0
+        kept = 0
+        merged = 0
+        for doc, score in results:
+            if min_score is not None and score is not None and score < min_score:
+                break
+
+            values, lines, line_tokens = self.entry(doc)
+            group_value = str(doc.get(self.group_field, ""))
+            group = groups.get(group_value)
+
+            if group is None:
+                block_lines = list(lines)
+                cost = sum(line_tokens) + len(lines)
+            else:
+                first_values = group[0]
+                changed = [i for i, value in enumerate(values) if value != first_values[i]]
+                if not changed:
+                    # An exact duplicate of the entry already in the context
+                    doc_ids.append(doc[self.id_field])
+                    merged += 1
+                    continue
+                header = f"{self._group_label}: {group_value} (other fields as above)"
+                block_lines = [header] + [lines[i] for i in changed]
+                cost = self.count_tokens(header) + sum(line_tokens[i] for i in changed) + len(block_lines)
+
+            if self.token_budget and kept > 0 and used + cost > self.token_budget:
+                break
+
+            if group is None:
+                groups[group_value] = (values, [block_lines])
+            else:
+                group[1].append(block_lines)
+                merged += 1
+            doc_ids.append(doc[self.id_field])
+            used += cost
+            kept += 1
+
+        # Groups are written in the order of their best result, variations right after their first entry
+        context = "\n\n".join(
+            "\n".join(block_lines) for _, blocks in groups.values() for block_lines in blocks
+        )
+        if context:
+            context += "\n\n"
+
+        stats = {"results": len(results), "kept": kept, "merged": merged, "tokens": used, "doc_ids": doc_ids}
+        return context, stats
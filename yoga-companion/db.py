@@ -1,16 +1,33 @@
+import asyncio
+import json
 import os
+import threading
 import psycopg2
-from psycopg2.extras import DictCursor
+from contextlib import contextmanager
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
-RUN_TIMEZONE_CHECK = os.getenv('RUN_TIMEZONE_CHECK', '1') == '1'
+# Whether the API also checks the database timezone when it starts, off by default since the check writes
+# and deletes a test conversation. db_prep.py always runs it. Importing db never connects.
+RUN_TIMEZONE_CHECK = os.getenv('RUN_TIMEZONE_CHECK', '0') == '1'
 TZ_INFO = os.getenv("TZ", "America/New_York")
 tz = ZoneInfo(TZ_INFO)
+# Connections shared by the requests of a process: up to DB_POOL_SIZE are opened as needed, and
+# DB_POOL_MIN_SIZE of them are kept open when idle. Every serve.py worker has its own pool, so Postgres
+# may see WEB_CONCURRENCY * DB_POOL_SIZE connections from the API.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_MIN_SIZE = min(int(os.getenv("DB_POOL_MIN_SIZE", "1")), DB_POOL_SIZE)
 
+_pool = None
+_pool_lock = threading.Lock()
+# The pool raises when all its connections are taken, callers wait here for one instead
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
 
-def get_db_connection():
-    return psycopg2.connect(
+
+def connection_params():
+    return dict(
         host=os.getenv("POSTGRES_HOST", "postgres"),
         database=os.getenv("POSTGRES_DB", "course_assistant"),
         user=os.getenv("POSTGRES_USER", "your_username"),
@@ -18,7 +35,43 @@ def get_db_connection():
     )
 
 
+def get_db_connection():
+    # A new connection outside the pool, e.g. for scripts
+    return psycopg2.connect(**connection_params())
+
+
+def get_pool():
+    # The pool and its connections are opened by the first query, not when db is imported
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_SIZE, **connection_params())
+        return _pool
+
+
+@contextmanager
+def connection():
+    # A pooled connection for the block. Putting it back rolls back a transaction the block left open,
+    # and discards the connection if it broke.
+    with _pool_slots:
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn)
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
 def init_db():
+    # A script runs it once, on its own connection rather than a pool
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
@@ -41,6 +94,14 @@ def init_db():
                     eval_completion_tokens INTEGER NOT NULL,
                     eval_total_tokens INTEGER NOT NULL,
                     openai_cost FLOAT NOT NULL,
+                    time_to_first_token FLOAT,
+                    generation_time FLOAT,
+                    answer_path TEXT,
+                    cache_hit TEXT,
+                    search_time FLOAT,
+                    build_prompt_time FLOAT,
+                    llm_time FLOAT,
+                    evaluate_relevance_time FLOAT,
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
@@ -52,68 +113,202 @@ def init_db():
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
+            # The answer cache outlives the conversations, its keys already include the catalog fingerprint
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    key TEXT PRIMARY KEY,
+                    catalog TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    doc_ids TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """)
         conn.commit()
     finally:
         conn.close()
 
 
+CONVERSATION_COLUMNS = """
+    id, question, answer, model_used, response_time, relevance,
+    relevance_explanation, prompt_tokens, completion_tokens, total_tokens,
+    eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost,
+    time_to_first_token, generation_time, answer_path, cache_hit, search_time, build_prompt_time,
+    llm_time, evaluate_relevance_time, timestamp
+"""
+
+
+def conversation_row(conversation_id, question, answer_data, timestamp):
+    return (
+        conversation_id,
+        question,
+        answer_data["answer"],
+        answer_data["model_used"],
+        answer_data["response_time"],
+        answer_data["relevance"],
+        answer_data["relevance_explanation"],
+        answer_data["prompt_tokens"],
+        answer_data["completion_tokens"],
+        answer_data["total_tokens"],
+        answer_data["eval_prompt_tokens"],
+        answer_data["eval_completion_tokens"],
+        answer_data["eval_total_tokens"],
+        answer_data["openai_cost"],
+        answer_data.get("time_to_first_token"),
+        answer_data.get("generation_time"),
+        answer_data.get("answer_path"),
+        answer_data.get("cache_hit"),
+        answer_data.get("search_time"),
+        answer_data.get("build_prompt_time"),
+        answer_data.get("llm_time"),
+        answer_data.get("evaluate_relevance_time"),
+        timestamp,
+    )
+
+
 def save_conversation(conversation_id, question, answer_data, timestamp=None):
+    save_conversations([(conversation_id, question, answer_data)], timestamp)
+
+
+def save_conversations(conversations, timestamp=None):
+    # conversations: (conversation_id, question, answer_data) tuples, written in one statement
     if timestamp is None:
         timestamp = datetime.now(tz)
 
-    conn = get_db_connection()
-    try:
+    with connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO conversations 
-                (id, question, answer, model_used, response_time, relevance, 
-                relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    conversation_id,
-                    question,
-                    answer_data["answer"],
-                    answer_data["model_used"],
-                    answer_data["response_time"],
-                    answer_data["relevance"],
-                    answer_data["relevance_explanation"],
-                    answer_data["prompt_tokens"],
-                    answer_data["completion_tokens"],
-                    answer_data["total_tokens"],
-                    answer_data["eval_prompt_tokens"],
-                    answer_data["eval_completion_tokens"],
-                    answer_data["eval_total_tokens"],
-                    answer_data["openai_cost"],
-                    timestamp
-                ),
+            execute_values(
+                cur,
+                f"INSERT INTO conversations ({CONVERSATION_COLUMNS}) VALUES %s",
+                [
+                    conversation_row(conversation_id, question, answer_data, timestamp)
+                    for conversation_id, question, answer_data in conversations
+                ],
+                page_size=max(len(conversations), 1),
             )
         conn.commit()
-    finally:
-        conn.close()
 
 
 def save_feedback(conversation_id, feedback, timestamp=None):
     if timestamp is None:
         timestamp = datetime.now(tz)
 
-    conn = get_db_connection()
-    try:
+    with connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO feedback (conversation_id, feedback, timestamp) VALUES (%s, %s, COALESCE(%s, CURRENT_TIMESTAMP))",
                 (conversation_id, feedback, timestamp),
             )
         conn.commit()
-    finally:
-        conn.close()
+
+
+def update_evaluations(evaluations):
+    # evaluations: (conversation_id, relevance, explanation, eval_tokens, eval_cost) tuples, written in one statement
+    with connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """
+                UPDATE conversations AS c
+                SET relevance = v.relevance, relevance_explanation = v.relevance_explanation,
+                eval_prompt_tokens = v.eval_prompt_tokens, eval_completion_tokens = v.eval_completion_tokens,
+                eval_total_tokens = v.eval_total_tokens, openai_cost = c.openai_cost + v.eval_cost
+                FROM (VALUES %s) AS v (id, relevance, relevance_explanation, eval_prompt_tokens,
+                eval_completion_tokens, eval_total_tokens, eval_cost)
+                WHERE c.id = v.id
+                """,
+                [
+                    (
+                        conversation_id,
+                        relevance,
+                        explanation,
+                        eval_tokens["prompt_tokens"],
+                        eval_tokens["completion_tokens"],
+                        eval_tokens["total_tokens"],
+                        float(eval_cost),
+                    )
+                    for conversation_id, relevance, explanation, eval_tokens, eval_cost in evaluations
+                ],
+            )
+        conn.commit()
+
+
+def update_relevance(conversation_id, relevance, explanation):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE conversations SET relevance = %s, relevance_explanation = %s WHERE id = %s",
+                (relevance, explanation, conversation_id),
+            )
+        conn.commit()
+
+
+def get_cached_answer(key):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT answer FROM answer_cache WHERE key = %s", (key,))
+            row = cur.fetchone()
+            return None if row is None else row[0]
+
+
+def save_cached_answer(key, catalog, question, doc_ids, answer, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now(tz)
+
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO answer_cache (key, catalog, question, doc_ids, answer, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (key) DO NOTHING
+                """,
+                (key, catalog, question, json.dumps(doc_ids), answer, timestamp),
+            )
+        conn.commit()
+
+
+def purge_cached_answers(catalog):
+    # Answers generated from another catalog can never be hit again
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM answer_cache WHERE catalog <> %s", (catalog,))
+            deleted = cur.rowcount
+        conn.commit()
+        return deleted
+
+
+# psycopg2 is blocking, so the async API runs the queries in worker threads and the event loop stays free
+async def save_conversation_async(conversation_id, question, answer_data, timestamp=None):
+    await asyncio.to_thread(save_conversation, conversation_id, question, answer_data, timestamp)
+
+
+async def save_conversations_async(conversations, timestamp=None):
+    await asyncio.to_thread(save_conversations, conversations, timestamp)
+
+
+async def save_feedback_async(conversation_id, feedback, timestamp=None):
+    await asyncio.to_thread(save_feedback, conversation_id, feedback, timestamp)
+
+
+async def update_evaluations_async(evaluations):
+    await asyncio.to_thread(update_evaluations, evaluations)
+
+
+async def update_relevance_async(conversation_id, relevance, explanation):
+    await asyncio.to_thread(update_relevance, conversation_id, relevance, explanation)
+
+
+async def get_cached_answer_async(key):
+    return await asyncio.to_thread(get_cached_answer, key)
+
+
+async def save_cached_answer_async(key, catalog, question, doc_ids, answer, timestamp=None):
+    await asyncio.to_thread(save_cached_answer, key, catalog, question, doc_ids, answer, timestamp)
 
 
 def get_recent_conversations(limit=5, relevance=None):
-    conn = get_db_connection()
-    try:
+    with connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             query = """
                 SELECT c.*, f.feedback
@@ -126,13 +321,10 @@ def get_recent_conversations(limit=5, relevance=None):
 
             cur.execute(query, (limit,))
             return cur.fetchall()
-    finally:
-        conn.close()
 
 
 def get_feedback_stats():
-    conn = get_db_connection()
-    try:
+    with connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             cur.execute("""
                 SELECT 
@@ -141,14 +333,11 @@ def get_feedback_stats():
                 FROM feedback
             """)
             return cur.fetchone()
-    finally:
-        conn.close()
 
 
 def check_timezone():
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute("SHOW timezone;")
             db_timezone = cur.fetchone()[0]
             print(f"Database timezone: {db_timezone}")
@@ -189,10 +378,3 @@ def check_timezone():
             conn.commit()
     except Exception as e:
         print(f"An error occurred: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
-
-
-if RUN_TIMEZONE_CHECK:
-    check_timezone()
\ No newline at end of file
@@ -1,12 +1,11 @@
-import os
 from dotenv import load_dotenv
 
-os.environ['RUN_TIMEZONE_CHECK'] = '0'
-
-from db import init_db
+from db import check_timezone, close_pool, init_db
 
 load_dotenv()
 
 if __name__ == "__main__":
     print("Initializing database...")
-    init_db()
\ No newline at end of file
+    init_db()
+    check_timezone()
+    close_pool()
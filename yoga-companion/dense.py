@@ -0,0 +1,286 @@
+import threading
+
+from sklearn.cluster import KMeans
+from sklearn.decomposition import TruncatedSVD
+
+import numpy as np
+
+import minsearch
+
+
+class DenseIndex:
+    """
+    A dense vector search index using latent semantic analysis (LSA) over the TF-IDF matrix of minsearch.Index.
+
+    Documents are projected with TruncatedSVD into a small dense space and stored as one contiguous,
+    L2-normalized float32 matrix. Queries are vectorized with the sparse index, including boosts, projected
+    the same way and scored by exact dot products. For large catalogs an optional IVF-style coarse quantizer
+    (k-means lists) restricts the search to the documents of the lists closest to the query. Everything is
+    computed locally, no network access is needed.
+
+    The vectors follow the source index: once its version changes (add, update, delete, compact or refit),
+    the next search refits them, since its rows and vocabulary no longer match. When the source is not the
+    TF-IDF index itself, e.g. a BM25 index, the TF-IDF index is refit first with its live documents.
+
+    Attributes:
+        sparse_index (minsearch.Index): The TF-IDF index providing document and query vectors.
+        source: The index the vectors follow, the sparse index unless set otherwise.
+        n_components (int): Requested number of LSA dimensions.
+        n_lists (int): Number of IVF lists, None or 0 for exact brute-force search.
+        n_probe (int): Number of IVF lists searched per query.
+        svd (TruncatedSVD): The fitted projection.
+        vectors (np.ndarray): L2-normalized float32 document vectors, one row per document.
+        centroids (np.ndarray): L2-normalized float32 IVF list centroids.
+        list_offsets (np.ndarray): Start of every IVF list in list_rows (n_lists + 1 entries).
+        list_rows (np.ndarray): Document rows grouped by IVF list, sorted inside each list.
+        version (int): Changes whenever the vectors are refit or the source index changes, so caches can
+            invalidate.
+    """
+
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}, n_components=128,
+                 n_lists=None, n_probe=8, random_state=1):
+        """
+        Initializes the DenseIndex with specified text and keyword fields.
+
+        Args:
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            n_components (int): Number of LSA dimensions. Capped by the vocabulary size. Defaults to 128.
+            n_lists (int): Number of IVF lists. Defaults to None (exact search over all documents).
+            n_probe (int): Number of IVF lists searched per query. Defaults to 8.
+            random_state (int): Seed of the SVD and k-means fits. Defaults to 1.
+        """
+        self.sparse_index = minsearch.Index(text_fields, keyword_fields, vectorizer_params)
+        self.source = self.sparse_index
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+        self.svd = None
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.centroids = None
+        self.list_offsets = None
+        self.list_rows = None
+        self._fits = 0
+        self._source_version = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_index(cls, index, **params):
+        """
+        Builds a DenseIndex on top of an already fitted minsearch.Index, sharing its matrices and documents.
+
+        Args:
+            index (minsearch.Index): A fitted TF-IDF index.
+            **params: DenseIndex parameters (n_components, n_lists, n_probe, random_state).
+
+        Returns:
+            DenseIndex: The fitted dense index.
+        """
+        dense = cls(index.text_fields, index.keyword_fields, index.vectorizer_params, **params)
+        dense.sparse_index = dense.source = index
+        return dense._fit_vectors()
+
+    @classmethod
+    def following(cls, index, text_fields, keyword_fields, **params):
+        """
+        Builds a DenseIndex over the documents of another kind of index, e.g. a BM25 index, refitting its own
+        TF-IDF index whenever that index changes.
+
+        Args:
+            index: The index to follow. It must have docs and version attributes.
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            **params: DenseIndex parameters (vectorizer_params, n_components, n_lists, n_probe, random_state).
+
+        Returns:
+            DenseIndex: The fitted dense index.
+        """
+        dense = cls(text_fields, keyword_fields, **params)
+        dense.source = index
+        return dense._refit()
+
+    @property
+    def version(self):
+        # Both counters only grow, so their sum changes whenever either does
+        return self._fits + self.source.version
+
+    @property
+    def analyzer(self):
+        return self.sparse_index.analyzer
+
+    @property
+    def docs(self):
+        return self.sparse_index.docs
+
+    def fit(self, docs):
+        """
+        Fits the TF-IDF index and the dense projection with the provided documents.
+
+        Args:
+            docs (list of dict): List of documents to index. Each document is a dictionary.
+        """
+        self.sparse_index.fit(docs)
+        return self._fit_vectors()
+
+    def _refit(self):
+        if self.source is not self.sparse_index:
+            deleted = getattr(self.source, "deleted", None)
+            self.sparse_index.fit([
+                doc for row, doc in enumerate(self.source.docs) if deleted is None or not deleted[row]
+            ])
+        return self._fit_vectors()
+
+    def _check_version(self):
+        if self.source.version != self._source_version:
+            with self._lock:
+                if self.source.version != self._source_version:
+                    self._refit()
+
+    def _fit_vectors(self):
+        source_version = self.source.version
+        matrix = self.sparse_index.text_matrix
+        n_components = max(1, min(self.n_components, matrix.shape[1] - 1, matrix.shape[0] - 1))
+
+        self.svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        self.vectors = _normalize_rows(self.svd.fit_transform(matrix))
+
+        if self.n_lists:
+            n_lists = min(self.n_lists, len(self.vectors))
+            kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state).fit(self.vectors)
+            self.centroids = _normalize_rows(kmeans.cluster_centers_)
+
+            labels = kmeans.labels_
+            self.list_rows = np.argsort(labels, kind='stable').astype(np.int32)
+            self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels, minlength=n_lists), out=self.list_offsets[1:])
+        else:
+            self.centroids = self.list_offsets = self.list_rows = None
+
+        self._source_version = source_version
+        self._fits += 1
+        return self
+
+    def _query_vectors(self, queries, boost_dict):
+        sparse = self.sparse_index.query_matrix(queries, boost_dict)
+        return _normalize_rows(self.svd.transform(sparse))
+
+    def _probe(self, query_vector):
+        """
+        Returns the sorted document rows of the IVF lists closest to the query vector.
+        """
+        n_probe = min(self.n_probe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query_vector), n_probe - 1)[:n_probe]
+        rows = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in closest]
+        return np.sort(np.concatenate(rows))
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with several queries, sharing the filters and boost parameters.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields, applied to the query before projection.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            output_scores (bool): Return (document, cosine similarity) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of list of dict: For every query, the list of matching documents ranked by similarity.
+        """
+        if len(queries) == 0:
+            return []
+
+        self._check_version()
+        index = self.sparse_index
+        query_vectors = self._query_vectors(queries, boost_dict)
+
+        allowed = index.keyword_index.candidates(filter_dict)
+        if index.deleted.any():
+            live = np.flatnonzero(~index.deleted)
+            allowed = live if allowed is None else np.intersect1d(allowed, live, assume_unique=True)
+
+        results = []
+        for query_vector in query_vectors:
+            rows = allowed
+            if self.centroids is not None:
+                probed = self._probe(query_vector)
+                rows = probed if rows is None else np.intersect1d(rows, probed, assume_unique=True)
+
+            if rows is None:
+                scores = self.vectors @ query_vector
+            else:
+                scores = self.vectors[rows] @ query_vector
+
+            k = min(num_results, len(scores))
+            if k <= 0:
+                results.append([])
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.lexsort((top, -scores[top]))]
+            top = top[scores[top] > 0]
+            top_scores = scores[top].tolist()
+            if rows is not None:
+                top = rows[top]
+            if output_scores:
+                results.append([(index.docs[i], score) for i, score in zip(top.tolist(), top_scores)])
+            else:
+                results.append([index.docs[i] for i in top.tolist()])
+
+        return results
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with the given query, filters, and boost parameters.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields, applied to the query before projection.
+            num_results (int): The number of top results to return. Defaults to 10.
+            output_scores (bool): Return (document, cosine similarity) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by similarity.
+        """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_scores)[0]
+
+
+def reciprocal_rank_fusion(rankings, k=60, key='id', num_results=10, output_scores=False):
+    """
+    Fuses several rankings of documents with reciprocal rank fusion.
+
+    Every document scores the sum of 1 / (k + rank) over the rankings it appears in, with ranks starting at 1.
+    Ties keep the order in which documents were first seen.
+
+    Args:
+        rankings (list of list of dict): Ranked document lists, e.g. sparse and dense search results.
+        k (int): Rank smoothing constant. Defaults to 60.
+        key (str): Document field identifying the same document across rankings. Defaults to 'id'.
+        num_results (int): The number of fused results to return. Defaults to 10.
+        output_scores (bool): Return (document, fused score) pairs instead of documents. Defaults to False.
+
+    Returns:
+        list of dict: The fused ranking.
+    """
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            doc_key = doc[key]
+            scores[doc_key] = scores.get(doc_key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(doc_key, doc)
+
+    fused = sorted(scores, key=scores.get, reverse=True)
+    if output_scores:
+        return [(docs[doc_key], scores[doc_key]) for doc_key in fused[:num_results]]
+    return [docs[doc_key] for doc_key in fused[:num_results]]
+
+
+def _normalize_rows(matrix):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
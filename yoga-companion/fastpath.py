@@ -0,0 +1,192 @@
+import re
+import threading
+
+# Fields answered without the LLM: the intent pattern of the question, the template of a single answer,
+# and the label used when the answer depends on the variation (None: always left to the LLM then)
+LOOKUPS = {
+    "props_required": (
+        r"\b(props?|equipment|gear)\b",
+        "{pose} needs: {value}.",
+        "Props",
+    ),
+    "difficulty": (
+        r"\b(difficulty|difficult|hard|level|challenging)\b",
+        "{pose} is rated {value}.",
+        "Difficulty",
+    ),
+    "benefits": (
+        r"\b(benefits?)\b",
+        "{pose} {value_lower}.",
+        "Benefits",
+    ),
+    "instructions": (
+        r"\b(instructions|steps)\b|\bhow (do|can|should) (i|you) (do|perform|practice)\b",
+        "Here's how to do {pose}: {value}",
+        None,
+    ),
+}
+
+NO_PROPS = "Not Required"
+NO_PROPS_TEMPLATE = "{pose} doesn't need any props."
+VARIATIONS_TEMPLATE = "It depends on the variation of {pose}. {label} by variation:\n{lines}"
+
+# Words a lookup question may contain besides the pose, the variation and the intent
+FILLER_WORDS = {
+    "a", "an", "the", "of", "for", "in", "to", "with", "is", "are", "does", "do", "did", "can", "should",
+    "what", "which", "whats", "how", "i", "you", "me", "my", "it", "this", "that", "pose", "yoga",
+    "need", "needs", "needed", "require", "requires", "required", "use", "used", "any", "level", "please",
+    "variation", "version",
+}
+
+
+def normalize(text):
+    # Lower case words, apostrophes dropped so "Child's" and "childs" match
+    return re.sub(r"[^a-z0-9]+", " ", str(text).lower().replace("'", "")).split()
+
+
+def _find(tokens, phrase):
+    # Start of the first occurrence of phrase (a token list) in tokens, or -1
+    for start in range(len(tokens) - len(phrase) + 1):
+        if tokens[start:start + len(phrase)] == phrase:
+            return start
+    return -1
+
+
+class FastPath:
+    """
+    Answers direct field lookups about one pose from the catalog, without the LLM.
+
+    A question is answered when all of these hold:
+
+    * it names exactly one pose, and at most one variation of it,
+    * exactly one lookup intent matches (props, difficulty, benefits or instructions),
+    * nothing else is left in it but filler words, so it asks for the field and nothing more,
+    * the top search result is one of the documents it names, so retrieval agrees.
+
+    When the named documents agree on the field, the answer is a one-line template. When they do not,
+    the answer lists the value of every variation, except for fields without a variations label, which
+    are left to the LLM. Everything else falls back to the LLM.
+
+    Attributes:
+        index: The search index. Its documents are grouped by pose, and its version triggers a regroup.
+        lookups (dict): Field name to (intent pattern, template, variations label).
+        pose_field (str): Field holding the pose name.
+        variation_field (str): Field holding the variation name.
+    """
+
+    def __init__(self, index, lookups=LOOKUPS, pose_field="pose_name", variation_field="variation"):
+        """
+        Initializes the fast path over the documents of index.
+
+        Args:
+            index: The search index. It must have docs and version attributes.
+            lookups (dict): Field name to (intent pattern, template, variations label). Defaults to LOOKUPS.
+            pose_field (str): Field holding the pose name. Defaults to 'pose_name'.
+            variation_field (str): Field holding the variation name. Defaults to 'variation'.
+        """
+        self.index = index
+        self.lookups = {field: (re.compile(pattern), *rest) for field, (pattern, *rest) in lookups.items()}
+        self.pose_field = pose_field
+        self.variation_field = variation_field
+
+        self._version = None
+        self._lock = threading.Lock()
+        self._check_version()
+
+    def _check_version(self):
+        with self._lock:
+            if self.index.version == self._version:
+                return
+            poses = {}
+            variations = {}
+            # Rows replaced or deleted stay in docs, tombstoned, until the index is compacted
+            deleted = getattr(self.index, "deleted", None)
+            for row, doc in enumerate(self.index.docs):
+                if deleted is not None and deleted[row]:
+                    continue
+                poses.setdefault(doc[self.pose_field], []).append(doc)
+                variation = str(doc[self.variation_field])
+                # "With Block" is recognized by "block", "No Variation" is never named
+                if not variation.lower().startswith("no "):
+                    variations[normalize(variation)[-1]] = variation
+            # Longer pose names first, so a pose named inside another one's name is not matched on its own
+            self._poses = sorted(((normalize(pose), pose, docs) for pose, docs in poses.items()),
+                                 key=lambda item: -len(item[0]))
+            self._variations = variations
+            self._version = self.index.version
+
+    def _named_pose(self, tokens):
+        found = []
+        taken = set()
+        for pose_tokens, pose, docs in self._poses:
+            start = _find(tokens, pose_tokens)
+            span = set(range(start, start + len(pose_tokens)))
+            if start >= 0 and not span & taken:
+                found.append((pose, docs))
+                taken |= span
+        return found, taken
+
+    def answer(self, query, results):
+        """
+        Answers a lookup question from the catalog.
+
+        Args:
+            query (str): The user question.
+            results (list of tuple): The (document, score) search results of the question.
+
+        Returns:
+            tuple: The answer and the field looked up, or (None, None) when the LLM has to answer.
+        """
+        self._check_version()
+        tokens = normalize(query)
+
+        poses, pose_positions = self._named_pose(tokens)
+        if len(poses) != 1:
+            return None, None
+        pose, docs = poses[0]
+
+        rest = [token for i, token in enumerate(tokens) if i not in pose_positions]
+        named_variations = {self._variations[token] for token in rest if token in self._variations}
+        if len(named_variations) > 1:
+            return None, None
+        if named_variations:
+            variation = named_variations.pop()
+            docs = [doc for doc in docs if str(doc[self.variation_field]) == variation]
+            if not docs:
+                return None, None
+            rest = [token for token in rest if self._variations.get(token) != variation]
+
+        text = " ".join(rest)
+        intents = [field for field, (pattern, _, _) in self.lookups.items() if pattern.search(text)]
+        if len(intents) != 1:
+            return None, None
+        field = intents[0]
+        pattern, template, label = self.lookups[field]
+
+        leftover = set(pattern.sub(" ", text).split()) - FILLER_WORDS
+        if leftover:
+            return None, None
+
+        if not results or results[0][0]["id"] not in {doc["id"] for doc in docs}:
+            return None, None
+
+        values = {}
+        for doc in docs:
+            values.setdefault(str(doc[field]), []).append(str(doc[self.variation_field]))
+
+        if len(values) == 1:
+            value = next(iter(values))
+            variations = {str(doc[self.variation_field]) for doc in docs}
+            name = pose
+            if len(variations) == 1 and not next(iter(variations)).lower().startswith("no "):
+                name = f"{pose} ({next(iter(variations))})"
+            if field == "props_required" and value == NO_PROPS:
+                return NO_PROPS_TEMPLATE.format(pose=name), field
+            return template.format(pose=name, value=value, value_lower=value.lower()), field
+
+        if label is None:
+            return None, None
+        lines = "\n".join(
+            f"- {value}: {', '.join(sorted(set(variations)))}" for value, variations in sorted(values.items())
+        )
+        return VARIATIONS_TEMPLATE.format(label=label, pose=pose, lines=lines), field
@@ -0,0 +1,451 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from time import monotonic
+
+from tokens import estimate_tokens
+
+# Seconds an LLM call may take, and to open its connection. A streamed call may wait this long per chunk.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Retries of a call failing with 429, 5xx, a timeout or a connection error, waiting base * 2^attempt (jittered)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Calls in flight per process and per API: the sync and the async API have separate limits, so a process
+# using both may have twice as many calls in flight. Further calls queue, for at most LLM_QUEUE_TIMEOUT seconds.
+LLM_MAX_CONCURRENCY_PER_API = int(os.getenv("LLM_MAX_CONCURRENCY_PER_API", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "0")) or None
+# Tokens per minute sent to the API, 0 for no limit. Calls reserve their prompt plus an estimated completion.
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "256"))
+# Seconds after which a second, identical request is sent if the first has not answered, 0 disables hedging
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+# Most calls that may be hedged, so a general slowdown cannot double the load on the API
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+# Pooled HTTP connections per client
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", str(2 * LLM_MAX_CONCURRENCY_PER_API)))
+
+
+class LLMOverloadedError(Exception):
+    """
+    Raised when a call waited longer than the queue timeout for a free concurrency slot.
+    """
+
+
+class TokenBucket:
+    """
+    Limits the tokens sent per minute.
+
+    Callers reserve their tokens right away and may leave the bucket in debt, then wait until the refill
+    covers it. Reservations are therefore served in arrival order, and a large call cannot be starved by
+    small ones. Once a call returns, its estimate is corrected with the actual usage.
+
+    Attributes:
+        tokens_per_minute (int): Refill rate and capacity of the bucket.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self._rate = tokens_per_minute / 60
+        self._level = float(tokens_per_minute)
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self._level = min(self.tokens_per_minute, self._level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, tokens):
+        """
+        Takes tokens from the bucket.
+
+        Returns:
+            float: Seconds to wait before sending the call.
+        """
+        with self._lock:
+            self._refill()
+            self._level -= min(tokens, self.tokens_per_minute)
+            return 0.0 if self._level >= 0 else -self._level / self._rate
+
+    def adjust(self, tokens):
+        """
+        Takes more tokens from the bucket, or gives some back when tokens is negative.
+        """
+        with self._lock:
+            self._refill()
+            self._level = min(self.tokens_per_minute, self._level - tokens)
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._level
+
+
+class LLMGateway:
+    """
+    Sends chat completions to the OpenAI API with pooled connections, timeouts, retries and limits.
+
+    * Both clients keep a pool of pool_size HTTP connections, and every call has a timeout.
+    * Calls failing with 429, 5xx, a timeout or a connection error are retried with jittered exponential
+      backoff, honouring Retry-After. The SDK's own retries are disabled.
+    * At most max_concurrency_per_api calls are in flight per API: the sync and the async API each have
+      their own limit, since a thread and an event loop cannot wait on the same primitive. A process using
+      both may therefore have twice as many calls in flight. Further calls wait in line, so overload turns
+      into queueing instead of piling timeouts onto the API.
+    * An optional token bucket, shared by both APIs, keeps the estimated tokens per minute under the limit.
+    * With hedge_after set, an async call that has not answered after hedge_after seconds gets a second,
+      identical request if a concurrency slot and tokens are free, and fewer than hedge_budget of all
+      calls were hedged. The first answer wins and the other request is cancelled. Streams are not hedged.
+    * The OpenAI SDK is imported and the clients are built on first use, or by connect(), so creating the
+      gateway costs nothing. Async calls build them in a thread, off the event loop.
+
+    Attributes:
+        client (OpenAI): The sync client.
+        async_client (AsyncOpenAI): The async client.
+        max_concurrency_per_api (int): Calls in flight per API.
+        queue_timeout (float): Seconds a call may wait for a slot before LLMOverloadedError. None waits.
+        max_retries (int): Retries of a failed call.
+        backoff_base (float): Delay before the first retry, doubled for every further retry.
+        backoff_max (float): Longest delay between retries.
+        hedge_after (float): Seconds before a hedged request. 0 disables hedging.
+        hedge_budget (float): Most calls that may be hedged.
+        bucket (TokenBucket): The tokens per minute limiter, None without a limit.
+        count_tokens (callable): Function estimating the tokens of a prompt.
+        completion_estimate (int): Completion tokens reserved for every call.
+    """
+
+    def __init__(self, timeout=LLM_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX,
+                 max_concurrency_per_api=LLM_MAX_CONCURRENCY_PER_API, queue_timeout=LLM_QUEUE_TIMEOUT,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, completion_estimate=LLM_COMPLETION_ESTIMATE,
+                 hedge_after=LLM_HEDGE_AFTER, hedge_budget=LLM_HEDGE_BUDGET, pool_size=LLM_POOL_SIZE,
+                 count_tokens=estimate_tokens):
+        """
+        Initializes the gateway. The API key and base URL of its clients come from the usual OpenAI variables.
+
+        Args:
+            timeout (float): Seconds a call may take. Defaults to LLM_TIMEOUT.
+            connect_timeout (float): Seconds to open a connection. Defaults to LLM_CONNECT_TIMEOUT.
+            max_retries (int): Retries of a failed call. Defaults to LLM_MAX_RETRIES.
+            backoff_base (float): Delay before the first retry. Defaults to LLM_BACKOFF_BASE.
+            backoff_max (float): Longest delay between retries. Defaults to LLM_BACKOFF_MAX.
+            max_concurrency_per_api (int): Calls in flight per API. Defaults to LLM_MAX_CONCURRENCY_PER_API.
+            queue_timeout (float): Seconds a call may wait for a slot. Defaults to LLM_QUEUE_TIMEOUT.
+            tokens_per_minute (int): Token limit, 0 for none. Defaults to LLM_TOKENS_PER_MINUTE.
+            completion_estimate (int): Completion tokens reserved per call. Defaults to LLM_COMPLETION_ESTIMATE.
+            hedge_after (float): Seconds before a hedged request, 0 disables it. Defaults to LLM_HEDGE_AFTER.
+            hedge_budget (float): Most calls that may be hedged. Defaults to LLM_HEDGE_BUDGET.
+            pool_size (int): Pooled HTTP connections per client. Defaults to LLM_POOL_SIZE.
+            count_tokens (callable): Function estimating the tokens of a prompt. Defaults to estimate_tokens.
+        """
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.max_concurrency_per_api = max_concurrency_per_api
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.hedge_budget = hedge_budget
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.count_tokens = count_tokens
+        self.completion_estimate = completion_estimate
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.overloaded = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.in_flight = 0
+        self.queue_wait = 0.0
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency_per_api)
+        self._async_semaphore = None
+        self._loop = None
+        self._client = None
+        self._async_client = None
+        self._connect_lock = threading.Lock()
+
+    def connect(self):
+        """
+        Builds the sync and async clients, unless they already exist.
+        """
+        with self._connect_lock:
+            if self._async_client is not None:
+                return
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            client_timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+            self._client = OpenAI(
+                max_retries=0, timeout=client_timeout, http_client=DefaultHttpxClient(limits=limits)
+            )
+            self._async_client = AsyncOpenAI(
+                max_retries=0, timeout=client_timeout, http_client=DefaultAsyncHttpxClient(limits=limits)
+            )
+
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+
+    @property
+    def async_client(self):
+        self.connect()
+        return self._async_client
+
+    async def _connect_async(self):
+        if self._async_client is None:
+            await asyncio.to_thread(self.connect)
+
+    def _slots(self):
+        # asyncio primitives belong to one event loop, a new loop gets a new semaphore
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency_per_api)
+        return self._async_semaphore
+
+    def _estimate(self, messages):
+        return sum(self.count_tokens(message["content"]) for message in messages) + self.completion_estimate
+
+    def _reserve(self, estimate):
+        return 0.0 if self.bucket is None else self.bucket.reserve(estimate)
+
+    def _settle(self, estimate, usage):
+        if self.bucket is not None and usage is not None:
+            self.bucket.adjust(usage.total_tokens - estimate)
+
+    def _refund(self, estimate):
+        if self.bucket is not None:
+            self.bucket.adjust(-estimate)
+
+    @staticmethod
+    def is_retryable(error):
+        import openai
+
+        if isinstance(error, openai.APIConnectionError):
+            return True
+        return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+    def retry_delay(self, attempt, error):
+        """
+        Returns the seconds to wait before retry number attempt (from 0), from Retry-After when the API sent it.
+        """
+        response = getattr(error, "response", None)
+        if response is not None:
+            for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+                try:
+                    return min(self.backoff_max, float(response.headers[header]) * scale)
+                except (KeyError, ValueError):
+                    pass
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _failed(self, attempt, error):
+        # Returns the delay before the next attempt, or raises when the call cannot be retried
+        if attempt >= self.max_retries or not self.is_retryable(error):
+            self.failures += 1
+            raise error
+        self.retries += 1
+        return self.retry_delay(attempt, error)
+
+    def complete(self, messages, model="gpt-4o-mini", **params):
+        """
+        Sends a chat completion with the sync client.
+
+        Args:
+            messages (list of dict): The chat messages.
+            model (str): The model name. Defaults to 'gpt-4o-mini'.
+            **params: Further chat completion parameters.
+
+        Returns:
+            ChatCompletion: The API response.
+        """
+        estimate = self._estimate(messages)
+        t0 = monotonic()
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            self.overloaded += 1
+            raise LLMOverloadedError(f"No free LLM slot after {self.queue_timeout} s")
+        self.queue_wait += monotonic() - t0
+        self.in_flight += 1
+        self.calls += 1
+
+        try:
+            attempt = 0
+            while True:
+                time.sleep(self._reserve(estimate))
+                try:
+                    response = self.client.chat.completions.create(model=model, messages=messages, **params)
+                except Exception as e:
+                    self._refund(estimate)
+                    time.sleep(self._failed(attempt, e))
+                    attempt += 1
+                    continue
+                self._settle(estimate, response.usage)
+                return response
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _acquire(self):
+        slots = self._slots()
+        t0 = monotonic()
+        if self.queue_timeout is None:
+            await slots.acquire()
+        else:
+            try:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.overloaded += 1
+                raise LLMOverloadedError(f"No free LLM slot after {self.queue_timeout} s") from None
+        self.queue_wait += monotonic() - t0
+        self.in_flight += 1
+        self.calls += 1
+        return slots
+
+    def _release(self, slots):
+        self.in_flight -= 1
+        slots.release()
+
+    async def _hedged(self, slots, estimate, create):
+        # One attempt, with a second request if the first is slow and a slot and tokens are free
+        first = asyncio.ensure_future(create())
+        tasks = {first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done:
+                return first.result()
+
+            if (
+                self.hedges < self.hedge_budget * self.calls
+                and not slots.locked()
+                and (self.bucket is None or self.bucket.available() >= estimate)
+            ):
+                await slots.acquire()
+                hedged = True
+                self.hedges += 1
+                self._reserve(estimate)
+                second = asyncio.ensure_future(create())
+                tasks.add(second)
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if hedged:
+                # The caller settles one reservation with the usage of the answer, the other is given back
+                self._refund(estimate)
+                slots.release()
+
+    async def complete_async(self, messages, model="gpt-4o-mini", **params):
+        """
+        Sends a chat completion with the async client, hedged if hedge_after is set.
+
+        Args and return value are the same as for complete.
+        """
+        await self._connect_async()
+        estimate = self._estimate(messages)
+        slots = await self._acquire()
+
+        def create():
+            return self.async_client.chat.completions.create(model=model, messages=messages, **params)
+
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self._reserve(estimate))
+                try:
+                    if self.hedge_after > 0:
+                        response = await self._hedged(slots, estimate, create)
+                    else:
+                        response = await create()
+                except Exception as e:
+                    self._refund(estimate)
+                    await asyncio.sleep(self._failed(attempt, e))
+                    attempt += 1
+                    continue
+                self._settle(estimate, response.usage)
+                return response
+        finally:
+            self._release(slots)
+
+    async def stream(self, messages, model="gpt-4o-mini", **params):
+        """
+        Streams a chat completion with the async client, holding a concurrency slot until it ends.
+
+        Only opening the stream is retried, a stream failing midway raises.
+
+        Args:
+            messages (list of dict): The chat messages.
+            model (str): The model name. Defaults to 'gpt-4o-mini'.
+            **params: Further chat completion parameters.
+
+        Yields:
+            ChatCompletionChunk: The chunks of the completion. The last one carries the usage.
+        """
+        await self._connect_async()
+        estimate = self._estimate(messages)
+        slots = await self._acquire()
+
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self._reserve(estimate))
+                try:
+                    stream = await self.async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **params,
+                    )
+                    break
+                except Exception as e:
+                    self._refund(estimate)
+                    await asyncio.sleep(self._failed(attempt, e))
+                    attempt += 1
+
+            usage = None
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                yield chunk
+            self._settle(estimate, usage)
+        finally:
+            self._release(slots)
+
+    def stats(self):
+        """
+        Returns the gateway counters.
+
+        Returns:
+            dict: Calls, retries, failures, overloaded, hedges, hedge wins, calls in flight and mean queue wait.
+        """
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "overloaded": self.overloaded,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "in_flight": self.in_flight,
+            "mean_queue_wait": self.queue_wait / self.calls if self.calls else 0.0,
+        }
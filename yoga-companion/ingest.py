@@ -1,12 +1,90 @@
 # import the necessary libraries
 import minsearch
-import pandas as pd
+import bm25
+import dense
+import sharding
+import numpy as np
+import scipy.sparse as sp
+import functools
+import hashlib
+import mmap
 import os
+import shutil
+import tempfile
 
 DATA_PATH = os.getenv("DATA_PATH", "../data/yoga_poses.csv")
+INDEX_ENGINE = os.getenv("INDEX_ENGINE", "tfidf")
+DENSE_COMPONENTS = int(os.getenv("DENSE_COMPONENTS", "128"))
+# 0 searches all dense vectors exactly, more lists switch on the IVF coarse quantizer
+DENSE_LISTS = int(os.getenv("DENSE_LISTS", "0"))
+DENSE_PROBE = int(os.getenv("DENSE_PROBE", "8"))
+# Compact float32 TF-IDF index with columnar document storage, see minsearch.Index low_memory
+INDEX_LOW_MEMORY = os.getenv("INDEX_LOW_MEMORY", "0") == "1"
+# Number of worker processes of the sharded engine, 0 uses one per CPU
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "0"))
+# Set INDEX_SNAPSHOT_DIR to an empty string to always refit the index
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")
 
+# Bump when the snapshot layout changes, so old snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+
+TEXT_FIELDS = [
+    "pose_name",
+    "type_of_practice",
+    "variation",
+    "position",
+    "difficulty",
+    "props_required",
+    "body_focus",
+    "benefits",
+    "instructions",
+]
+KEYWORD_FIELDS = [
+    "id",
+    "difficulty",
+    "type_of_practice",
+    "position",
+    "props_required",
+]
+
+ENGINES = {
+    "tfidf": minsearch.Index,
+    "bm25": bm25.BM25Index,
+    "sharded": functools.partial(sharding.ShardedIndex, n_shards=INDEX_SHARDS or None),
+}
+
+# Extra constructor parameters of every engine
+ENGINE_PARAMS = {
+    "tfidf": {"low_memory": INDEX_LOW_MEMORY},
+}
+
+
+def data_hash(data_path):
+    sha = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def snapshot_path(data_path, engine, snapshot_dir=None):
+    if snapshot_dir is None:
+        snapshot_dir = os.path.join(os.path.dirname(os.path.abspath(data_path)), "index_snapshots")
+
+    # The key covers the data content and everything that changes how the index is built
+    key = hashlib.sha256(
+        f"{data_hash(data_path)}|{engine}|{ENGINE_PARAMS.get(engine)}|{TEXT_FIELDS}|{KEYWORD_FIELDS}|{SNAPSHOT_VERSION}".encode()
+    ).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"{engine}-{key}")
+
+
+def build_index(data_path=DATA_PATH, engine=INDEX_ENGINE):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown index engine: {engine}. Expected one of {list(ENGINES)}")
+
+    # Only needed without a snapshot, loading one does not import pandas
+    import pandas as pd
 
-def load_index(data_path=DATA_PATH):
     # Load the data
     data = pd.read_csv(data_path)
 
@@ -14,21 +92,92 @@ def load_index(data_path=DATA_PATH):
     documents = data.to_dict(orient="records")
 
     # Create an index for the search engine
-    index = minsearch.Index(
-        text_fields=[
-            "pose_name",
-            "type_of_practice",
-            "variation",
-            "position",
-            "difficulty",
-            "props_required",
-            "body_focus",
-            "benefits",
-            "instructions",
-        ],
-        keyword_fields=["id"],
+    index = ENGINES[engine](
+        text_fields=TEXT_FIELDS,
+        keyword_fields=KEYWORD_FIELDS,
+        **ENGINE_PARAMS.get(engine, {}),
     )
 
     # Add the documents to the index
     index.fit(documents)
     return index
+
+
+def save_snapshot(index, path):
+    # Write into a temporary directory first so readers never see a half-written snapshot
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        index.save(tmp_path)
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process published the same snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+
+    # Drop snapshots of older data for this engine
+    engine = os.path.basename(path).split("-")[0]
+    for name in os.listdir(parent):
+        stale = os.path.join(parent, name)
+        if name.startswith(f"{engine}-") and stale != path:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def load_index(data_path=DATA_PATH, engine=INDEX_ENGINE, snapshot_dir=INDEX_SNAPSHOT_DIR):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown index engine: {engine}. Expected one of {list(ENGINES)}")
+
+    # Engines without snapshot support (the sharded one keeps its matrices in worker processes) always refit
+    if snapshot_dir == "" or not hasattr(ENGINES[engine], "load"):
+        return build_index(data_path, engine)
+
+    path = snapshot_path(data_path, engine, snapshot_dir)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            return ENGINES[engine].load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Failed to load index snapshot {path}, rebuilding: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+
+    index = build_index(data_path, engine)
+    try:
+        save_snapshot(index, path)
+    except OSError as e:
+        print(f"Failed to save index snapshot {path}: {e}")
+    return index
+
+
+def build_dense_index(index, n_components=DENSE_COMPONENTS, n_lists=DENSE_LISTS, n_probe=DENSE_PROBE):
+    params = {"n_components": n_components, "n_lists": n_lists, "n_probe": n_probe}
+
+    # Reuse the TF-IDF matrices when the sparse index already has them
+    if isinstance(index, minsearch.Index):
+        return dense.DenseIndex.from_index(index, **params)
+
+    return dense.DenseIndex.following(index, TEXT_FIELDS, KEYWORD_FIELDS, **params)
+
+
+def is_memory_mapped(array):
+    # Whether an array is a view of a memory-mapped file, like the arrays loaded from a snapshot
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def index_status(index):
+    # Readiness details: the number of documents, and whether all index arrays are memory-mapped, so
+    # that processes loading the same snapshot share them instead of holding their own copy
+    arrays = []
+    for value in vars(index).values():
+        if sp.issparse(value):
+            arrays.append(value.data)
+        elif isinstance(value, np.ndarray):
+            arrays.append(value)
+    return {
+        "documents": len(index.docs),
+        "version": index.version,
+        "memory_mapped": bool(arrays) and all(is_memory_mapped(array) for array in arrays),
+    }
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import random
+
+# Share of conversations sent to the LLM judge, between 0 and 1
+JUDGE_SAMPLE_RATE = float(os.getenv("JUDGE_SAMPLE_RATE", "1.0"))
+JUDGE_QUEUE_SIZE = int(os.getenv("JUDGE_QUEUE_SIZE", "1000"))
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", "2"))
+# What to do when the queue is full: drop_new, drop_oldest or block
+JUDGE_OVERFLOW = os.getenv("JUDGE_OVERFLOW", "drop_new")
+# Conversations judged by one LLM call, and the longest a worker waits to fill a batch
+JUDGE_BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "10"))
+JUDGE_BATCH_WAIT = float(os.getenv("JUDGE_BATCH_WAIT", "0.5"))
+
+PENDING = "PENDING"
+SKIPPED = "SKIPPED"
+
+# Relevance explanation saved with a conversation until the judge replaces it
+EXPLANATIONS = {
+    PENDING: "Waiting for the LLM judge",
+    SKIPPED: "Not evaluated by the LLM judge",
+}
+
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block")
+
+
+class JudgeQueue:
+    """
+    Runs the LLM-as-judge relevance evaluation in background workers, off the request path.
+
+    Conversations are saved with a PENDING relevance and submitted here. Every worker takes a
+    micro-batch from the queue, flushed once it holds batch_size conversations or batch_wait seconds
+    after its first one, evaluates it with one call and saves all results at once. Conversations that
+    are not sampled, that are dropped because the queue is full or not running, or whose batch fails to be
+    evaluated or saved, are marked SKIPPED.
+
+    Attributes:
+        evaluate (callable): Async function taking a list of (question, answer) pairs and returning one
+            (relevance dict, token stats) tuple per pair.
+        save (callable): Async function taking a list of (conversation_id, relevance dict, token stats).
+        skip (callable): Async function (conversation_id, reason) marking a conversation as not evaluated.
+        maxsize (int): Maximum number of queued conversations.
+        sample_rate (float): Share of conversations that are evaluated.
+        overflow (str): Policy when the queue is full: drop_new, drop_oldest or block.
+        n_workers (int): Number of worker tasks.
+        batch_size (int): Maximum number of conversations evaluated together.
+        batch_wait (float): Seconds a worker waits for a batch to fill after its first conversation.
+        submitted (int): Number of conversations queued.
+        batches (int): Number of batches evaluated.
+        judged (int): Number of conversations evaluated and saved.
+        sampled_out (int): Number of conversations not selected by sampling.
+        dropped (int): Number of conversations dropped because the queue was full.
+        failed (int): Number of conversations whose evaluation or saving raised an error.
+    """
+
+    def __init__(self, evaluate, save, skip, maxsize=JUDGE_QUEUE_SIZE, sample_rate=JUDGE_SAMPLE_RATE,
+                 overflow=JUDGE_OVERFLOW, n_workers=JUDGE_WORKERS, batch_size=JUDGE_BATCH_SIZE,
+                 batch_wait=JUDGE_BATCH_WAIT):
+        """
+        Initializes the queue. Workers only run after start is called.
+
+        Args:
+            evaluate (callable): Async function taking a list of (question, answer) pairs and returning one
+                (relevance dict, token stats) tuple per pair.
+            save (callable): Async function taking a list of (conversation_id, relevance dict, token stats).
+            skip (callable): Async function (conversation_id, reason) marking a conversation as not evaluated.
+            maxsize (int): Maximum number of queued conversations. Defaults to JUDGE_QUEUE_SIZE.
+            sample_rate (float): Share of conversations that are evaluated. Defaults to JUDGE_SAMPLE_RATE.
+            overflow (str): Policy when the queue is full. Defaults to JUDGE_OVERFLOW.
+            n_workers (int): Number of worker tasks. Defaults to JUDGE_WORKERS.
+            batch_size (int): Maximum number of conversations per batch. Defaults to JUDGE_BATCH_SIZE.
+            batch_wait (float): Seconds to wait for a batch to fill. Defaults to JUDGE_BATCH_WAIT.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown judge overflow policy: {overflow}. Expected one of {list(OVERFLOW_POLICIES)}")
+
+        self.evaluate = evaluate
+        self.save = save
+        self.skip = skip
+        self.sample_rate = sample_rate
+        self.overflow = overflow
+        self.n_workers = n_workers
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+        self.submitted = 0
+        self.batches = 0
+        self.judged = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = None
+        self._workers = []
+
+    def should_judge(self):
+        """
+        Decides with the sample rate whether a new conversation is evaluated.
+
+        Returns:
+            str: PENDING if it should be submitted, SKIPPED otherwise. Use it as the initial relevance.
+        """
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return PENDING
+        self.sampled_out += 1
+        return SKIPPED
+
+    async def submit(self, conversation_id, question, answer):
+        """
+        Queues a saved conversation for evaluation, applying the overflow policy when the queue is full.
+        Before start or after stop, no worker would ever evaluate it, so it is marked SKIPPED instead.
+
+        Returns:
+            bool: Whether the conversation was queued.
+        """
+        if self._queue is None:
+            await self._skip(conversation_id, "Judge queue not running")
+            return False
+
+        job = (conversation_id, question, answer)
+
+        if self.overflow == "block":
+            await self._queue.put(job)
+        else:
+            if self._queue.full() and self.overflow == "drop_oldest":
+                dropped_id = self._queue.get_nowait()[0]
+                self._queue.task_done()
+                await self._drop(dropped_id)
+            if self._queue.full():
+                await self._drop(conversation_id)
+                return False
+            self._queue.put_nowait(job)
+
+        self.submitted += 1
+        return True
+
+    async def _drop(self, conversation_id):
+        self.dropped += 1
+        await self._skip(conversation_id, "Judge queue full")
+
+    async def _skip(self, conversation_id, reason):
+        try:
+            await self.skip(conversation_id, reason)
+        except Exception as e:
+            print(f"Failed to mark conversation {conversation_id} as skipped: {e}")
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _work(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await self.evaluate([(question, answer) for _, question, answer in batch])
+                await self.save([
+                    (conversation_id, relevance, tokens)
+                    for (conversation_id, _, _), (relevance, tokens) in zip(batch, results)
+                ])
+                self.batches += 1
+                self.judged += len(batch)
+            except Exception as e:
+                # Marked SKIPPED so that they do not stay PENDING forever
+                self.failed += len(batch)
+                print(f"Failed to evaluate {len(batch)} conversations: {e}")
+                for conversation_id, _, _ in batch:
+                    await self._skip(conversation_id, f"LLM judge failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        """
+        Starts the worker tasks on the running event loop.
+        """
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.n_workers)]
+
+    async def stop(self, timeout=None):
+        """
+        Waits for the queued conversations to be evaluated, then stops the workers.
+
+        Args:
+            timeout (float): Seconds to wait for the queue to drain. Defaults to None (wait for all).
+        """
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def stats(self):
+        """
+        Returns the queue counters.
+
+        Returns:
+            dict: Queued, submitted, batches, judged, sampled_out, dropped and failed counts.
+        """
+        return {
+            "queued": 0 if self._queue is None else self._queue.qsize(),
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "judged": self.judged,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
@@ -0,0 +1,183 @@
+import bisect
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+# Upper bounds in seconds, from a cached search to a slow LLM call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def timed(stage_times, stage):
+    """
+    Adds the seconds spent in the block to stage_times[stage].
+
+    Args:
+        stage_times (dict): Stage name to seconds, updated in place.
+        stage (str): The stage name.
+    """
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[stage] = stage_times.get(stage, 0.0) + perf_counter() - t0
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+
+    Attributes:
+        name (str): Metric name, ending in _total by convention.
+        help (str): One-line description.
+        labels (tuple of str): Label names every increment must give.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {list(self.labels)}, got {sorted(labels)}")
+        return tuple((name, labels[name]) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram(Counter):
+    """
+    Counts observations per bucket, with their sum and count, per label set.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): One-line description.
+        labels (tuple of str): Label names every observation must give.
+        buckets (tuple of float): Increasing bucket upper bounds, +Inf is added.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - t0, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+class Registry:
+    """
+    Holds the metrics of the process and renders them in the Prometheus text format.
+
+    Besides counters and histograms updated by the application, the counters that components already
+    keep in a stats() dict are exported at scrape time, see add_stats.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._stats = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_stats(self, prefix, stats, gauges=()):
+        """
+        Exports the numbers of a stats dict on every scrape.
+
+        Args:
+            prefix (str): Prefix of the metric names, e.g. 'yoga_search_cache'.
+            stats (callable): Function returning a dict of name to number.
+            gauges (iterable of str): Keys that can go down. The others are exported as counters, with a
+                _total suffix.
+        """
+        self._stats.append((prefix, stats, frozenset(gauges)))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for prefix, stats, gauges in self._stats:
+            for key, value in stats().items():
+                if not isinstance(value, (int, float)):
+                    continue
+                kind = "gauge" if key in gauges else "counter"
+                name = f"{prefix}_{key}" if kind == "gauge" else f"{prefix}_{key}_total"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
@@ -1,7 +1,12 @@
-import pandas as pd
+import json
+import os
+import sys
+from collections import Counter
+from collections.abc import Mapping
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
+
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 
 import numpy as np
 
@@ -10,16 +15,40 @@ class Index:
     """
     A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
 
+    The per-field TF-IDF matrices are stacked column-wise into a single CSR matrix, so a query is scored
+    with one sparse matrix-vector product. Boosts are applied to the query vector as per-column weights.
+
+    The raw term frequencies and document frequencies are kept next to the weights, so documents can be
+    added, updated and deleted without refitting. Deleted rows are tombstoned until compact is called.
+
+    With low_memory, weights and term frequencies are stored as float32, the vocabulary is packed into
+    two arrays, the per-field vectorizers drop their own vocabularies after fitting, and documents are
+    kept in a columnar DocumentStore that only builds dicts for the returned results. Scores then carry
+    float32 rounding, so documents with nearly equal scores may swap places.
+
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
+        id_field (str): Keyword field that identifies documents for update and delete.
+        idf_refresh_ratio (float): Share of changed documents after which IDF is recomputed automatically.
+        low_memory (bool): Whether the index uses the compact representation.
+        dtype (np.dtype): Floating point type of text_matrix and tf.
         vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
-        keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
-        docs (list): List of documents indexed.
+        analyzer (callable): Analyzer shared by all text fields, used to tokenize the query once.
+        keyword_index (KeywordIndex): Row ids of keyword field values, used to filter before scoring.
+        text_matrix (scipy.sparse.csr_matrix): Column-stacked, row-normalized TF-IDF matrix of all text fields.
+        tf (np.ndarray): Raw term frequency of every stored entry of text_matrix.
+        df (np.ndarray): Number of live documents containing every column.
+        deleted (np.ndarray): Tombstone flag of every row.
+        vocabulary (dict): Maps each term to the array of columns it occupies in text_matrix (one per field).
+        idf (np.ndarray): IDF weight of every column in text_matrix.
+        column_fields (np.ndarray): Position in text_fields of the field that owns each column.
+        docs (list or DocumentStore): Documents indexed, including deleted ones until compact is called.
+        version (int): Incremented whenever the index is refit or changed, so caches can invalidate.
     """
 
-    def __init__(self, text_fields, keyword_fields, vectorizer_params={}):
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}, id_field='id', idf_refresh_ratio=0.1,
+                 low_memory=False):
         """
         Initializes the Index with specified text and keyword fields.
 
@@ -27,14 +56,36 @@ class Index:
             text_fields (list): List of text field names to index.
             keyword_fields (list): List of keyword field names to index.
             vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            id_field (str): Keyword field that identifies documents for update and delete. Defaults to 'id'.
+            idf_refresh_ratio (float): Share of documents that can be added or deleted before IDF is
+                recomputed for the whole index. Defaults to 0.1.
+            low_memory (bool): Use the compact representation (float32 weights, packed vocabulary,
+                columnar documents). Defaults to False.
         """
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
+        self.id_field = id_field
+        self.idf_refresh_ratio = idf_refresh_ratio
+        self.low_memory = low_memory
+        self.dtype = np.dtype(np.float32 if low_memory else np.float64)
 
         self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
-        self.keyword_df = None
-        self.text_matrices = {}
+        self.analyzer = TfidfVectorizer(**vectorizer_params).build_analyzer()
+        self.keyword_index = KeywordIndex(keyword_fields)
+        self.text_matrix = None
+        self.tf = np.zeros(0)
+        self.df = np.zeros(0, dtype=np.int64)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.vocabulary = {}
+        self.idf = np.zeros(0)
+        self.column_fields = np.zeros(0, dtype=np.int32)
         self.docs = []
+        self.version = 0
+
+        self._pending_changes = 0
+        self._row_index = None
+        self._field_vocabularies = None
 
     def fit(self, docs):
         """
@@ -43,22 +94,645 @@ class Index:
         Args:
             docs (list of dict): List of documents to index. Each document is a dictionary.
         """
-        self.docs = docs
-        keyword_data = {field: [] for field in self.keyword_fields}
+        self.docs = self._store(docs)
 
-        for field in self.text_fields:
+        matrices = []
+        column_fields = []
+        vocabulary = {}
+        offset = 0
+
+        for position, field in enumerate(self.text_fields):
             texts = [doc.get(field, '') for doc in docs]
-            self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            vectorizer = self.vectorizers[field]
 
-        for doc in docs:
-            for field in self.keyword_fields:
-                keyword_data[field].append(doc.get(field, ''))
+            # Only the raw counts come from the vectorizer, IDF and normalization are applied on the stacked matrix
+            counts = CountVectorizer.fit_transform(vectorizer, texts)
+            matrices.append(counts)
+            column_fields.append(np.full(counts.shape[1], position, dtype=np.int32))
+
+            for term, column in vectorizer.vocabulary_.items():
+                vocabulary.setdefault(term, []).append(offset + column)
+            offset += counts.shape[1]
+
+            if self.low_memory:
+                # The stacked vocabulary replaces the per-field ones, only the vectorizer settings are used later
+                del vectorizer.vocabulary_
+
+        counts = sp.hstack(matrices, format='csr')
+        counts.sort_indices()
+
+        self.column_fields = np.concatenate(column_fields)
+        self._set_vocabulary(vocabulary)
+        self.tf = counts.data.astype(self.dtype)
+        self.df = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.deleted = np.zeros(len(docs), dtype=bool)
+        self.text_matrix = counts
+        self.refresh()
+
+        self.keyword_index.fit(docs)
+
+        self._row_index = None
+        self._field_vocabularies = None
+
+        return self
+
+    def fit_vocabulary(self, docs, field_terms, idf):
+        """
+        Fits the index with the provided documents against a fixed vocabulary and IDF.
+
+        Used by sharded indexes, where every shard holds part of the documents but scores them with the
+        vocabulary and IDF of the whole catalog. Terms outside the vocabulary are ignored. Rows get exactly
+        the weights they would have in an index fitted on the whole catalog.
+
+        Args:
+            docs (list of dict): List of documents to index. Each document is a dictionary.
+            field_terms (list of list of str): For every text field, its terms in column order.
+            idf (np.ndarray): IDF weight of every column.
+        """
+        self.docs = self._store(docs)
+
+        vocabulary = {}
+        column_fields = []
+        field_vocabularies = []
+        offset = 0
+        for position, terms in enumerate(field_terms):
+            field_vocabularies.append({term: offset + column for column, term in enumerate(terms)})
+            for term, column in field_vocabularies[-1].items():
+                vocabulary.setdefault(term, []).append(column)
+            column_fields.append(np.full(len(terms), position, dtype=np.int32))
+            offset += len(terms)
+
+        binary = self.vectorizers[self.text_fields[0]].binary
+        rows = []
+        columns = []
+        tf = []
+        for row, doc in enumerate(docs):
+            for position, field in enumerate(self.text_fields):
+                for term, count in Counter(self.analyzer(doc.get(field, ''))).items():
+                    column = field_vocabularies[position].get(term)
+                    if column is not None:
+                        rows.append(row)
+                        columns.append(column)
+                        tf.append(1 if binary else count)
+
+        counts = sp.csr_matrix((np.array(tf, dtype=self.dtype), (rows, columns)), shape=(len(docs), offset))
+        counts.sort_indices()
+
+        self._set_vocabulary(vocabulary)
+        self.column_fields = np.concatenate(column_fields) if column_fields else np.zeros(0, dtype=np.int32)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.tf = counts.data
+        self.df = np.bincount(counts.indices, minlength=offset)
+        self.deleted = np.zeros(len(docs), dtype=bool)
+        self.text_matrix = sp.csr_matrix(
+            (self._row_weights(counts.data, counts.indices, counts.indptr), counts.indices, counts.indptr),
+            shape=counts.shape,
+        )
+        self.keyword_index.fit(docs)
+
+        self._pending_changes = 0
+        self._row_index = None
+        self._field_vocabularies = field_vocabularies
+        self.version += 1
+
+        return self
+
+    def _store(self, docs):
+        """
+        Returns the documents in the storage of the index mode: the list itself, or a DocumentStore with low_memory.
+        """
+        return DocumentStore(docs) if self.low_memory else docs
+
+    def _set_vocabulary(self, vocabulary):
+        """
+        Stores the vocabulary, packed into two arrays with low_memory.
+
+        Args:
+            vocabulary (dict): Maps each term to the sequence of columns it occupies.
+        """
+        if self.low_memory:
+            self.vocabulary = PackedVocabulary.from_dict(vocabulary)
+        else:
+            self.vocabulary = {term: np.asarray(columns, dtype=np.int32) for term, columns in vocabulary.items()}
+
+    def _compute_idf(self, df):
+        """
+        Computes IDF weights the same way TfidfVectorizer does, over the live documents.
+
+        Args:
+            df (np.ndarray): Document frequencies.
+
+        Returns:
+            np.ndarray: IDF weight for every document frequency.
+        """
+        vectorizer = self.vectorizers[self.text_fields[0]]
+        n_docs = len(self.deleted) - int(self.deleted.sum())
+        return compute_idf(df, n_docs, vectorizer.use_idf, vectorizer.smooth_idf)
+
+    def _row_weights(self, tf, indices, indptr):
+        """
+        Computes TF-IDF weights of CSR rows, L2-normalized separately for every field.
+
+        Args:
+            tf (np.ndarray): Raw term frequencies of the stored entries.
+            indices (np.ndarray): Column of every stored entry.
+            indptr (np.ndarray): CSR row pointers.
+
+        Returns:
+            np.ndarray: Weight of every stored entry.
+        """
+        n_rows = len(indptr) - 1
+        n_fields = len(self.text_fields)
+
+        if self.vectorizers[self.text_fields[0]].sublinear_tf:
+            tf = np.log(tf) + 1
+        weights = tf * self.idf[indices]
+
+        # Cosine similarity only depends on the direction of each field's part of a row
+        rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+        groups = rows * n_fields + self.column_fields[indices]
+        norms = np.sqrt(np.bincount(groups, weights=weights ** 2, minlength=n_rows * n_fields))
+        return (weights / norms[groups]).astype(self.dtype, copy=False)
+
+    def refresh(self):
+        """
+        Recomputes IDF from the current document frequencies and reweights every row.
+
+        Called automatically once the number of added and deleted documents since the last refresh
+        exceeds idf_refresh_ratio of the index. No text is tokenized again.
+        """
+        self.idf = self._compute_idf(self.df)
+        self.text_matrix = sp.csr_matrix(
+            (self._row_weights(self.tf, self.text_matrix.indices, self.text_matrix.indptr),
+             self.text_matrix.indices, self.text_matrix.indptr),
+            shape=self.text_matrix.shape,
+        )
+        self._pending_changes = 0
+        self.version += 1
+
+    def _maybe_refresh(self, changes):
+        self._pending_changes += changes
+        n_docs = len(self.deleted) - int(self.deleted.sum())
+        if self._pending_changes > self.idf_refresh_ratio * max(n_docs, 1):
+            self.refresh()
+
+    def _get_row_index(self):
+        """
+        Returns the mapping from id_field value to row of every live document, built on first use.
+        """
+        if self._row_index is None:
+            ids = self.keyword_index.values[self.id_field].tolist()
+            self._row_index = {doc_id: row for row, doc_id in enumerate(ids) if not self.deleted[row]}
+        return self._row_index
+
+    def _get_field_vocabularies(self):
+        """
+        Returns, for every text field, the mapping from term to its column, built on first use.
+        """
+        if self._field_vocabularies is None:
+            self._field_vocabularies = [{} for _ in self.text_fields]
+            for term, columns in self.vocabulary.items():
+                for column in columns.tolist():
+                    self._field_vocabularies[self.column_fields[column]][term] = column
+        return self._field_vocabularies
+
+    def add(self, docs):
+        """
+        Adds documents to a fitted index without refitting it.
+
+        New rows are appended to the stacked matrix and new terms get new columns. The new rows are
+        weighted with the current IDF; IDF is recomputed for the whole index according to idf_refresh_ratio.
+        Vocabulary limits such as min_df or max_features are not applied to new terms.
+
+        Args:
+            docs (list of dict): List of documents to add. Each document is a dictionary.
+        """
+        docs = list(docs)
+        if not docs:
+            return self
+
+        field_vocabularies = self._get_field_vocabularies()
+        binary = self.vectorizers[self.text_fields[0]].binary
+        n_columns = self.text_matrix.shape[1]
+        new_terms = []
+
+        rows = []
+        columns = []
+        tf = []
+        for row, doc in enumerate(docs):
+            for position, field in enumerate(self.text_fields):
+                for term, count in Counter(self.analyzer(doc.get(field, ''))).items():
+                    column = field_vocabularies[position].get(term)
+                    if column is None:
+                        column = n_columns + len(new_terms)
+                        field_vocabularies[position][term] = column
+                        new_terms.append((term, position))
+                    rows.append(row)
+                    columns.append(column)
+                    tf.append(1 if binary else count)
+
+        n_columns += len(new_terms)
+        counts = sp.csr_matrix((np.array(tf, dtype=self.dtype), (rows, columns)), shape=(len(docs), n_columns))
+        counts.sort_indices()
+
+        if new_terms:
+            vocabulary = dict(self.vocabulary)
+            for column, (term, position) in enumerate(new_terms, start=n_columns - len(new_terms)):
+                vocabulary[term] = np.append(vocabulary.get(term, np.zeros(0, dtype=np.int32)), np.int32(column))
+            self._set_vocabulary(vocabulary)
+            self.column_fields = np.concatenate(
+                [self.column_fields, np.array([position for _, position in new_terms], dtype=np.int32)]
+            )
+
+        self.df = np.concatenate([self.df, np.zeros(len(new_terms), dtype=self.df.dtype)])
+        self.df = self.df + np.bincount(counts.indices, minlength=n_columns)
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(docs), dtype=bool)])
+        self.idf = np.concatenate([self.idf, self._compute_idf(self.df[len(self.idf):])])
+
+        old = self.text_matrix
+        old = sp.csr_matrix((old.data, old.indices, old.indptr), shape=(old.shape[0], n_columns))
+        new = sp.csr_matrix(
+            (self._row_weights(counts.data, counts.indices, counts.indptr), counts.indices, counts.indptr),
+            shape=counts.shape,
+        )
+        self.text_matrix = sp.vstack([old, new], format='csr')
+        self.tf = np.concatenate([self.tf, counts.data])
+
+        first_row = len(self.docs)
+        self.docs = self.docs + docs
+        self.keyword_index.add(docs)
+        if self._row_index is not None:
+            for row, doc in enumerate(docs, start=first_row):
+                self._row_index[doc.get(self.id_field, '')] = row
+
+        self.version += 1
+        self._maybe_refresh(len(docs))
+        return self
+
+    def delete(self, doc_id):
+        """
+        Deletes the document with the given id by tombstoning its row.
+
+        The row stops matching immediately and its terms stop counting towards document frequencies.
+        The memory is only reclaimed by compact.
+
+        Args:
+            doc_id: Value of id_field of the document to delete.
+
+        Raises:
+            KeyError: If no live document has this id.
+        """
+        row_index = self._get_row_index()
+        if doc_id not in row_index:
+            raise KeyError(f"No document with {self.id_field}={doc_id!r}")
+        row = row_index.pop(doc_id)
+
+        start, end = self.text_matrix.indptr[row], self.text_matrix.indptr[row + 1]
+        self.df = self.df - np.bincount(self.text_matrix.indices[start:end], minlength=len(self.df))
+        deleted = np.array(self.deleted)
+        deleted[row] = True
+        self.deleted = deleted
+
+        self.version += 1
+        self._maybe_refresh(1)
+        return self
+
+    def update(self, doc_id, doc):
+        """
+        Replaces the document with the given id.
+
+        Args:
+            doc_id: Value of id_field of the document to replace.
+            doc (dict): The new version of the document.
+
+        Raises:
+            KeyError: If no live document has this id.
+        """
+        self.delete(doc_id)
+        return self.add([doc])
+
+    def compact(self):
+        """
+        Rewrites the index without tombstoned rows and unused columns, then recomputes IDF.
+        """
+        live = np.flatnonzero(~self.deleted)
+        used = self.df > 0
+        new_columns = np.cumsum(used) - 1
+
+        counts = sp.csr_matrix(
+            (self.tf, self.text_matrix.indices, self.text_matrix.indptr), shape=self.text_matrix.shape
+        )
+        counts = counts[live][:, np.flatnonzero(used)].tocsr()
+        counts.sort_indices()
+
+        vocabulary = {}
+        for term, columns in self.vocabulary.items():
+            columns = new_columns[columns[used[columns]]].astype(np.int32)
+            if len(columns):
+                vocabulary[term] = columns
+        self._set_vocabulary(vocabulary)
 
-        self.keyword_df = pd.DataFrame(keyword_data)
+        self.column_fields = self.column_fields[used]
+        self.df = self.df[used]
+        self.tf = counts.data
+        self.deleted = np.zeros(len(live), dtype=bool)
+        self.text_matrix = counts
+        if isinstance(self.docs, DocumentStore):
+            self.docs = self.docs.take(live)
+        else:
+            self.docs = [self.docs[row] for row in live.tolist()]
+        self.keyword_index.take(live)
+        self.refresh()
 
+        self._row_index = None
+        self._field_vocabularies = None
         return self
 
-    def search(self, query, filter_dict={}, boost_dict={}, num_results=10):
+    def memory_report(self):
+        """
+        Estimates the memory held by every component of the index, to size worker containers.
+
+        Arrays count their nbytes, also when they are memory-mapped from a snapshot, where the pages are
+        shared between processes and only loaded when touched. Python objects are measured with
+        sys.getsizeof, counting objects shared between components once.
+
+        Returns:
+            dict: Bytes per component, and their sum under 'total'.
+        """
+        # The containers are built first so they stay alive, and their ids unique, while measuring
+        components = {
+            'text_matrix': self.text_matrix,
+            'tf': self.tf,
+            'df': self.df,
+            'idf': self.idf,
+            'column_fields': self.column_fields,
+            'deleted': self.deleted,
+            'vocabulary': self.vocabulary,
+            'vectorizers': [vectorizer.__dict__ for vectorizer in self.vectorizers.values()],
+            'keyword_index': [self.keyword_index.values, self.keyword_index.order],
+            'docs': self.docs,
+            'lookups': [self._row_index, self._field_vocabularies],
+        }
+        seen = set()
+        report = {name: _deep_size(component, seen) for name, component in components.items()}
+        report['total'] = sum(report.values())
+        return report
+
+    def save(self, path):
+        """
+        Saves the fitted index as a snapshot directory.
+
+        Arrays are written as .npy files so they can be memory-mapped by load. The vocabulary and
+        configuration go to meta.json, the documents to docs.json. With low_memory, the document columns
+        are saved as arrays too and docs.json only describes them.
+
+        Args:
+            path (str): Directory to write the snapshot to. It is created if needed.
+        """
+        os.makedirs(path, exist_ok=True)
+
+        terms = list(self.vocabulary)
+        term_columns = [self.vocabulary[term] for term in terms]
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(columns) for columns in term_columns], out=term_offsets[1:])
+
+        arrays = {
+            'data': self.text_matrix.data,
+            'indices': self.text_matrix.indices,
+            'indptr': self.text_matrix.indptr,
+            'tf': self.tf,
+            'df': self.df,
+            'deleted': self.deleted,
+            'idf': self.idf,
+            'column_fields': self.column_fields,
+            'term_offsets': term_offsets,
+            'term_columns': np.concatenate(term_columns) if term_columns else np.zeros(0, dtype=np.int32),
+        }
+        arrays.update(self.keyword_index.arrays())
+
+        docs = self.docs
+        if isinstance(docs, DocumentStore):
+            arrays.update(docs.arrays())
+            docs = docs.spec()
+
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+        with open(os.path.join(path, 'docs.json'), 'w') as f:
+            json.dump(docs, f)
+
+        meta = {
+            'text_fields': self.text_fields,
+            'keyword_fields': self.keyword_fields,
+            'vectorizer_params': self.vectorizer_params,
+            'id_field': self.id_field,
+            'idf_refresh_ratio': self.idf_refresh_ratio,
+            'low_memory': self.low_memory,
+            'pending_changes': self._pending_changes,
+            'shape': list(self.text_matrix.shape),
+            'terms': terms,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Loads an index from a snapshot directory written by save, without refitting.
+
+        Args:
+            path (str): Snapshot directory.
+            mmap_mode (str): Passed to np.load. Defaults to 'r', so the arrays are memory-mapped read-only.
+                Use None to read them into memory.
+
+        Returns:
+            Index: The loaded index.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        index = cls(
+            meta['text_fields'],
+            meta['keyword_fields'],
+            meta['vectorizer_params'],
+            id_field=meta['id_field'],
+            idf_refresh_ratio=meta['idf_refresh_ratio'],
+            low_memory=meta.get('low_memory', False),
+        )
+        index._pending_changes = meta['pending_changes']
+
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        index.text_matrix = sp.csr_matrix(
+            (load_array('data'), load_array('indices'), load_array('indptr')),
+            shape=tuple(meta['shape']),
+            copy=False,
+        )
+        index.tf = load_array('tf')
+        index.df = load_array('df')
+        index.deleted = load_array('deleted')
+        index.idf = load_array('idf')
+        index.column_fields = load_array('column_fields')
+
+        term_offsets = load_array('term_offsets')
+        term_columns = load_array('term_columns')
+        if index.low_memory:
+            index.vocabulary = PackedVocabulary(meta['terms'], term_offsets, term_columns)
+        else:
+            index.vocabulary = {
+                term: term_columns[start:end]
+                for term, start, end in zip(meta['terms'], term_offsets[:-1].tolist(), term_offsets[1:].tolist())
+            }
+
+        index.keyword_index.load_arrays(load_array)
+
+        with open(os.path.join(path, 'docs.json')) as f:
+            index.docs = json.load(f)
+        if index.low_memory:
+            index.docs = DocumentStore.load(index.docs, load_array)
+
+        return index
+
+    def query_matrix(self, queries, boost_dict):
+        """
+        Builds the boosted query vectors over the columns of text_matrix, one row per query.
+
+        Each query is tokenized once. Each field's part of a query vector is TF-IDF weighted and L2-normalized
+        like the per-field vectorizer would do, then multiplied by the field boost. Fields with a zero boost
+        or without any query term in their vocabulary contribute no columns.
+
+        Args:
+            queries (list of str): The search query strings.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+
+        Returns:
+            scipy.sparse.csr_matrix: A n_queries x n_columns query matrix.
+        """
+        n_columns = self.text_matrix.shape[1]
+        n_fields = len(self.text_fields)
+
+        rows = []
+        columns = []
+        tf = []
+        for row, query in enumerate(queries):
+            for term, count in Counter(self.analyzer(query)).items():
+                term_columns = self.vocabulary.get(term)
+                if term_columns is not None:
+                    rows.append(np.full(len(term_columns), row, dtype=np.int64))
+                    columns.append(term_columns)
+                    tf.append(np.full(len(term_columns), count, dtype=np.float64))
+
+        if not columns:
+            return sp.csr_matrix((len(queries), n_columns))
+
+        rows = np.concatenate(rows)
+        columns = np.concatenate(columns)
+        tf = np.concatenate(tf)
+
+        field_boosts = np.array([boost_dict.get(field, 1) for field in self.text_fields], dtype=np.float64)
+        fields = self.column_fields[columns]
+        keep = field_boosts[fields] != 0
+        rows, columns, tf, fields = rows[keep], columns[keep], tf[keep], fields[keep]
+
+        vectorizer = self.vectorizers[self.text_fields[0]]
+        if vectorizer.binary:
+            tf = np.minimum(tf, 1)
+        if vectorizer.sublinear_tf:
+            tf = np.log(tf) + 1
+
+        weights = tf * self.idf[columns]
+        groups = rows * n_fields + fields
+        norms = np.sqrt(np.bincount(groups, weights=weights ** 2, minlength=len(queries) * n_fields))
+        weights = weights / norms[groups] * field_boosts[fields]
+
+        return sp.csr_matrix((weights, (rows, columns)), shape=(len(queries), n_columns))
+
+    def top_k(self, queries, filter_dict={}, boost_dict={}, num_results=10):
+        """
+        Scores several queries at once and returns the rows and scores of the best documents.
+
+        All queries are vectorized together and scored with a single sparse (queries x docs) matrix product.
+        Keyword filters are resolved first, so only the candidate rows take part in the product.
+        Results are ordered by decreasing score, ties are broken by row, zero scores are left out.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+
+        Returns:
+            list of tuple: For every query, an array of rows and an array of their scores.
+        """
+        if len(queries) == 0:
+            return []
+
+        # Same dtype as the matrix, so the product does not upcast a copy of it
+        query_vectors = self.query_matrix(queries, boost_dict).astype(self.text_matrix.dtype, copy=False)
+        has_deleted = self.deleted.any()
+
+        candidates = self.keyword_index.candidates(filter_dict)
+        if candidates is None:
+            matrix = self.text_matrix
+        else:
+            if has_deleted:
+                candidates = candidates[~self.deleted[candidates]]
+            matrix = self.text_matrix[candidates]
+
+        # Boosts are already in the query vectors, so this is one sparse product for all fields and queries
+        scores = (matrix @ query_vectors.T).T.toarray()
+
+        if candidates is None and has_deleted:
+            scores = scores * ~self.deleted
+
+        num_results = min(num_results, scores.shape[1])
+        if num_results <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0)) for _ in queries]
+
+        # The num_results-th best score of every row, from one vectorized partition
+        thresholds = -np.partition(-scores, num_results - 1, axis=1)[:, num_results - 1]
+
+        results = []
+        for row_scores, threshold in zip(scores, thresholds):
+            # Rows tied with the threshold are all kept, so ties are broken by document position.
+            # Zero-score results are filtered out.
+            top_indices = np.flatnonzero(row_scores >= threshold if threshold > 0 else row_scores > 0)
+            top_indices = top_indices[np.lexsort((top_indices, -row_scores[top_indices]))][:num_results]
+            top_scores = row_scores[top_indices]
+            if candidates is not None:
+                top_indices = candidates[top_indices]
+            results.append((top_indices, top_scores))
+
+        return results
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with several queries at once, sharing the filters and boost parameters.
+
+        The rankings are the same as calling search for every query.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of list of dict: For every query, the list of matching documents ranked by relevance.
+        """
+        if output_scores:
+            return [
+                [(self.docs[i], score) for i, score in zip(rows.tolist(), scores.tolist())]
+                for rows, scores in self.top_k(queries, filter_dict, boost_dict, num_results)
+            ]
+        return [
+            [self.docs[i] for i in rows.tolist()]
+            for rows, _ in self.top_k(queries, filter_dict, boost_dict, num_results)
+        ]
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
         """
         Searches the index with the given query, filters, and boost parameters.
 
@@ -67,30 +741,490 @@ class Index:
             filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
             boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
             num_results (int): The number of top results to return. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
 
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
-        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_scores)[0]
+
+
+def compute_idf(df, n_docs, use_idf=True, smooth_idf=True):
+    """
+    Computes IDF weights the same way TfidfVectorizer does.
+
+    Args:
+        df (np.ndarray): Document frequency of every column.
+        n_docs (int): Number of documents.
+        use_idf (bool): When False, every weight is 1.
+        smooth_idf (bool): Adds one to document frequencies, as if an extra document contained every term.
+
+    Returns:
+        np.ndarray: IDF weight of every column.
+    """
+    if not use_idf:
+        return np.ones(len(df))
+
+    if smooth_idf:
+        return np.log((1 + n_docs) / (1 + df)) + 1
+
+    # Columns left without documents get a neutral weight instead of infinity
+    with np.errstate(divide='ignore'):
+        idf = np.log(n_docs / df) + 1
+    idf[df == 0] = 1
+    return idf
+
+
+class KeywordIndex:
+    """
+    Row ids of keyword field values, used to select candidate documents before scoring.
+
+    Every field keeps its values as a NumPy array and the rows sorted by value, so filters are resolved
+    with binary searches. A filter value can be a single value (equality), a list, tuple or set (any of
+    the values), or a dict with any of 'gt', 'gte', 'lt' and 'lte' (range).
+
+    A field whose values are all numbers keeps a numeric array. A field mixing numbers and strings is
+    stored as strings, and filter values on it are converted to strings too, so 5 and '5' match the same
+    rows, and ranges on it compare strings.
+
+    Attributes:
+        fields (list): List of keyword field names.
+        values (dict): Per field, the value of every row.
+        order (dict): Per field, the rows sorted by value. Rows with equal values stay in row order.
+    """
+
+    RANGE_OPERATORS = {'gt', 'gte', 'lt', 'lte'}
+
+    def __init__(self, fields):
+        """
+        Initializes the KeywordIndex with the given keyword fields.
+
+        Args:
+            fields (list): List of keyword field names.
+        """
+        self.fields = fields
+        self.values = {}
+        self.order = {}
+
+    def fit(self, docs):
+        """
+        Indexes the keyword fields of the provided documents.
+
+        Args:
+            docs (list of dict): List of documents. Missing fields are indexed as ''.
+        """
+        self.values = {field: _keyword_array([doc.get(field, '') for doc in docs]) for field in self.fields}
+        self._sort()
+        return self
+
+    def add(self, docs):
+        """
+        Appends the keyword fields of the provided documents as new rows.
+
+        The new rows are merged into the sorted order with binary searches instead of sorting all rows again,
+        unless they turn a numeric field into a string field.
+
+        Args:
+            docs (list of dict): List of documents.
+        """
+        for field in self.fields:
+            values = self.values[field]
+            new = _keyword_array([doc.get(field, '') for doc in docs])
+            if len(new) == 0:
+                continue
+            if len(values) == 0 or (values.dtype.kind == 'U') != (new.dtype.kind == 'U'):
+                # The first rows, or numbers next to strings: the field is stored as strings and sorted again
+                if len(values):
+                    values, new = values.astype(str), new.astype(str)
+                self.values[field] = np.concatenate([values, new]) if len(values) else new
+                self.order[field] = np.argsort(self.values[field], kind='stable')
+                continue
+
+            new_order = np.argsort(new, kind='stable')
+            # After the existing rows of equal value, so that equal values stay in row order
+            positions = np.searchsorted(values, new[new_order], side='right', sorter=self.order[field])
+            self.order[field] = np.insert(self.order[field], positions, new_order + len(values))
+            self.values[field] = np.concatenate([values, new])
+        return self
+
+    def take(self, rows):
+        """
+        Keeps only the given rows, renumbered in the given order.
+
+        Args:
+            rows (np.ndarray): Rows to keep.
+        """
+        self.values = {field: self.values[field][rows] for field in self.fields}
+        self._sort()
+        return self
+
+    def _sort(self):
+        self.order = {field: np.argsort(values, kind='stable') for field, values in self.values.items()}
+
+    def arrays(self):
+        """
+        Returns the arrays to save in an index snapshot.
+        """
+        arrays = {}
+        for position, field in enumerate(self.fields):
+            arrays[f'keyword_{position}'] = self.values[field]
+            arrays[f'keyword_order_{position}'] = self.order[field]
+        return arrays
 
-        # Compute cosine similarity for each text field and apply boost
-        for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
-            boost = boost_dict.get(field, 1)
-            scores += sim * boost
+    def load_arrays(self, load_array):
+        """
+        Restores the index from snapshot arrays.
+
+        Args:
+            load_array (callable): Returns the saved array with the given name.
+        """
+        for position, field in enumerate(self.fields):
+            self.values[field] = load_array(f'keyword_{position}')
+            self.order[field] = load_array(f'keyword_order_{position}')
+        return self
+
+    def _slice(self, field, low, high, low_side='left', high_side='right'):
+        values, order = self.values[field], self.order[field]
+        if values.dtype.kind == 'U':
+            low = None if low is None else str(low)
+            high = None if high is None else str(high)
+        try:
+            start = 0 if low is None else np.searchsorted(values, low, side=low_side, sorter=order)
+            end = len(values) if high is None else np.searchsorted(values, high, side=high_side, sorter=order)
+        except TypeError:
+            # The value cannot be compared with this field, nothing matches
+            return np.zeros(0, dtype=np.int64)
+        return order[start:max(start, end)]
+
+    def rows(self, field, condition):
+        """
+        Returns the rows whose value of field matches the condition.
+
+        Args:
+            field (str): Keyword field name.
+            condition: A single value, a list, tuple or set of values, or a dict of range operators.
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        Returns:
+            np.ndarray: Sorted row ids.
+        """
+        if isinstance(condition, dict):
+            unknown = set(condition) - self.RANGE_OPERATORS
+            if unknown:
+                raise ValueError(f"Unknown range operators for {field}: {sorted(unknown)}")
+            low, low_side = condition.get('gte'), 'left'
+            if 'gt' in condition:
+                low, low_side = condition['gt'], 'right'
+            high, high_side = condition.get('lte'), 'right'
+            if 'lt' in condition:
+                high, high_side = condition['lt'], 'left'
+            return np.sort(self._slice(field, low, high, low_side, high_side))
+
+        if isinstance(condition, (list, tuple, set, frozenset)):
+            matches = [self._slice(field, value, value) for value in condition]
+            if not matches:
+                return np.zeros(0, dtype=np.int64)
+            return np.unique(np.concatenate(matches))
+
+        # Rows with equal values are stored in row order, so equality slices are already sorted
+        return self._slice(field, condition, condition)
+
+    def candidates(self, filter_dict):
+        """
+        Intersects the rows matching every filter on a keyword field.
+
+        Args:
+            filter_dict (dict): Dictionary of keyword fields to filter by. Other fields are ignored.
 
-        # Use argpartition to get top num_results indices
-        top_indices = np.argpartition(scores, -num_results)[-num_results:]
-        top_indices = top_indices[np.argsort(-scores[top_indices])]
+        Returns:
+            np.ndarray or None: Sorted candidate row ids, or None when no filter applies.
+        """
+        candidates = None
+        for field, condition in filter_dict.items():
+            if field not in self.values:
+                continue
+            rows = self.rows(field, condition)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+        return candidates
+
+
+def _keyword_array(values):
+    """
+    Converts keyword values to a NumPy array that can be saved without pickling.
+
+    Args:
+        values (list): Keyword values of every document.
+
+    Returns:
+        np.ndarray: Numeric array when all values are numbers, unicode string array otherwise.
+    """
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+
+class PackedVocabulary(Mapping):
+    """
+    Read-only mapping from term to columns, packed into two arrays instead of one array object per term.
+
+    Used by Index with low_memory. Looking up a term returns a view of its columns.
+
+    Attributes:
+        term_ids (dict): Maps each term to its position.
+        offsets (np.ndarray): Start of the columns of every term in columns (one more entry than terms).
+        columns (np.ndarray): Columns of all terms, concatenated.
+    """
+
+    def __init__(self, terms, offsets, columns):
+        """
+        Initializes the vocabulary from packed arrays.
+
+        Args:
+            terms (list of str): Terms in the order of offsets.
+            offsets (np.ndarray): Start of the columns of every term, followed by the total length.
+            columns (np.ndarray): Columns of all terms, concatenated.
+        """
+        self.term_ids = {term: position for position, term in enumerate(terms)}
+        self.offsets = offsets
+        self.columns = columns
+
+    @classmethod
+    def from_dict(cls, vocabulary):
+        """
+        Packs a dictionary mapping each term to a sequence of columns.
+        """
+        term_columns = [np.asarray(columns, dtype=np.int32) for columns in vocabulary.values()]
+        offsets = np.zeros(len(term_columns) + 1, dtype=np.int64)
+        np.cumsum([len(columns) for columns in term_columns], out=offsets[1:])
+        columns = np.concatenate(term_columns) if term_columns else np.zeros(0, dtype=np.int32)
+        return cls(list(vocabulary), offsets, columns)
+
+    def __getitem__(self, term):
+        position = self.term_ids[term]
+        return self.columns[self.offsets[position]:self.offsets[position + 1]]
+
+    def __iter__(self):
+        return iter(self.term_ids)
+
+    def __len__(self):
+        return len(self.term_ids)
+
+
+class DocumentStore:
+    """
+    Columnar, read-only storage of documents, used by Index with low_memory.
+
+    String fields are stored as one UTF-8 buffer with offsets and numeric fields as NumPy arrays; other
+    fields fall back to a plain list of values. Indexing the store builds the dict of one document, so
+    only the returned search results are ever materialized.
+
+    Attributes:
+        fields (list): Field names, in the order they first appear in the documents.
+        columns (dict): Per field, ('str', buffer, offsets), ('int', values), ('float', values) or ('list', values).
+    """
+
+    def __init__(self, docs=()):
+        """
+        Stores the provided documents.
+
+        Args:
+            docs (list of dict): Documents to store.
+        """
+        docs = list(docs)
+        fields = {}
+        for doc in docs:
+            fields.update(dict.fromkeys(doc))
+
+        self.fields = list(fields)
+        self.columns = {field: _column([doc.get(field, _MISSING) for doc in docs]) for field in self.fields}
+        self._length = len(docs)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        doc = {}
+        for field, column in self.columns.items():
+            kind = column[0]
+            if kind == 'str':
+                buffer, offsets = column[1], column[2]
+                value = bytes(buffer[offsets[row]:offsets[row + 1]]).decode('utf-8')
+            elif kind == 'list':
+                value = column[1][row]
+                if value is _MISSING:
+                    continue
+            else:
+                value = column[1][row].item()
+            doc[field] = value
+        return doc
+
+    def __iter__(self):
+        return (self[row] for row in range(self._length))
+
+    def __add__(self, docs):
+        """
+        Returns a new store with the provided documents appended.
+
+        Args:
+            docs (list of dict): Documents to append.
+        """
+        other = DocumentStore(docs)
+        if other.fields != self.fields or any(
+            self.columns[field][0] != other.columns[field][0] for field in self.fields
+        ):
+            # Different layouts, rebuild the columns from the documents
+            return DocumentStore(list(self) + list(docs))
+
+        store = DocumentStore()
+        store.fields = self.fields
+        store.columns = {field: _concat_columns(self.columns[field], other.columns[field]) for field in self.fields}
+        store._length = self._length + other._length
+        return store
+
+    def take(self, rows):
+        """
+        Returns a new store with only the given rows, in the given order.
+
+        Args:
+            rows (np.ndarray): Rows to keep.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        store = DocumentStore()
+        store.fields = self.fields
+        store.columns = {}
+        for field, column in self.columns.items():
+            kind = column[0]
+            if kind == 'str':
+                buffer, offsets = column[1], column[2]
+                starts = offsets[rows]
+                lengths = offsets[rows + 1] - starts
+                new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+                np.cumsum(lengths, out=new_offsets[1:])
+                positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+                store.columns[field] = (kind, buffer[positions], new_offsets)
+            elif kind == 'list':
+                store.columns[field] = (kind, [column[1][row] for row in rows.tolist()])
+            else:
+                store.columns[field] = (kind, column[1][rows])
+        store._length = len(rows)
+        return store
+
+    def arrays(self):
+        """
+        Returns the arrays to save in an index snapshot.
+        """
+        arrays = {}
+        for position, field in enumerate(self.fields):
+            column = self.columns[field]
+            if column[0] == 'str':
+                arrays[f'docs_{position}'] = column[1]
+                arrays[f'docs_offsets_{position}'] = column[2]
+            elif column[0] != 'list':
+                arrays[f'docs_{position}'] = column[1]
+        return arrays
+
+    def spec(self):
+        """
+        Returns the JSON description of the store saved next to its arrays, including the list columns.
+        """
+        return {
+            'length': self._length,
+            'fields': self.fields,
+            'kinds': [self.columns[field][0] for field in self.fields],
+            'lists': {
+                field: [None if value is _MISSING else value for value in column[1]]
+                for field, column in self.columns.items()
+                if column[0] == 'list'
+            },
+        }
+
+    @classmethod
+    def load(cls, spec, load_array):
+        """
+        Restores a store from its spec and snapshot arrays.
+
+        Args:
+            spec (dict): The description returned by spec.
+            load_array (callable): Returns the saved array with the given name.
+        """
+        store = cls()
+        store.fields = spec['fields']
+        store._length = spec['length']
+        for position, (field, kind) in enumerate(zip(spec['fields'], spec['kinds'])):
+            if kind == 'str':
+                store.columns[field] = (kind, load_array(f'docs_{position}'), load_array(f'docs_offsets_{position}'))
+            elif kind == 'list':
+                store.columns[field] = (kind, spec['lists'][field])
+            else:
+                store.columns[field] = (kind, load_array(f'docs_{position}'))
+        return store
+
+
+# Marks fields missing from a document in list columns
+_MISSING = object()
+
+
+def _column(values):
+    """
+    Builds the most compact column that represents the values exactly.
+
+    Args:
+        values (list): The value of one field in every document.
+
+    Returns:
+        tuple: The column kind followed by its data.
+    """
+    if all(type(value) is str for value in values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return 'str', np.frombuffer(b''.join(encoded), dtype=np.uint8).copy(), offsets
+    if values and all(type(value) is int for value in values):
+        try:
+            return 'int', np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    if values and all(type(value) is float for value in values):
+        return 'float', np.array(values, dtype=np.float64)
+    return 'list', values
+
+
+def _concat_columns(first, second):
+    if first[0] == 'str':
+        return 'str', np.concatenate([first[1], second[1]]), np.concatenate([first[2][:-1], second[2] + first[2][-1]])
+    if first[0] == 'list':
+        return 'list', first[1] + second[1]
+    return first[0], np.concatenate([first[1], second[1]])
+
+
+def _deep_size(obj, seen):
+    """
+    Estimates the bytes held by an object and everything it references, skipping objects in seen.
+
+    Args:
+        obj: The object to measure.
+        seen (set): Ids of objects already counted. Updated in place.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
 
-        # Filter out zero-score results
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
+    if isinstance(obj, np.ndarray):
+        # Views and memory maps do not count their buffer in getsizeof
+        return sys.getsizeof(obj) + (0 if obj.flags.owndata else obj.nbytes)
+    if sp.issparse(obj):
+        return sum(_deep_size(getattr(obj, name), seen) for name in ('data', 'indices', 'indptr'))
+    if isinstance(obj, PackedVocabulary):
+        return _deep_size(obj.term_ids, seen) + _deep_size(obj.offsets, seen) + _deep_size(obj.columns, seen)
+    if isinstance(obj, DocumentStore):
+        return sys.getsizeof(obj) + _deep_size(obj.columns, seen)
 
-        return top_docs
\ No newline at end of file
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(key, seen) + _deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(value, seen) for value in obj)
+    return size
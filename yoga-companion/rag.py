@@ -1,39 +1,225 @@
 # import the necessary packages
-from openai import OpenAI
-import ingest
+from cache import AnswerCache, SearchCache, SingleFlight
+from context import ContextBuilder
+from fastpath import FastPath
+from gateway import LLMGateway
+from metrics import timed
+from rerank import Reranker
+from tokens import load_tokenizer
+import asyncio
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 
-# Connect to OpenAI
-client = OpenAI()
-
-# Load the index
-index = ingest.load_index()
-
-def search(query):
-    boost = {
-        'pose_name': 1.77295549488741,
-        'type_of_practice': 1.7646875012919119,
-        'variation': 0.39512555991207565,
-        'position': 2.0631444783206327,
-        'difficulty': 1.4963276491573105,
-        'props_required': 0.2392338995716874,
-        'body_focus': 1.0491245848640036,
-        'benefits': 1.7364406525582377,
-        'synonyms': 2.5022067788712308,
-        'instructions': 0.49163944386874336,
-        'context': 2.1715194651138052
-    }
-
-    results = index.search(
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "0")) or None
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", "0")) or None
+# sparse: TF-IDF/BM25 only, dense: LSA vectors only, hybrid: both fused with reciprocal rank fusion
+SEARCH_MODE = os.getenv("SEARCH_MODE", "sparse")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Threads running search and prompt building for rag_async, off the event loop
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+# LLM calls in flight for one rag_batch, on top of the limits of the gateway
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Answers are reused for repeated questions that retrieved the same documents, 0 disables the cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "0")) or None
+# Minimum cosine similarity of the IDF-weighted question terms for a near-duplicate hit. The default 1 serves
+# exact hits only, a lower value serves a near-duplicate question's answer, which can be wrong for it.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "1"))
+# Also keep answers in the answer_cache table, so they survive restarts and are shared between instances.
+# The app connects the Postgres tier, rag itself does not need the database.
+ANSWER_CACHE_PG = os.getenv("ANSWER_CACHE_PG", "0") == "1"
+# Concurrent rag_async calls with the same normalized question share one pipeline run
+COALESCE = os.getenv("COALESCE", "1") == "1"
+# Answer direct field lookups ("what props does Eagle Pose need") from the catalog, without the LLM
+FAST_PATH = os.getenv("FAST_PATH", "1") == "1"
+# Rerank RERANK_CANDIDATES search results with a local linear model and keep those scoring at least
+# RERANK_MIN_RATIO times the best one, at most 10
+RERANK = os.getenv("RERANK", "1") == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_MIN_RATIO = float(os.getenv("RERANK_MIN_RATIO", "0.1"))
+# Maximum number of context tokens in the prompt, 0 for no budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Search results scoring below this share of the best score are left out of the context, 0 keeps all
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.4"))
+
+if SEARCH_MODE not in ("sparse", "dense", "hybrid"):
+    raise ValueError(f"Unknown search mode: {SEARCH_MODE}. Expected sparse, dense or hybrid")
+
+# The tokenizer encoding is loaded by the first count
+count_tokens = load_tokenizer("gpt-4o-mini")
+
+# Connect to OpenAI through pooled clients with timeouts, retries and concurrency limits. The clients are
+# built on first use.
+gateway = LLMGateway(count_tokens=count_tokens)
+
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+single_flight = SingleFlight()
+
+# The persistent tier of the answer cache, async functions loading and saving an answer by key. The app sets
+# them before the index is loaded when ANSWER_CACHE_PG is on. Only the async API (rag_async, rag_stream and
+# rag_batch) uses it, awaiting it on the event loop rather than in the search executor.
+answer_cache_load = None
+answer_cache_save = None
+
+# Importing rag does no work: the index and everything built over it are created by load(), which the
+# search and answer functions call first. rag.index and the others also load on first access.
+LAZY = (
+    "index", "search_cache", "dense_cache", "answer_cache", "fast_path", "reranker", "context_builder",
+    "ANSWER_CACHE_NAMESPACE",
+)
+_loaded = False
+_load_lock = threading.Lock()
+
+def load():
+    # Loads the index and builds the caches, fast path, reranker and context builder over it, once
+    global index, search_cache, dense_cache, answer_cache, fast_path, reranker, context_builder
+    global ANSWER_CACHE_NAMESPACE, _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        import ingest
+
+        index = ingest.load_index()
+
+        # Repeated questions are served from the cache, it is cleared whenever the index changes
+        search_cache = SearchCache(
+            index,
+            maxsize=SEARCH_CACHE_SIZE,
+            ttl=SEARCH_CACHE_TTL,
+            max_bytes=SEARCH_CACHE_MAX_BYTES,
+        )
+
+        dense_cache = None
+        if SEARCH_MODE in ("dense", "hybrid"):
+            dense_cache = SearchCache(
+                ingest.build_dense_index(index),
+                maxsize=SEARCH_CACHE_SIZE,
+                ttl=SEARCH_CACHE_TTL,
+                max_bytes=SEARCH_CACHE_MAX_BYTES,
+            )
+
+        # Cached answers are tied to the catalog they were generated from
+        ANSWER_CACHE_NAMESPACE = ingest.data_hash(ingest.DATA_PATH)[:16]
+
+        answer_cache = AnswerCache(
+            index,
+            maxsize=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL,
+            threshold=ANSWER_CACHE_THRESHOLD,
+            namespace=ANSWER_CACHE_NAMESPACE,
+            load=answer_cache_load,
+            save=answer_cache_save,
+        )
+
+        fast_path = FastPath(index) if FAST_PATH else None
+
+        reranker = Reranker(index, min_ratio=RERANK_MIN_RATIO) if RERANK else None
+
+        # Every document entry is rendered once here, not on every request
+        context_builder = ContextBuilder(
+            index,
+            entry_fields,
+            count_tokens=count_tokens,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            # Reranked results are already cut on their scores
+            min_score_ratio=0 if RERANK else CONTEXT_MIN_SCORE_RATIO,
+        )
+        _loaded = True
+
+def is_loaded():
+    return _loaded
+
+async def load_async():
+    # load() in a thread, so the event loop keeps serving while the index loads
+    if not _loaded:
+        await asyncio.get_running_loop().run_in_executor(None, load)
+
+def __getattr__(name):
+    if name in LAZY:
+        load()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+search_boost = {
+    'pose_name': 1.77295549488741,
+    'type_of_practice': 1.7646875012919119,
+    'variation': 0.39512555991207565,
+    'position': 2.0631444783206327,
+    'difficulty': 1.4963276491573105,
+    'props_required': 0.2392338995716874,
+    'body_focus': 1.0491245848640036,
+    'benefits': 1.7364406525582377,
+    'synonyms': 2.5022067788712308,
+    'instructions': 0.49163944386874336,
+    'context': 2.1715194651138052
+}
+
+def search(query, output_scores=False, num_results=10):
+    load()
+    boost = search_boost
+
+    if SEARCH_MODE == "dense":
+        return dense_cache.search(
+            query=query,
+            filter_dict={},
+            boost_dict=boost,
+            num_results=num_results,
+            output_scores=output_scores
+        )
+
+    if SEARCH_MODE == "hybrid":
+        from dense import reciprocal_rank_fusion
+
+        rankings = [
+            cache.search(
+                query=query,
+                filter_dict={},
+                boost_dict=boost,
+                num_results=max(HYBRID_CANDIDATES, num_results)
+            )
+            for cache in (search_cache, dense_cache)
+        ]
+        return reciprocal_rank_fusion(rankings, num_results=num_results, output_scores=output_scores)
+
+    results = search_cache.search(
         query=query,
         filter_dict={},
         boost_dict=boost,
-        num_results=10
+        num_results=num_results,
+        output_scores=output_scores
     )
 
     return results
 
+def search_batch(queries, output_scores=False, num_results=10):
+    # Same results as search for every query, the uncached ones are scored together
+    load()
+    boost = search_boost
+
+    if SEARCH_MODE == "dense":
+        return dense_cache.search_batch(queries, {}, boost, num_results, output_scores=output_scores)
+
+    if SEARCH_MODE == "hybrid":
+        from dense import reciprocal_rank_fusion
+
+        rankings = [
+            cache.search_batch(queries, {}, boost, max(HYBRID_CANDIDATES, num_results))
+            for cache in (search_cache, dense_cache)
+        ]
+        return [
+            reciprocal_rank_fusion(list(pair), num_results=num_results, output_scores=output_scores)
+            for pair in zip(*rankings)
+        ]
+
+    return search_cache.search_batch(queries, {}, boost, num_results, output_scores=output_scores)
+
 prompt_template = """
 You are a yoga guru with access to a comprehensive yoga poses database. Answer the QUESTION using only the information provided in the CONTEXT.
 Treat similar words as synonyms and recognize variations of terms as equivalent.
@@ -50,41 +236,113 @@ CONTEXT:
 {context}
 """.strip()
 
-entry_template = """
-Pose: {pose_name}
-Practice: {type_of_practice}
-Variation: {variation}
-Position: {position}
-Difficulty: {difficulty}
-Props: {props_required}
-Focus: {body_focus}
-Benefits: {benefits}
-Instructions: {instructions}
-""".strip()
+# (label, field) of every line of a context entry
+entry_fields = [
+    ("Pose", "pose_name"),
+    ("Practice", "type_of_practice"),
+    ("Variation", "variation"),
+    ("Position", "position"),
+    ("Difficulty", "difficulty"),
+    ("Props", "props_required"),
+    ("Focus", "body_focus"),
+    ("Benefits", "benefits"),
+    ("Instructions", "instructions"),
+]
 
 def build_prompt(query, search_results):
-    context = ""
-
-    for doc in search_results:
-        context = context + entry_template.format(**doc) + "\n\n"
+    # All results in full, as before the token budget
+    load()
+    context = context_builder.render(search_results)
+    return prompt_template.format(question=query, context=context).strip()
+
+def build_budgeted_prompt(query, scored_results):
+    load()
+    context, _ = context_builder.assemble(scored_results)
+    return prompt_template.format(question=query, context=context).strip()
+
+# Stages timed by every answer, saved as <stage>_time columns of the conversation
+STAGES = ("search", "build_prompt", "llm", "evaluate_relevance")
+
+def retrieve(query, stage_times=None):
+    # Returns the prompt, the ids of the retrieved documents, and an answer found without the LLM with its
+    # source: 'fastpath' for a catalog lookup, 'exact' or 'similar' for an answer cache hit. The answer and
+    # its source are None when the LLM has to answer, the prompt is None when it does not.
+    # The search and build_prompt (fast path, answer cache and prompt) seconds are added to stage_times.
+    load()
+    if stage_times is None:
+        stage_times = {}
+
+    with timed(stage_times, "search"):
+        if reranker is None:
+            scored_results = search(query, output_scores=True)
+        else:
+            candidates = search(query, output_scores=True, num_results=RERANK_CANDIDATES)
+            scored_results = reranker.rerank(query, candidates)
+    return prepare(query, scored_results, stage_times)
+
+def retrieve_batch(queries, stage_times):
+    # retrieve for several queries, with one batch search. stage_times holds one dict per query,
+    # the batch search time is shared evenly between them.
+    load()
+    batch_times = {}
+    with timed(batch_times, "search"):
+        if reranker is None:
+            results = search_batch(queries, output_scores=True)
+        else:
+            candidates = search_batch(queries, output_scores=True, num_results=RERANK_CANDIDATES)
+            results = [reranker.rerank(query, c) for query, c in zip(queries, candidates)]
+    for times in stage_times:
+        times["search"] = batch_times["search"] / len(queries)
+    return [prepare(query, r, times) for query, r, times in zip(queries, results, stage_times)]
+
+def prepare(query, scored_results, stage_times):
+    # The part of retrieve after the search
+    doc_ids = [doc["id"] for doc, _ in scored_results]
+
+    with timed(stage_times, "build_prompt"):
+        if fast_path is not None:
+            answer, _ = fast_path.answer(query, scored_results)
+            if answer is not None:
+                return None, doc_ids, answer, "fastpath"
+
+        answer, cache_hit = answer_cache.get(query, doc_ids)
+        if answer is not None:
+            return None, doc_ids, answer, cache_hit
+        return build_budgeted_prompt(query, scored_results), doc_ids, None, None
+
+def usage_stats(usage):
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
 
-    prompt = prompt_template.format(question=query, context=context).strip()
-    return prompt
+def parse_completion(response):
+    answer = response.choices[0].message.content
+    token_stats = usage_stats(response.usage)
+    return answer, token_stats
 
 def llm(prompt, model="gpt-4o-mini"):
-    response = client.chat.completions.create(
-        model=model, messages=[{"role": "user", "content": prompt}]
-    )
+    response = gateway.complete([{"role": "user", "content": prompt}], model=model)
+    return parse_completion(response)
 
-    answer = response.choices[0].message.content
+async def llm_async(prompt, model="gpt-4o-mini"):
+    response = await gateway.complete_async([{"role": "user", "content": prompt}], model=model)
+    return parse_completion(response)
 
-    token_stats = {
-        "prompt_tokens": response.usage.prompt_tokens,
-        "completion_tokens": response.usage.completion_tokens,
-        "total_tokens": response.usage.total_tokens,
-    }
+async def llm_stream(prompt, model="gpt-4o-mini"):
+    # Yields the answer text as it is generated, then the token stats of the whole completion
+    usage = None
+    async for chunk in gateway.stream([{"role": "user", "content": prompt}], model=model):
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
-    return answer, token_stats
+    yield usage_stats(usage)
 
 evaluation_prompt_template = """
 You are an expert evaluator for a RAG system.
@@ -106,16 +364,111 @@ and provide your evaluation in parsable JSON without using code blocks:
 }}
 """.strip()
 
-def evaluate_relevance(question, answer):
-    prompt = evaluation_prompt_template.format(question=question, answer=answer)
-    evaluation, tokens = llm(prompt, model="gpt-4o-mini")
-
+def parse_evaluation(evaluation, tokens):
     try:
         json_eval = json.loads(evaluation)
         return json_eval, tokens
     except json.JSONDecodeError:
         result = {"Relevance": "UNKNOWN", "Explanation": "Failed to parse evaluation"}
         return result, tokens
+
+def evaluate_relevance(question, answer):
+    prompt = evaluation_prompt_template.format(question=question, answer=answer)
+    evaluation, tokens = llm(prompt, model="gpt-4o-mini")
+    return parse_evaluation(evaluation, tokens)
+
+async def evaluate_relevance_async(question, answer):
+    prompt = evaluation_prompt_template.format(question=question, answer=answer)
+    evaluation, tokens = await llm_async(prompt, model="gpt-4o-mini")
+    return parse_evaluation(evaluation, tokens)
+
+batch_evaluation_prompt_template = """
+You are an expert evaluator for a RAG system.
+Your task is to analyze the relevance of each generated answer to its question.
+Based on the relevance of each generated answer, you will classify it
+as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
+
+Here are the items for evaluation:
+
+{items}
+
+Please analyze each item independently and provide your evaluation as a parsable JSON array
+without using code blocks, with exactly one object per item, in item order:
+
+[
+  {{
+    "id": <item number>,
+    "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+    "Explanation": "[Provide a brief explanation for your evaluation]"
+  }}
+]
+""".strip()
+
+batch_item_template = """
+Item {id}
+Question: {question}
+Generated Answer: {answer}
+""".strip()
+
+RELEVANCE_LABELS = ("NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT")
+
+def parse_batch_evaluation(evaluation, n_items):
+    # One relevance dict per item, None for items missing from the array or not matching the schema
+    results = [None] * n_items
+    try:
+        parsed = json.loads(evaluation)
+    except json.JSONDecodeError:
+        return results
+    if not isinstance(parsed, list):
+        return results
+
+    for entry in parsed:
+        if not isinstance(entry, dict):
+            continue
+        item_id = entry.get("id")
+        if type(item_id) is not int or not 1 <= item_id <= n_items or results[item_id - 1] is not None:
+            continue
+        if entry.get("Relevance") not in RELEVANCE_LABELS or not isinstance(entry.get("Explanation"), str):
+            continue
+        results[item_id - 1] = {"Relevance": entry["Relevance"], "Explanation": entry["Explanation"]}
+
+    return results
+
+def split_token_stats(tokens, n_items):
+    # Share the tokens of one call between its items, the shares add up to the exact totals
+    shares = [{} for _ in range(n_items)]
+    for key in ("prompt_tokens", "completion_tokens"):
+        base, extra = divmod(tokens[key], n_items)
+        for i, share in enumerate(shares):
+            share[key] = base + (1 if i < extra else 0)
+    for share in shares:
+        share["total_tokens"] = share["prompt_tokens"] + share["completion_tokens"]
+    return shares
+
+async def evaluate_relevance_batch_async(items):
+    # Judges several (question, answer) pairs with one LLM call. Items the batch answer does not
+    # cover are judged one by one, their token stats include their share of the batch call.
+    if len(items) == 1:
+        return [await evaluate_relevance_async(*items[0])]
+
+    prompt = batch_evaluation_prompt_template.format(
+        items="\n\n".join(
+            batch_item_template.format(id=i, question=question, answer=answer)
+            for i, (question, answer) in enumerate(items, start=1)
+        )
+    )
+    evaluation, tokens = await llm_async(prompt, model="gpt-4o-mini")
+
+    relevances = parse_batch_evaluation(evaluation, len(items))
+    results = list(zip(relevances, split_token_stats(tokens, len(items))))
+
+    fallback = [i for i, relevance in enumerate(relevances) if relevance is None]
+    retried = await asyncio.gather(*(evaluate_relevance_async(*items[i]) for i in fallback))
+    for i, (relevance, item_tokens) in zip(fallback, retried):
+        share = results[i][1]
+        results[i] = (relevance, {key: share[key] + item_tokens[key] for key in share})
+
+    return results
     
 def calculate_openai_cost(model, tokens):
     openai_cost = 0
@@ -129,18 +482,10 @@ def calculate_openai_cost(model, tokens):
 
     return openai_cost
 
-def rag(query, model="gpt-4o-mini"):
-    t0 = time()
-
-    search_results = search(query)
-    prompt = build_prompt(query, search_results)
-    answer, token_stats = llm(prompt, model=model)
-
-    relevance, rel_token_stats = evaluate_relevance(query, answer)
-
-    t1 = time()
-    took = t1 - t0
-
+def build_answer_data(answer, model, took, token_stats, relevance, rel_token_stats,
+                      time_to_first_token=None, generation_time=None, source=None, stage_times=None):
+    # source is the one returned by retrieve: None when the LLM answered.
+    # stage_times maps STAGES to seconds, stages that did not run are saved as None.
     openai_cost_rag = calculate_openai_cost(model, token_stats)
     openai_cost_eval = calculate_openai_cost(model, rel_token_stats)
 
@@ -161,6 +506,204 @@ def rag(query, model="gpt-4o-mini"):
         "eval_completion_tokens": rel_token_stats["completion_tokens"],
         "eval_total_tokens": rel_token_stats["total_tokens"],
         "openai_cost": openai_cost,
+        "time_to_first_token": time_to_first_token,
+        "generation_time": generation_time,
+        "answer_path": "llm" if source is None else "fastpath" if source == "fastpath" else "cache",
+        "cache_hit": source if source in ("exact", "similar") else None,
     }
+    for stage in STAGES:
+        answer_data[f"{stage}_time"] = (stage_times or {}).get(stage)
+
+    return answer_data
 
-    return answer_data
\ No newline at end of file
+def rag(query, model="gpt-4o-mini"):
+    t0 = time()
+    stage_times = {}
+
+    prompt, doc_ids, answer, source = retrieve(query, stage_times)
+    if answer is None:
+        with timed(stage_times, "llm"):
+            answer, token_stats = llm(prompt, model=model)
+        answer_cache.put(query, doc_ids, answer)
+    else:
+        token_stats = usage_stats(None)
+    # Without streaming, the first token reaches the user together with the whole answer
+    generation_time = time() - t0
+
+    with timed(stage_times, "evaluate_relevance"):
+        relevance, rel_token_stats = evaluate_relevance(query, answer)
+
+    took = time() - t0
+    return build_answer_data(
+        answer, model, took, token_stats, relevance, rel_token_stats,
+        time_to_first_token=generation_time, generation_time=generation_time, source=source,
+        stage_times=stage_times,
+    )
+
+async def persistent_answer(query, doc_ids, stage_times):
+    # An answer cache miss may still be found in the persistent tier
+    with timed(stage_times, "build_prompt"):
+        return await answer_cache.get_persistent(query, doc_ids)
+
+async def cache_answer(query, doc_ids, answer):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(search_executor, answer_cache.put, query, doc_ids, answer)
+    await answer_cache.put_persistent(query, doc_ids, answer)
+
+async def rag_async(query, model="gpt-4o-mini", evaluate=True):
+    # With evaluate=False the relevance is left to the background judge and the eval columns stay empty.
+    # A call made while the same question is being answered waits for that answer instead of running the
+    # pipeline again, see coalesced_answer_data.
+    await load_async()
+    if not COALESCE:
+        return await answer_async(query, model, evaluate)
+
+    t0 = time()
+    key = (answer_cache.normalize(query), model, evaluate)
+    answer_data, shared = await single_flight.run(key, lambda: answer_async(query, model, evaluate))
+    if shared:
+        return coalesced_answer_data(answer_data, time() - t0)
+    return dict(answer_data)
+
+def coalesced_answer_data(answer_data, took):
+    # The answer of another call: this call spent no tokens and ran no stage, it only waited
+    coalesced = dict(answer_data)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens",
+                "eval_prompt_tokens", "eval_completion_tokens", "eval_total_tokens"):
+        coalesced[key] = 0
+    for stage in STAGES:
+        coalesced[f"{stage}_time"] = None
+    coalesced.update({
+        "response_time": took,
+        "time_to_first_token": took,
+        "generation_time": took,
+        "openai_cost": 0.0,
+        "answer_path": "coalesced",
+        "cache_hit": None,
+    })
+    return coalesced
+
+async def answer_async(query, model="gpt-4o-mini", evaluate=True):
+    await load_async()
+    t0 = time()
+    stage_times = {}
+
+    # Search and prompt building are CPU-bound, so they run in a thread and the event loop keeps serving requests
+    loop = asyncio.get_running_loop()
+    prompt, doc_ids, answer, source = await loop.run_in_executor(search_executor, retrieve, query, stage_times)
+    if answer is None:
+        answer, source = await persistent_answer(query, doc_ids, stage_times)
+    if answer is None:
+        with timed(stage_times, "llm"):
+            answer, token_stats = await llm_async(prompt, model=model)
+        await cache_answer(query, doc_ids, answer)
+    else:
+        token_stats = usage_stats(None)
+    generation_time = time() - t0
+
+    relevance, rel_token_stats = {}, usage_stats(None)
+    if evaluate:
+        with timed(stage_times, "evaluate_relevance"):
+            relevance, rel_token_stats = await evaluate_relevance_async(query, answer)
+
+    took = time() - t0
+    return build_answer_data(
+        answer, model, took, token_stats, relevance, rel_token_stats,
+        time_to_first_token=generation_time, generation_time=generation_time, source=source,
+        stage_times=stage_times,
+    )
+
+async def rag_stream(query, model="gpt-4o-mini", evaluate=True):
+    # Yields {"token": text} while the answer is generated, then {"answer_data": ...} once it is evaluated.
+    # time_to_first_token and generation_time are measured from the start of the request, like response_time.
+    await load_async()
+    t0 = time()
+    stage_times = {}
+
+    loop = asyncio.get_running_loop()
+    prompt, doc_ids, answer, source = await loop.run_in_executor(search_executor, retrieve, query, stage_times)
+    if answer is None:
+        answer, source = await persistent_answer(query, doc_ids, stage_times)
+
+    time_to_first_token = None
+    if answer is None:
+        chunks = []
+        # Until the last token, including the time the client takes to read the earlier ones
+        with timed(stage_times, "llm"):
+            async for item in llm_stream(prompt, model=model):
+                if isinstance(item, dict):
+                    token_stats = item
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time() - t0
+                chunks.append(item)
+                yield {"token": item}
+
+        answer = "".join(chunks)
+        await cache_answer(query, doc_ids, answer)
+    else:
+        # An answer found without the LLM (fast path or cache) is sent whole, as a single token event
+        token_stats = usage_stats(None)
+        time_to_first_token = time() - t0
+        yield {"token": answer}
+
+    generation_time = time() - t0
+    if time_to_first_token is None:
+        time_to_first_token = generation_time
+
+    relevance, rel_token_stats = {}, usage_stats(None)
+    if evaluate:
+        with timed(stage_times, "evaluate_relevance"):
+            relevance, rel_token_stats = await evaluate_relevance_async(query, answer)
+
+    took = time() - t0
+    answer_data = build_answer_data(
+        answer, model, took, token_stats, relevance, rel_token_stats,
+        time_to_first_token=time_to_first_token, generation_time=generation_time, source=source,
+        stage_times=stage_times,
+    )
+    yield {"answer_data": answer_data}
+
+async def rag_batch(queries, model="gpt-4o-mini", concurrency=BATCH_CONCURRENCY):
+    # Answers several questions. Retrieval runs as one batch search, then at most concurrency LLM calls run
+    # at once. Yields (position, answer_data, error) in completion order, error being None or the exception
+    # that failed that question. Relevance is left to the background judge.
+    await load_async()
+    t0 = time()
+    loop = asyncio.get_running_loop()
+    stage_times = [{} for _ in queries]
+    retrieved = await loop.run_in_executor(search_executor, retrieve_batch, queries, stage_times)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer_one(position):
+        query = queries[position]
+        prompt, doc_ids, answer, source = retrieved[position]
+        try:
+            if answer is None:
+                answer, source = await persistent_answer(query, doc_ids, stage_times[position])
+            if answer is None:
+                async with semaphore:
+                    with timed(stage_times[position], "llm"):
+                        answer, token_stats = await llm_async(prompt, model=model)
+                await cache_answer(query, doc_ids, answer)
+            else:
+                token_stats = usage_stats(None)
+        except Exception as e:
+            return position, None, e
+
+        took = time() - t0
+        answer_data = build_answer_data(
+            answer, model, took, token_stats, {}, usage_stats(None),
+            time_to_first_token=took, generation_time=took, source=source,
+            stage_times=stage_times[position],
+        )
+        return position, answer_data, None
+
+    tasks = [asyncio.ensure_future(answer_one(position)) for position in range(len(queries))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The caller stopped early, e.g. a client disconnected from the stream
+        for task in tasks:
+            task.cancel()
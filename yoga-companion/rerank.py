@@ -0,0 +1,230 @@
+import threading
+
+import numpy as np
+
+# Fields whose overlap with the question is a feature, in feature order
+FEATURE_FIELDS = [
+    "pose_name",
+    "type_of_practice",
+    "variation",
+    "position",
+    "difficulty",
+    "props_required",
+    "body_focus",
+    "benefits",
+    "synonyms",
+    "instructions",
+    "context",
+]
+
+FEATURES = (
+    ["score", "reciprocal_rank", "pose_exact", "query_coverage"]
+    + [f"match_{field}" for field in FEATURE_FIELDS]
+)
+
+# Logistic regression weights trained by benchmarks/rerank.py on the training half of ground-truth-retrieval.csv,
+# the other half is held out to measure them
+WEIGHTS = {
+    "bias": -10.6203,
+    "score": 2.7775,
+    "reciprocal_rank": 0.9960,
+    "pose_exact": 4.0054,
+    "query_coverage": 1.4853,
+    "match_pose_name": 1.1741,
+    "match_type_of_practice": 1.0814,
+    "match_variation": 1.9662,
+    "match_position": 0.1166,
+    "match_difficulty": 0.6919,
+    "match_props_required": 0.4986,
+    "match_body_focus": 0.4071,
+    "match_benefits": 1.3557,
+    "match_synonyms": -0.4780,
+    "match_instructions": -0.3240,
+    "match_context": 0.2649,
+}
+
+
+def _find(tokens, phrase):
+    # Whether phrase (a token list) occurs in tokens
+    n = len(phrase)
+    return n > 0 and any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+class Reranker:
+    """
+    Reranks first-stage search results with a linear model over cheap local features, and keeps only as
+    many results as the scores justify.
+
+    Features of a (question, document) pair are the first-stage score relative to the best one, the
+    reciprocal rank, whether the pose name appears verbatim in the question, the share of question terms
+    found in the document, and for every field the share of its terms found in the question. The model is
+    a logistic regression, so reranked scores are probabilities that the document is the one asked about.
+
+    The reranked list is cut where the probability falls below min_ratio times the best one. Confident
+    questions therefore keep one to a few documents, and questions without a clear winner keep up to
+    max_results. The variations of a pose often score alike, so the cut is measured from the best result
+    rather than between neighbours.
+
+    Attributes:
+        index: The search index. Its analyzer tokenizes questions and fields, its version invalidates the
+            tokenized documents.
+        weights (dict): Feature name to weight, plus 'bias'.
+        max_results (int): Maximum number of results kept.
+        min_results (int): Minimum number of results kept.
+        min_ratio (float): Results below this share of the best probability are dropped. 0 never cuts.
+        id_field (str): Field identifying a document.
+    """
+
+    def __init__(self, index, weights=WEIGHTS, max_results=10, min_results=1, min_ratio=0.1, id_field="id"):
+        """
+        Initializes the reranker.
+
+        Args:
+            index: The search index. It must have analyzer and version attributes.
+            weights (dict): Feature name to weight, plus 'bias'. Defaults to WEIGHTS.
+            max_results (int): Maximum number of results kept. Defaults to 10.
+            min_results (int): Minimum number of results kept. Defaults to 1.
+            min_ratio (float): Share of the best probability below which results are dropped. Defaults to 0.1.
+            id_field (str): Field identifying a document. Defaults to 'id'.
+        """
+        self.index = index
+        self.weights = weights
+        self.max_results = max_results
+        self.min_results = min_results
+        self.min_ratio = min_ratio
+        self.id_field = id_field
+
+        self._coefficients = np.array([weights.get(name, 0.0) for name in FEATURES])
+        self._bias = weights.get("bias", 0.0)
+        self._tokens = {}
+        self._version = index.version
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        with self._lock:
+            if self.index.version != self._version:
+                self._version = self.index.version
+                self._tokens = {}
+
+    def _doc_tokens(self, doc):
+        # Per field token sets, the pose name token list, and all tokens of the document
+        key = doc[self.id_field]
+        tokens = self._tokens.get(key)
+        if tokens is None:
+            fields = [set(self.index.analyzer(str(doc.get(field, "")))) for field in FEATURE_FIELDS]
+            pose = self.index.analyzer(str(doc.get("pose_name", "")))
+            tokens = (fields, pose, set().union(*fields))
+            self._tokens[key] = tokens
+        return tokens
+
+    def features(self, query, results):
+        """
+        Computes the features of search results.
+
+        Args:
+            query (str): The question.
+            results (list of tuple): (document, score) pairs in first-stage order.
+
+        Returns:
+            np.ndarray: One row of FEATURES per result.
+        """
+        self._check_version()
+        query_tokens = self.index.analyzer(query)
+        query_terms = set(query_tokens)
+        best = max((score for _, score in results), default=0.0) or 1.0
+
+        rows = np.zeros((len(results), len(FEATURES)))
+        for rank, (doc, score) in enumerate(results):
+            fields, pose, doc_terms = self._doc_tokens(doc)
+            row = rows[rank]
+            row[0] = score / best
+            row[1] = 1.0 / (rank + 1)
+            row[2] = float(_find(query_tokens, pose))
+            row[3] = len(query_terms & doc_terms) / len(query_terms) if query_terms else 0.0
+            for i, terms in enumerate(fields):
+                row[4 + i] = len(terms & query_terms) / len(terms) if terms else 0.0
+        return rows
+
+    def scores(self, query, results):
+        """
+        Returns the probability of every result being the document asked about.
+
+        Args:
+            query (str): The question.
+            results (list of tuple): (document, score) pairs in first-stage order.
+
+        Returns:
+            np.ndarray: One probability per result, in the given order.
+        """
+        if not results:
+            return np.zeros(0)
+        logits = self.features(query, results) @ self._coefficients + self._bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def cutoff(self, probabilities):
+        """
+        Returns how many of the descending probabilities to keep.
+
+        Args:
+            probabilities (np.ndarray): Probabilities sorted in descending order.
+
+        Returns:
+            int: The number of results to keep.
+        """
+        n = min(len(probabilities), self.max_results)
+        if n == 0:
+            return 0
+        kept = int(np.count_nonzero(probabilities[:n] >= self.min_ratio * probabilities[0]))
+        return max(kept, min(self.min_results, n))
+
+    def rerank(self, query, results):
+        """
+        Reranks search results and keeps as many as their probabilities justify.
+
+        Args:
+            query (str): The question.
+            results (list of tuple): (document, score) pairs in first-stage order, usually more candidates
+                than max_results.
+
+        Returns:
+            list of tuple: The kept (document, probability) pairs, most probable first.
+        """
+        probabilities = self.scores(query, results)
+        order = np.argsort(-probabilities, kind="stable")
+        n = self.cutoff(probabilities[order])
+        return [(results[i][0], float(probabilities[i])) for i in order[:n]]
+
+
+def train(reranker, examples, C=1.0):
+    """
+    Fits the weights of a reranker with logistic regression.
+
+    Args:
+        reranker (Reranker): The reranker whose features are used. Its weights are replaced.
+        examples (list of tuple): (question, results, relevant document id) triples, results being the
+            (document, score) candidates of the question.
+        C (float): Inverse regularization strength. Defaults to 1.0.
+
+    Returns:
+        dict: The fitted weights, also set on the reranker.
+    """
+    # Only needed to train, serving does not import it
+    from sklearn.linear_model import LogisticRegression
+
+    features = []
+    labels = []
+    for question, results, relevant_id in examples:
+        if not results:
+            continue
+        features.append(reranker.features(question, results))
+        labels.extend(doc[reranker.id_field] == relevant_id for doc, _ in results)
+
+    model = LogisticRegression(C=C, max_iter=1000)
+    model.fit(np.vstack(features), np.array(labels))
+
+    weights = {"bias": float(model.intercept_[0])}
+    weights.update({name: float(w) for name, w in zip(FEATURES, model.coef_[0])})
+    reranker.weights = weights
+    reranker._coefficients = np.array([weights[name] for name in FEATURES])
+    reranker._bias = weights["bias"]
+    return weights
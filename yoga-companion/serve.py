@@ -0,0 +1,120 @@
+# Runs the API with several worker processes sharing one read-only index.
+#
+# By default the app is loaded once, here: the index is loaded (memory-mapped from its snapshot) and
+# everything derived from it is built, then the workers are forked. They share all of it copy-on-write
+# instead of importing and building their own copy, so they start at once. gc.freeze keeps the garbage
+# collector from writing to the shared objects, which would copy their pages.
+#
+# With --spawn, or for the sharded engine whose shard processes cannot be forked, uvicorn starts fresh
+# workers instead. The snapshot is still built here first, so every worker memory-maps the same files
+# rather than refitting the index.
+#
+# Each worker reports on /readyz once it serves requests with the index attached.
+#
+#   python serve.py --workers 4 --port 5000
+import argparse
+import gc
+import os
+import signal
+import socket
+from time import perf_counter
+
+import uvicorn
+
+import ingest
+
+# Everything a process holds is per worker after the fork: its Postgres pool (up to DB_POOL_SIZE
+# connections, so WEB_CONCURRENCY * DB_POOL_SIZE in total), the LLM gateway and admission limits, the
+# caches, the judge queue, and the counters served on /metrics.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+def prepare_index():
+    if ingest.INDEX_SNAPSHOT_DIR == "" or not hasattr(ingest.ENGINES[ingest.INDEX_ENGINE], "load"):
+        print(f"No snapshot for the {ingest.INDEX_ENGINE} index, every worker fits its own copy")
+        return
+
+    t0 = perf_counter()
+    # Builds and publishes the snapshot when the data changed, otherwise only checks that it loads
+    index = ingest.load_index()
+    status = ingest.index_status(index)
+    path = ingest.snapshot_path(ingest.DATA_PATH, ingest.INDEX_ENGINE, ingest.INDEX_SNAPSHOT_DIR)
+    print(f"Index snapshot {path} ready in {perf_counter() - t0:.2f} s: {status['documents']} documents")
+
+
+def serve_spawned(args):
+    prepare_index()
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+
+
+def serve_forked(args):
+    t0 = perf_counter()
+    import app
+    import rag
+
+    # Importing the app does no work, the index is loaded here so that the workers share it. So is the
+    # OpenAI SDK, each worker builds its own clients after the fork.
+    rag.load()
+    import openai  # noqa: F401
+
+    print(f"App loaded in {perf_counter() - t0:.2f} s, forking {args.workers} workers")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    gc.freeze()
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = uvicorn.Server(uvicorn.Config(app.app, host=args.host, port=args.port))
+            try:
+                server.run(sockets=[sock])
+            finally:
+                os._exit(0)
+        return pid
+
+    workers = {fork_worker() for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a new one")
+            workers.add(fork_worker())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--spawn", action="store_true", help="start every worker from scratch instead of forking")
+    args = parser.parse_args()
+
+    if args.spawn or ingest.INDEX_ENGINE == "sharded" or not hasattr(os, "fork"):
+        serve_spawned(args)
+    else:
+        serve_forked(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+import minsearch
+
+
+class ShardedIndex:
+    """
+    A TF-IDF search index split into shards that live in separate worker processes.
+
+    Documents are partitioned into contiguous ranges, one per shard. Fitting takes two rounds: every
+    shard tokenizes its documents and reports its per-field document frequencies, then the global
+    vocabulary and IDF are sent back and every shard builds its matrices against them. Scores are
+    therefore the same as in a single minsearch.Index over the whole catalog. Searches fan out to all
+    shards in parallel and the per-shard top results are merged with a heap.
+
+    Attributes:
+        text_fields (list): List of text field names to index.
+        keyword_fields (list): List of keyword field names to index.
+        n_shards (int): Number of shards and worker processes.
+        analyzer (callable): Analyzer shared by all text fields.
+        field_terms (list): For every text field, its terms in column order.
+        idf (np.ndarray): Global IDF weight of every column.
+        shard_offsets (list): Global row of the first document of every shard.
+        docs (list): List of documents indexed.
+        version (int): Incremented whenever the index is refit, so caches can invalidate.
+    """
+
+    # Parameters that prune the vocabulary would need the global counts, which only exist after the first round
+    UNSUPPORTED_PARAMS = ('min_df', 'max_df', 'max_features', 'vocabulary')
+
+    def __init__(self, text_fields, keyword_fields, vectorizer_params={}, n_shards=None):
+        """
+        Initializes the ShardedIndex with specified text and keyword fields.
+
+        Args:
+            text_fields (list): List of text field names to index.
+            keyword_fields (list): List of keyword field names to index.
+            vectorizer_params (dict): Optional parameters to pass to TfidfVectorizer.
+            n_shards (int): Number of shards. Defaults to the number of CPUs.
+        """
+        unsupported = [param for param in self.UNSUPPORTED_PARAMS if param in vectorizer_params]
+        if unsupported:
+            raise ValueError(f"ShardedIndex does not support vectorizer parameters {unsupported}")
+
+        self.text_fields = text_fields
+        self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
+        self.n_shards = n_shards or os.cpu_count() or 1
+
+        self.analyzer = minsearch.Index(text_fields, keyword_fields, vectorizer_params).analyzer
+        self.field_terms = []
+        self.idf = np.zeros(0)
+        self.shard_offsets = []
+        self.docs = []
+        self.version = 0
+
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _start_workers(self, n_workers):
+        self.close()
+        for _ in range(n_workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker,
+                args=(child_conn, self.text_fields, self.keyword_fields, self.vectorizer_params),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append((process, parent_conn))
+
+    def _call(self, messages):
+        """
+        Sends one message to every shard and waits for all replies.
+
+        Args:
+            messages (list): One message per shard.
+
+        Returns:
+            list: The reply of every shard, in shard order.
+        """
+        with self._lock:
+            for (_, conn), message in zip(self._workers, messages):
+                conn.send(message)
+            replies = [conn.recv() for _, conn in self._workers]
+
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    def fit(self, docs):
+        """
+        Fits the shards with the provided documents.
+
+        Args:
+            docs (list of dict): List of documents to index. Each document is a dictionary.
+        """
+        self.docs = docs
+        n_shards = max(1, min(self.n_shards, len(docs)))
+        bounds = np.linspace(0, len(docs), n_shards + 1).astype(int).tolist()
+        self.shard_offsets = bounds[:-1]
+        self._start_workers(n_shards)
+
+        # Round one: every shard tokenizes its documents and counts document frequencies per field
+        field_counts = self._call([('count', docs[start:end]) for start, end in zip(bounds[:-1], bounds[1:])])
+
+        field_terms = []
+        df = []
+        for position in range(len(self.text_fields)):
+            total = Counter()
+            for counts in field_counts:
+                total.update(counts[position])
+            # CountVectorizer orders columns alphabetically, so rows match an unsharded index
+            terms = sorted(total)
+            field_terms.append(terms)
+            df.extend(total[term] for term in terms)
+
+        vectorizer = minsearch.Index(self.text_fields, self.keyword_fields, self.vectorizer_params).vectorizers[
+            self.text_fields[0]
+        ]
+        self.field_terms = field_terms
+        self.idf = minsearch.compute_idf(np.array(df), len(docs), vectorizer.use_idf, vectorizer.smooth_idf)
+
+        # Round two: every shard builds its matrices against the global vocabulary and IDF
+        self._call([('build', field_terms, self.idf)] * n_shards)
+
+        self.version += 1
+        return self
+
+    def top_k(self, queries, filter_dict={}, boost_dict={}, num_results=10):
+        """
+        Scores several queries on every shard and merges the best rows of each shard.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+
+        Returns:
+            list of tuple: For every query, an array of global rows and an array of their scores.
+        """
+        if len(queries) == 0:
+            return []
+
+        message = ('search', list(queries), filter_dict, boost_dict, num_results)
+        shard_results = self._call([message] * len(self._workers))
+
+        results = []
+        for position in range(len(queries)):
+            # Every shard list is sorted by (-score, row), and shard rows are contiguous, so the merge
+            # breaks ties by global row exactly like the unsharded index
+            shard_lists = [
+                zip((-scores).tolist(), (rows + offset).tolist())
+                for (rows, scores), offset in (
+                    (shard[position], offset) for shard, offset in zip(shard_results, self.shard_offsets)
+                )
+            ]
+            merged = list(heapq.merge(*shard_lists))[:num_results]
+            rows = np.array([row for _, row in merged], dtype=np.int64)
+            scores = np.array([-score for score, _ in merged])
+            results.append((rows, scores))
+
+        return results
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with several queries at once, sharing the filters and boost parameters.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of list of dict: For every query, the list of matching documents ranked by relevance.
+        """
+        if output_scores:
+            return [
+                [(self.docs[i], score) for i, score in zip(rows.tolist(), scores.tolist())]
+                for rows, scores in self.top_k(queries, filter_dict, boost_dict, num_results)
+            ]
+        return [
+            [self.docs[i] for i in rows.tolist()]
+            for rows, _ in self.top_k(queries, filter_dict, boost_dict, num_results)
+        ]
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, output_scores=False):
+        """
+        Searches the index with the given query, filters, and boost parameters.
+
+        Args:
+            query (str): The search query string.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return. Defaults to 10.
+            output_scores (bool): Return (document, score) pairs instead of documents. Defaults to False.
+
+        Returns:
+            list of dict: List of documents matching the search criteria, ranked by relevance.
+        """
+        return self.search_batch([query], filter_dict, boost_dict, num_results, output_scores)[0]
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            for process, conn in self._workers:
+                try:
+                    conn.send(('stop',))
+                except (BrokenPipeError, OSError):
+                    pass
+                conn.close()
+            for process, _ in self._workers:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _shard_worker(conn, text_fields, keyword_fields, vectorizer_params):
+    # Runs in the worker process, holds one shard and answers messages until told to stop
+    index = minsearch.Index(text_fields, keyword_fields, vectorizer_params, idf_refresh_ratio=float('inf'))
+    docs = []
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+
+        command = message[0]
+        if command == 'stop':
+            return
+
+        try:
+            if command == 'count':
+                docs = message[1]
+                reply = [
+                    Counter(term for doc in docs for term in set(index.analyzer(doc.get(field, ''))))
+                    for field in text_fields
+                ]
+            elif command == 'build':
+                index.fit_vocabulary(docs, message[1], message[2])
+                reply = None
+            elif command == 'search':
+                reply = index.top_k(*message[1:])
+            else:
+                reply = ValueError(f"Unknown shard command: {command}")
+        except Exception as e:
+            reply = e
+
+        conn.send(reply)
@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 import time
@@ -111,15 +112,38 @@ if submitted and user_input:
     st.session_state.chat_history.append({"user": user_input})
     st.session_state.conversation_had = True
 
-    # Send the question to the Flask API
-    response = requests.post(
-        "http://localhost:5000/question", 
-        json={"question": user_input}
-    )
-    
+    # Send the question to the API and show the answer while it is generated
+    answer_placeholder = st.empty()
+    answer_data = None
+    partial_answer = ""
+
+    try:
+        with requests.post(
+            "http://localhost:5000/question/stream",
+            json={"question": user_input},
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        partial_answer += data["token"]
+                        answer_placeholder.markdown(
+                            f"<div class='bot-label'>Yoga Bot:</div><div class='bot-message'>{partial_answer}</div>",
+                            unsafe_allow_html=True,
+                        )
+                    elif event == "done":
+                        answer_data = data
+    except requests.RequestException:
+        answer_data = None
+    answer_placeholder.empty()
+
     # Check if the request was successful
-    if response.status_code == 200:
-        answer_data = response.json()
+    if answer_data is not None:
         st.session_state.chat_history.append({"bot": answer_data["answer"]})
         st.session_state.conversation_id = answer_data["conversation_id"]
         st.session_state.feedback_given = False
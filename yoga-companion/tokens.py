@@ -0,0 +1,59 @@
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Rough stand-in for a BPE tokenizer: one token per punctuation mark and per 6 characters of a word
+_TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a text without a tokenizer.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def load_tokenizer(model="gpt-4o-mini"):
+    """
+    Returns a function counting the tokens of a text for the given model.
+
+    Uses tiktoken when it is installed and its encoding is available, otherwise estimate_tokens. The
+    encoding, which tiktoken may have to download, is loaded by the first call.
+
+    Args:
+        model (str): The OpenAI model name. Defaults to 'gpt-4o-mini'.
+
+    Returns:
+        callable: A function taking a text and returning its number of tokens.
+    """
+    if tiktoken is None:
+        return estimate_tokens
+
+    encoding = None
+    lock = threading.Lock()
+
+    def count_tokens(text):
+        nonlocal encoding
+        if encoding is None:
+            with lock:
+                if encoding is None:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model).encode
+                    except Exception as e:
+                        print(f"tiktoken encoding for {model} unavailable, estimating tokens instead: {e}")
+                        encoding = estimate_tokens
+        if encoding is estimate_tokens:
+            return estimate_tokens(text)
+        return len(encoding(text))
+
+    return count_tokens